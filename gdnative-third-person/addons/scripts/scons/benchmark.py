@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+
+import os
+import re
+import json
+import shutil
+import subprocess
+
+from SCons.Action import Action
+
+"""
+Runs Google Benchmark executables and guards against performance regressions
+
+The benchmarks are run several times (repetitions) and the median of each benchmark
+is compared with the median stored in a baseline file. A benchmark only counts as
+regressed if it became slower by more than the threshold, the slowdown is larger than
+the measurement noise (the standard deviation across the repetitions) and a second,
+separate run of the suspicious benchmarks confirms the slowdown.
+
+If no baseline exists yet, the results of the first run become the baseline. To accept
+a new performance level, delete the baseline file or overwrite it with the results.
+"""
+
+# ----------------------------------------------------------------------------------------------- #
+
+# How many standard deviations a slowdown needs to exceed to not be considered noise
+_noise_tolerance = 2.0
+
+# Factors that convert the time units Google Benchmark reports into seconds
+_time_unit_factors = { 'ns': 1e-9, 'us': 1e-6, 'ms': 1e-3, 's': 1.0 }
+
+# ----------------------------------------------------------------------------------------------- #
+
+def run(environment, benchmark_executable_path, benchmark_results_path, baseline_path):
+    """Runs a benchmark executable and fails the build if a benchmark regressed
+
+    @param  environment                Environment in which the benchmarks will be run
+    @param  benchmark_executable_path  Path of the Google Benchmark executable
+    @param  benchmark_results_path     Path of the JSON file the results will be written to
+    @param  baseline_path              Path of the JSON file holding the baseline results
+    @returns The SCons build step that runs the benchmarks
+    @remarks
+        The environment's BENCHMARK_REPETITIONS and BENCHMARK_REGRESSION_THRESHOLD
+        control how often each benchmark is repeated and by which fraction it can
+        become slower before the build fails."""
+
+    run_benchmarks = environment.Command(
+        source = benchmark_executable_path,
+        action = Action(_run_and_compare, 'Running benchmarks in $SOURCE'),
+        target = benchmark_results_path,
+        BENCHMARK_BASELINE_PATH = environment.File(baseline_path).abspath,
+        PROFILE_CATEGORY = 'run_benchmarks'
+    )
+
+    # Timings from another machine (via the build cache) say nothing about this one
+    environment.NoCache(run_benchmarks)
+
+    return run_benchmarks
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _run_and_compare(target, source, env):
+    """Runs the benchmarks and compares their results with the baseline
+
+    @param  target  JSON file to which the benchmark results will be written
+    @param  source  Benchmark executable that will be run
+    @param  env     Environment containing the baseline path and regression settings
+    @returns 0 if no benchmark regressed, 1 otherwise"""
+
+    benchmark_executable_path = os.path.abspath(str(source[0]))
+    benchmark_results_path = os.path.abspath(str(target[0]))
+    baseline_path = env['BENCHMARK_BASELINE_PATH']
+    repetitions = int(env['BENCHMARK_REPETITIONS'])
+    threshold = float(env['BENCHMARK_REGRESSION_THRESHOLD'])
+
+    process_environment = {}
+    for name, value in env['ENV'].items():
+        process_environment[name] = str(value)
+
+    results = _run_benchmarks(
+        benchmark_executable_path, benchmark_results_path, repetitions, process_environment
+    )
+    if results is None:
+        print('Benchmarks in ' + benchmark_executable_path + ' failed to run')
+        return 1
+
+    baseline = _read_medians(baseline_path)
+    if baseline is None:
+        baseline_directory = os.path.dirname(baseline_path)
+        if not os.path.isdir(baseline_directory):
+            os.makedirs(baseline_directory)
+
+        shutil.copyfile(benchmark_results_path, baseline_path)
+        print('No benchmark baseline found, results stored as \033[94m' + baseline_path + '\033[0m')
+        return 0
+
+    suspects = _find_regressions(baseline, results, threshold)
+    if len(suspects) == 0:
+        return 0
+
+    # Repeat the suspicious benchmarks once more, a regression has to show up twice
+    # so that a single run disturbed by other processes doesn't fail the build
+    confirmation_path = benchmark_results_path + '.confirmation'
+    confirmation = _run_benchmarks(
+        benchmark_executable_path, confirmation_path, repetitions, process_environment,
+        suspects.keys()
+    )
+    if confirmation is not None:
+        confirmed = _find_regressions(baseline, confirmation, threshold)
+        os.remove(confirmation_path)
+    else:
+        confirmed = suspects
+
+    regressions = {}
+    for benchmark_name, slowdown in suspects.items():
+        if benchmark_name in confirmed:
+            regressions[benchmark_name] = min(slowdown, confirmed[benchmark_name])
+
+    if len(regressions) == 0:
+        return 0
+
+    print('Benchmarks slower than the baseline by more than ' + str(threshold * 100.0) + '%:')
+    for benchmark_name, slowdown in sorted(regressions.items()):
+        print('  \033[91m+' + '%.1f' % (slowdown * 100.0) + '%\033[0m  ' + benchmark_name)
+
+    return 1
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _run_benchmarks(
+    benchmark_executable_path, results_path, repetitions, process_environment,
+    benchmark_names = None
+):
+    """Runs the benchmark executable and reads the medians of its results
+
+    @param  benchmark_executable_path  Path of the benchmark executable
+    @param  results_path               Path of the JSON file the results will be written to
+    @param  repetitions                Number of times each benchmark will be repeated
+    @param  process_environment        Environment variables to run the executable with
+    @param  benchmark_names            Names of the benchmarks to run (None = all)
+    @returns The medians of all benchmarks as returned by _read_medians() or None
+             if the benchmarks could not be run"""
+
+    arguments = [
+        benchmark_executable_path,
+        '--benchmark_out=' + results_path,
+        '--benchmark_out_format=json',
+        '--benchmark_repetitions=' + str(repetitions),
+        '--benchmark_report_aggregates_only=true'
+    ]
+    if benchmark_names is not None:
+        arguments.append(
+            '--benchmark_filter=^(' +
+            '|'.join(re.escape(name) for name in benchmark_names) +
+            ')$'
+        )
+
+    try:
+        exit_status = subprocess.call(arguments, env = process_environment)
+    except OSError:
+        return None
+
+    if exit_status != 0:
+        return None
+
+    return _read_medians(results_path)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _read_medians(results_path):
+    """Reads the median time and its standard deviation for each benchmark
+
+    @param  results_path  Path of the JSON file written by Google Benchmark
+    @returns A dictionary of (median, standard deviation) in seconds, keyed by
+             benchmark name, or None if the file could not be read"""
+
+    try:
+        with open(results_path, 'r') as results_file:
+            results = json.load(results_file)
+    except (OSError, ValueError):
+        return None
+
+    medians = {}
+    deviations = {}
+    for benchmark in results.get('benchmarks', []):
+        benchmark_name = benchmark.get('run_name', benchmark.get('name'))
+        factor = _time_unit_factors.get(benchmark.get('time_unit', 'ns'), 1e-9)
+
+        # CPU time is less affected by other processes than wall clock time
+        aggregate_name = benchmark.get('aggregate_name')
+        if aggregate_name == 'median':
+            medians[benchmark_name] = benchmark['cpu_time'] * factor
+        elif aggregate_name == 'stddev':
+            deviations[benchmark_name] = benchmark['cpu_time'] * factor
+        elif (aggregate_name is None) and (benchmark_name not in medians):
+            medians[benchmark_name] = benchmark['cpu_time'] * factor # Single repetition
+
+    timings = {}
+    for benchmark_name, median in medians.items():
+        timings[benchmark_name] = (median, deviations.get(benchmark_name, 0.0))
+
+    return timings
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _find_regressions(baseline, results, threshold):
+    """Looks for benchmarks that became slower than in the baseline
+
+    @param  baseline   Medians and standard deviations of the baseline run
+    @param  results    Medians and standard deviations of the current run
+    @param  threshold  Fraction by which a benchmark may become slower
+    @returns A dictionary of the fraction by which each regressed benchmark became slower,
+             keyed by benchmark name
+    @remarks
+        New benchmarks that are not in the baseline are ignored."""
+
+    regressions = {}
+
+    for benchmark_name, (median, deviation) in results.items():
+        if benchmark_name not in baseline:
+            continue
+
+        baseline_median, baseline_deviation = baseline[benchmark_name]
+        if baseline_median <= 0.0:
+            continue
+
+        slowdown = (median - baseline_median) / baseline_median
+        if slowdown <= threshold:
+            continue
+
+        # A difference within the noise of the measurements isn't a regression
+        noise = _noise_tolerance * max(deviation, baseline_deviation)
+        if (median - baseline_median) <= noise:
+            continue
+
+        regressions[benchmark_name] = slowdown
+
+    return regressions
@@ -4,10 +4,14 @@ import os
 import shutil
 import platform
 import re
+import importlib
 
 if platform.system() == 'Windows':
     import winreg
 
+# Nuclex SCons libraries
+shared = importlib.import_module('shared')
+
 # ----------------------------------------------------------------------------------------------- #
 
 # Paths in which the Blender executables can be found on Windows systems
@@ -23,6 +27,9 @@ _blender_windows_path = {
 # Default version of Blender we will use
 _default_blender_version = '2.7'
 
+# Blender executables located so far, keyed by requested version and search path
+_blender_executables = {}
+
 # ----------------------------------------------------------------------------------------------- #
 
 def setup(environment):
@@ -49,19 +56,7 @@ def enumerate_blendfiles(root_directory, variant_directory = None):
         '.blend',
     ]
 
-    assets = []
-
-    # Form a list of all files in the input directories recursively.
-    for root, directory_names, file_names in os.walk(project_directory):
-        for file_name in file_names:
-            file_title, file_extension = os.path.splitext(file_name)
-            if file_extension and any(file_extension in s for s in blendfile_extensions):
-                if variant_directory is None:
-                    headers.append(os.path.join(root, file_name))
-                else:
-                    headers.append(os.path.join(variant_directory, os.path.join(root, file_name)))
-
-    return assets
+    return shared.enumerate_files(root_directory, blendfile_extensions, variant_directory)
 
 # ----------------------------------------------------------------------------------------------- #
 
@@ -69,7 +64,27 @@ def _find_blender_executable(environment, blender_version):
     """Locates a suitable Blender executable on the current system.
 
     @param  blender_version  Version number of Blender that is requested (i.e. '2.7'(
-    @returns The absolute path of a Blendr executable."""
+    @returns The absolute path of a Blendr executable.
+    @remarks
+        The result is remembered, so build scripts declaring many exports (or builds
+        reading many build scripts via nuclex.build_all()) only search once."""
+
+    cache_key = (blender_version, str(environment['ENV'].get('PATH')))
+    if cache_key not in _blender_executables:
+        _blender_executables[cache_key] = _search_blender_executable(
+            environment, blender_version
+        )
+
+    return _blender_executables[cache_key]
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _search_blender_executable(environment, blender_version):
+    """Searches the search path and typical install locations for a Blender executable
+
+    @param  environment      Environment whose search path will be used
+    @param  blender_version  Version number of Blender that is requested (i.e. '2.7')
+    @returns The absolute path of a Blender executable or None if none was found"""
 
     candidate_directories = []
 
@@ -200,7 +215,7 @@ def _export_fbx_or_collada(environment, target_path, blendfile_path, meshes = No
     return environment.Command(
         source = blendfile_path,
         action = (
-            '"' + blender_executable + '" "$SOURCE"' +
+            '$REMOTE_EXECUTION_LAUNCHER "' + blender_executable + '" "$SOURCE"' +
             ' --enable-autoexec' +
             ' --python "' + absolute_script_path + '"' +
             ' --background' +
@@ -208,7 +223,9 @@ def _export_fbx_or_collada(environment, target_path, blendfile_path, meshes = No
             ' $TARGET ' +
             extra_arguments
         ),
-        target = target_path
+        target = target_path,
+        REMOTE_EXECUTION_INPUTS = [ absolute_script_path ],
+        PROFILE_CATEGORY = 'blender_export'
     )
 
 # ----------------------------------------------------------------------------------------------- #
@@ -249,7 +266,7 @@ def _export_animations_fbx_or_collada(
     export_command = environment.Command(
         source = actor_blendfile_path,
         action = (
-            '"' + blender_executable + '" "$SOURCES"' +
+            '$REMOTE_EXECUTION_LAUNCHER "' + blender_executable + '" "$SOURCES"' +
             ' --enable-autoexec' +
             ' --python "' + absolute_script_path + '"' +
             ' --background' +
@@ -258,7 +275,9 @@ def _export_animations_fbx_or_collada(
             ' ' + animation_blendfile_path +
             extra_arguments
         ),
-        target = target_path
+        target = target_path,
+        REMOTE_EXECUTION_INPUTS = [ absolute_script_path, animation_blendfile_path ],
+        PROFILE_CATEGORY = 'blender_export_animations'
     )
     environment.Depends(export_command, animation_blendfile_path)
 
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+
+import os
+import atexit
+import shutil
+import threading
+import importlib
+
+import SCons.Action
+import SCons.CacheDir
+
+# Nuclex SCons libraries
+shared = importlib.import_module('shared')
+
+"""
+Shared cache of derived files with a size limit and statistics
+
+Builds on SCons' CacheDir, which stores each built file under its build signature so
+other builds (on the same machine or, via a network share, on other developer machines
+and CI agents) can take the file from the cache instead of building it again.
+
+SCons already writes new cache entries to a temporary directory next to their final
+location and renames them into place, so concurrent builds can safely fill the same cache.
+On top of that, files are also copied out of the cache through a temporary file, files
+the compiler writes next to a target (dependency files) are cached along with it, the
+cache is trimmed to a maximum size by evicting the least recently used entries and the
+hits, misses and bytes taken from the cache are reported for each kind of build step.
+"""
+
+# ----------------------------------------------------------------------------------------------- #
+
+# Directory holding the cache entries, set by the first call to enable()
+_cache_directory = None
+
+# Number of bytes after which the least recently used cache entries will be evicted
+_maximum_size = None
+
+# Hits, misses and bytes taken from the cache, keyed by BUILD_CACHE_CATEGORY
+_statistics = {}
+
+# Number of bytes added to the cache during this build
+_stored_size = 0
+
+# Protects the statistics from concurrent updates by SCons' worker threads
+_statistics_lock = threading.Lock()
+
+# ----------------------------------------------------------------------------------------------- #
+
+class _ManagedCacheDir(SCons.CacheDir.CacheDir):
+    """SCons CacheDir that records statistics and caches companion files
+
+    @remarks
+        SCons creates one instance of this class for each environment using the cache,
+        so the statistics are kept at the module level."""
+
+    def retrieve(self, node):
+        """Copies a node's file from the cache if it was built before
+
+        @param  node  Node whose file will be looked up in the cache
+        @returns True if the file was taken from the cache, False if it needs building"""
+
+        if (not self.is_enabled()) or (len(node.side_effects) > 0):
+            return False
+
+        retrieved = super().retrieve(node)
+
+        cache_file_path = self.cachepath(node)[1]
+        retrieved_size = 0
+        if retrieved and SCons.Action.execute_actions:
+            try:
+                retrieved_size = os.path.getsize(cache_file_path)
+            except OSError:
+                pass # Evicted by a concurrent build after it was copied
+
+            _restore_companions(node, cache_file_path)
+
+        category = node.get_build_env().get('BUILD_CACHE_CATEGORY', 'Other')
+        with _statistics_lock:
+            statistics = _statistics.setdefault(category, [ 0, 0, 0 ])
+            if retrieved:
+                statistics[0] += 1
+                statistics[2] += retrieved_size
+            else:
+                statistics[1] += 1
+
+        return retrieved
+
+    def push(self, node):
+        """Stores a freshly built node's file in the cache
+
+        @param  node  Node whose file will be stored in the cache"""
+
+        # SCons only caches the targets, so side effects (split DWARF .dwo files,
+        # MSVC .pdb files) would be missing if the node was taken from the cache
+        if self.is_readonly() or (not self.is_enabled()) or (len(node.side_effects) > 0):
+            return None
+
+        result = super().push(node)
+
+        cache_file_path = self.cachepath(node)[1]
+        stored_size = _store_companions(node, cache_file_path)
+        try:
+            stored_size += os.path.getsize(cache_file_path)
+        except OSError:
+            pass # Failed to store, SCons already warned about it
+
+        global _stored_size
+        with _statistics_lock:
+            _stored_size += stored_size
+
+        return result
+
+    @classmethod
+    def copy_from_cache(cls, env, src, dst):
+        """Copies a file from the cache, only replacing the target once it is complete
+
+        @param  env  Environment the target is built in
+        @param  src  Path of the cached file
+        @param  dst  Path the target will be written to
+        @returns The path of the target"""
+
+        temporary_path = _get_temporary_path(dst)
+        try:
+            super().copy_from_cache(env, src, temporary_path)
+            os.replace(temporary_path, dst)
+        except OSError:
+            if os.path.isfile(temporary_path):
+                os.remove(temporary_path)
+            raise
+
+        return dst
+
+# ----------------------------------------------------------------------------------------------- #
+
+def enable(environment, cache_directory, maximum_size, category):
+    """Lets an environment take derived files from a shared cache and store them in it
+
+    @param  environment      Environment whose built files will be cached
+    @param  cache_directory  Directory (local or on a network share) holding the cache
+    @param  maximum_size     Number of bytes after which the least recently used cache
+                             entries will be evicted
+    @param  category         Kind of build steps for the statistics (i.e. 'C++')
+    @remarks
+        Only the first call sets the cache directory and size limit that are used for
+        the eviction and the statistics when the build ends.
+
+        Files the environment's build steps write next to their targets can be cached
+        along with them by listing their suffixes in BUILD_CACHE_COMPANION_SUFFIXES.
+        Build steps that produce more than their targets should be excluded from
+        caching via NoCache()."""
+
+    global _cache_directory, _maximum_size
+
+    # SCons creates the cache directory itself, but not its parent directories
+    parent_directory = os.path.dirname(os.path.abspath(cache_directory))
+    if not os.path.isdir(parent_directory):
+        os.makedirs(parent_directory)
+
+    environment['BUILD_CACHE_CATEGORY'] = category
+    environment.CacheDir(cache_directory, _ManagedCacheDir)
+
+    if _cache_directory is None:
+        _cache_directory = os.path.abspath(cache_directory)
+        _maximum_size = maximum_size
+        atexit.register(_finish_build)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _restore_companions(node, cache_file_path):
+    """Copies the files cached along with a node's file next to the node's file
+
+    @param  node             Node that was taken from the cache
+    @param  cache_file_path  Path of the node's file in the cache"""
+
+    node_path = node.get_abspath()
+    for suffix in node.get_build_env().get('BUILD_CACHE_COMPANION_SUFFIXES', []):
+        companion_path = node_path + suffix
+
+        # A companion left from an earlier build may describe a different target
+        try:
+            os.remove(companion_path)
+        except OSError:
+            pass
+
+        # Plain copy, so the companion is newer than the sources like a freshly written one
+        temporary_path = _get_temporary_path(companion_path)
+        try:
+            shutil.copyfile(cache_file_path + suffix, temporary_path)
+            os.replace(temporary_path, companion_path)
+            os.utime(cache_file_path + suffix, None) # Mark as recently used for the eviction
+        except OSError:
+            if os.path.isfile(temporary_path):
+                os.remove(temporary_path)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _store_companions(node, cache_file_path):
+    """Stores the files written next to a node's file in the cache along with it
+
+    @param  node             Node that was stored in the cache
+    @param  cache_file_path  Path of the node's file in the cache
+    @returns The number of bytes that were added to the cache"""
+
+    stored_size = 0
+
+    node_path = node.get_abspath()
+    for suffix in node.get_build_env().get('BUILD_CACHE_COMPANION_SUFFIXES', []):
+        companion_path = node_path + suffix
+        if (not os.path.isfile(companion_path)) or os.path.isfile(cache_file_path + suffix):
+            continue
+
+        # Store it under a temporary name first so other builds never see a partial file
+        temporary_path = _get_temporary_path(cache_file_path + suffix)
+        try:
+            shutil.copyfile(companion_path, temporary_path)
+            os.replace(temporary_path, cache_file_path + suffix)
+            stored_size += os.path.getsize(companion_path)
+        except OSError:
+            if os.path.isfile(temporary_path):
+                os.remove(temporary_path)
+
+    return stored_size
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_temporary_path(path):
+    """Forms a path under which a file can be written before it is renamed into place
+
+    @param  path  Path the file will finally be renamed to
+    @returns A path in the same directory that no other build or thread will use"""
+
+    return path + '.' + str(os.getpid()) + '-' + str(threading.get_ident()) + '.tmp'
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _finish_build():
+    """Prints the statistics of the build and trims the cache to its maximum size"""
+
+    for category in sorted(_statistics):
+        hit_count, miss_count, retrieved_size = _statistics[category]
+        print(
+            'Build cache (' + category + '): ' +
+            '\033[94m' + str(hit_count) + '\033[0m hits, ' +
+            '\033[94m' + str(miss_count) + '\033[0m misses, ' +
+            '\033[94m' + ('%.1f' % (retrieved_size / (1024.0 * 1024.0))) + ' MiB\033[0m saved'
+        )
+
+    # SCons spreads the entries over subdirectories named after their signatures.
+    # The build is done at this point, so a failed trim must not turn into an error.
+    if _stored_size > 0:
+        try:
+            shared.evict_least_recently_used(_cache_directory, _maximum_size, depth = 2)
+        except OSError as error:
+            print('Could not trim the build cache: ' + str(error))
@@ -0,0 +1,611 @@
+#!/usr/bin/env python
+
+# Purpose:
+#   Wraps a C/C++ compiler invocation and caches the resulting object file.
+#
+#   The cache key is formed from the preprocessed translation unit, the compiler
+#   binary and the compiler flags that affect code generation. Paths of the
+#   source file, the object file and the include directories are not part of
+#   the key, so objects are reused across worktrees, intermediate directories
+#   and when switching between build configurations back and forth.
+#
+#   Debug information would contain the working directory, so GCC and clang
+#   compile with -fdebug-prefix-map to record it as '.' instead. With MSVC,
+#   the working directory becomes part of the key for debug builds.
+#
+# Usage:
+#   Invoke this script with the system's Python interpreter, followed by
+#   the cache directory, the maximum cache size and the compiler command line:
+#
+#   python compile-cache.py ~/.cache/nuclex/compile-cache 5368709120 -- g++ -c ...
+#
+#   - The first argument is the directory in which the object files are cached
+#
+#   - The second argument is the number of bytes after which the least recently
+#     used cache entries will be deleted
+#
+#   - Everything after the '--' is the compiler command line that will be run
+#     if no cached object file exists
+#
+#   - The compiler command line can be preceded by launchers that will run the
+#     compiler on cache misses, each ending in its own '--' (i.e. compile-cost.py
+#     and remote-execution.py)
+#
+#   To display the hit/miss statistics or to reset them, use:
+#
+#   python compile-cache.py --statistics ~/.cache/nuclex/compile-cache
+#   python compile-cache.py --zero-statistics ~/.cache/nuclex/compile-cache
+#
+#   Dependency files (-MD/-MMD for GCC, /sourceDependencies for MSVC) are
+#   written on cache hits, too, so SCons can pick up the included headers.
+#   The same goes for the .dwo file written next to the object file when
+#   compiling with -gsplit-dwarf.
+#
+#   Compiler invocations the cache doesn't understand (linking, precompiled
+#   headers, multiple sources, MSVC builds writing a shared .pdb, compiles that
+#   use a profile for profile-guided optimization, compiles measured for a compile
+#   cost report) are simply run.
+#
+import sys
+import os
+import re
+import importlib
+import hashlib
+import shutil
+import struct
+import subprocess
+import tempfile
+
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
+
+# Nuclex SCons libraries
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+shared = importlib.import_module('shared')
+
+# ----------------------------------------------------------------------------------------------- #
+
+# File extensions of source files the cache will handle
+_source_file_extensions = [ '.c', '.cpp', '.cc', '.cxx' ]
+
+# Arguments that only affect the preprocessor and take a value as the next argument
+_preprocessor_arguments_with_value = [
+    '-I', '-isystem', '-iquote', '-idirafter', '-D', '-U', '-include', '-MF', '-MT', '-MQ',
+    '/sourceDependencies'
+]
+
+# Arguments that only affect the preprocessor or dependency file generation
+_preprocessor_argument_prefixes = [
+    '-I', '-isystem', '-iquote', '-idirafter', '-D', '-U', '-MF', '-MT', '-MQ',
+    '/I', '/D', '/U', '/FI'
+]
+
+# Dependency file generation arguments without value
+_dependency_arguments = [ '-MD', '-MMD' ]
+
+# Number of cache misses after which the cache is trimmed to its maximum size
+_eviction_interval = 32
+
+# Layout of the statistics file (number of hits and misses as 64 bit integers)
+_statistics_format = '<QQ'
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _main():
+    """Runs the compiler or takes the object file from the cache"""
+
+    cache_directory = os.path.abspath(os.path.expanduser(sys.argv[1]))
+    maximum_cache_size = int(sys.argv[2])
+    compiler_arguments = sys.argv[sys.argv.index('--') + 1:]
+
+    # Launchers (i.e. compile-cost.py, remote-execution.py) may precede the compiler,
+    # each ending in another '--', so the compiler follows the last '--'
+    launcher_arguments = []
+    while '--' in compiler_arguments:
+        separator_index = compiler_arguments.index('--')
+        launcher_arguments += compiler_arguments[:separator_index + 1]
+        compiler_arguments = compiler_arguments[separator_index + 1:]
+
+    invocation = _parse_compiler_invocation(compiler_arguments)
+    if invocation is None:
+        return subprocess.call(launcher_arguments + compiler_arguments)
+
+    cache_key = _get_cache_key(compiler_arguments, invocation)
+    if cache_key is None:
+        return subprocess.call(launcher_arguments + compiler_arguments)
+
+    # Keep the working directory out of the debug information (it's not in the key)
+    if _has_debug_information(compiler_arguments) and not invocation['msvc']:
+        compiler_arguments = compiler_arguments + [ '-fdebug-prefix-map=' + os.getcwd() + '=.' ]
+
+    cache_entry_directory = os.path.join(cache_directory, cache_key[:2], cache_key)
+
+    # Cache hit, copy the object file and replay the compiler's output
+    if _restore_from_cache(cache_entry_directory, invocation):
+        _record_statistic(cache_directory, 1, 0)
+        return 0
+
+    # Cache miss, compile normally and store the object file if it worked
+    compiler = subprocess.Popen(
+        launcher_arguments + compiler_arguments,
+        stdout = subprocess.PIPE, stderr = subprocess.PIPE
+    )
+    output, errors = compiler.communicate()
+    sys.stdout.buffer.write(output)
+    sys.stderr.buffer.write(errors)
+    if compiler.returncode != 0:
+        return compiler.returncode
+
+    _store_in_cache(cache_entry_directory, invocation, output + errors)
+    miss_count = _record_statistic(cache_directory, 0, 1)[1]
+
+    # The object file is in place, so trimming the cache must not fail the compile
+    if miss_count % _eviction_interval == 0:
+        try:
+            shared.evict_least_recently_used(cache_directory, maximum_cache_size, depth = 2)
+        except Exception as error:
+            sys.stderr.write('Could not trim the compile cache: ' + str(error) + '\n')
+
+    return 0
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _parse_compiler_invocation(compiler_arguments):
+    """Figures out the source and object file of a compiler invocation
+
+    @param  compiler_arguments  Command line the compiler would be run with
+    @returns A dictionary with the source path, object path and compiler type or
+             None if the invocation is not a single compile the cache can handle"""
+
+    is_msvc = os.path.splitext(os.path.basename(compiler_arguments[0]))[0].lower() == 'cl'
+
+    source_paths = []
+    object_path = None
+    compile_only = False
+
+    index = 1
+    while index < len(compiler_arguments):
+        argument = compiler_arguments[index]
+
+        if is_msvc:
+            if argument in [ '/c', '-c' ]:
+                compile_only = True
+            elif argument.startswith('/Fo') or argument.startswith('-Fo'):
+                object_path = argument[3:]
+            elif argument.startswith(('/Yc', '/Yu', '/Fd', '/Zi', '/ZI')):
+                return None # Precompiled headers and shared .pdb files can't be cached
+        else:
+            if argument == '-c':
+                compile_only = True
+            elif argument == '-o':
+                index += 1
+                object_path = compiler_arguments[index]
+            elif argument == '-x':
+                return None # Precompiled headers and unusual languages
+            elif argument.startswith('-fprofile-use'):
+                return None # The profile affects the object file but isn't in the key
+            elif argument in [ '-H', '-ftime-report' ] or argument.startswith('-ftime-trace'):
+                return None # Compile cost reports need the compiler to actually run
+            elif argument in _preprocessor_arguments_with_value:
+                index += 1 # Skip the value so it isn't mistaken for a source file
+
+        if os.path.splitext(argument)[1] in _source_file_extensions:
+            if not argument.startswith(('-', '/')) or os.path.isfile(argument):
+                source_paths.append(argument)
+
+        index += 1
+
+    if (not compile_only) or (object_path is None) or (len(source_paths) != 1):
+        return None
+
+    return {
+        'msvc': is_msvc,
+        'source_path': source_paths[0],
+        'object_path': object_path,
+        'dependency_path': _get_msvc_dependency_file_path(compiler_arguments, is_msvc),
+        'split_dwarf_path': _get_split_dwarf_file_path(compiler_arguments, object_path)
+    }
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_msvc_dependency_file_path(compiler_arguments, is_msvc):
+    """Looks up the path of the dependency file MSVC will write, if any
+
+    @param  compiler_arguments  Command line the compiler would be run with
+    @param  is_msvc             Whether the compiler is Microsoft's cl.exe
+    @returns The path of the dependency file or None if none will be written
+    @remarks
+        GCC's dependency file is written while preprocessing for the cache key,
+        so only MSVC's dependency file needs to be stored in the cache."""
+
+    if is_msvc:
+        for index, argument in enumerate(compiler_arguments[:-1]):
+            if argument == '/sourceDependencies':
+                return compiler_arguments[index + 1]
+
+    return None
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_split_dwarf_file_path(compiler_arguments, object_path):
+    """Looks up the path of the .dwo file GCC or clang will write, if any
+
+    @param  compiler_arguments  Command line the compiler would be run with
+    @param  object_path         Path of the object file the compiler will write
+    @returns The path of the .dwo file or None if debug information is not split"""
+
+    if '-gsplit-dwarf' in compiler_arguments:
+        return os.path.splitext(object_path)[0] + '.dwo'
+
+    return None
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_cache_key(compiler_arguments, invocation):
+    """Calculates the cache key for a compiler invocation
+
+    @param  compiler_arguments  Command line the compiler would be run with
+    @param  invocation          Source and object file of the compiler invocation
+    @returns The cache key or None if the source could not be preprocessed"""
+
+    key_hash = hashlib.sha256()
+
+    key_hash.update(_get_compiler_fingerprint(compiler_arguments[0]).encode('utf-8'))
+
+    # Flags that change the generated code, without paths and preprocessor settings
+    semantic_arguments = _get_semantic_arguments(compiler_arguments, invocation)
+    for argument in semantic_arguments:
+        key_hash.update(argument.encode('utf-8') + b'\0')
+
+    # MSVC's debug information contains the working directory. GCC and clang are told
+    # to leave it out with -fdebug-prefix-map, so objects are shared between worktrees.
+    if _has_debug_information(semantic_arguments) and invocation['msvc']:
+        key_hash.update(os.getcwd().encode('utf-8'))
+
+    # Object files with split debug information refer to their .dwo file by path
+    if invocation['split_dwarf_path'] is not None:
+        key_hash.update(invocation['split_dwarf_path'].encode('utf-8'))
+
+    preprocessed_source = _preprocess(compiler_arguments, invocation)
+    if preprocessed_source is None:
+        return None
+
+    # Headers included via absolute paths end up in the debug information through the
+    # line markers, where -fdebug-prefix-map turns the working directory into '.'
+    if not invocation['msvc']:
+        preprocessed_source = _line_marker_prefix_regex(os.getcwd()).sub(
+            br'\1.\2', preprocessed_source
+        )
+
+    key_hash.update(preprocessed_source)
+
+    return key_hash.hexdigest()
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _has_debug_information(compiler_arguments):
+    """Checks whether a compiler invocation generates debug information
+
+    @param  compiler_arguments  Command line (or some arguments) of the compiler invocation
+    @returns True if debug information will be generated, False otherwise"""
+
+    for argument in compiler_arguments:
+        if argument.startswith(('-g', '/Z7')) and (argument != '-g0'):
+            return True
+
+    return False
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _line_marker_prefix_regex(directory):
+    """Builds a regular expression matching a directory at the start of line markers
+
+    @param  directory  Directory that will be matched in the preprocessor's line markers
+    @returns A compiled regular expression for bytes, the directory itself is not
+             captured but what precedes it (group 1) and the separator after it (group 2)"""
+
+    return re.compile(
+        br'^(#(?:line)? [0-9]+ ")' + re.escape(directory.encode('utf-8')) + br'([/\\])',
+        re.MULTILINE
+    )
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_compiler_fingerprint(compiler_executable):
+    """Forms a string that identifies the exact compiler binary
+
+    @param  compiler_executable  Name or path of the compiler executable
+    @returns A string that changes whenever the compiler is replaced or updated"""
+
+    compiler_path = shutil.which(compiler_executable)
+    if compiler_path is None:
+        return compiler_executable
+
+    compiler_path = os.path.realpath(compiler_path)
+    compiler_status = os.stat(compiler_path)
+
+    return (
+        compiler_path + ';' + str(compiler_status.st_size) + ';' + str(compiler_status.st_mtime)
+    )
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_semantic_arguments(compiler_arguments, invocation):
+    """Filters a compiler command line down to the arguments affecting code generation
+
+    @param  compiler_arguments  Command line the compiler would be run with
+    @param  invocation          Source and object file of the compiler invocation
+    @returns The compiler arguments without paths and preprocessor settings"""
+
+    semantic_arguments = []
+
+    index = 1
+    while index < len(compiler_arguments):
+        argument = compiler_arguments[index]
+
+        if argument in _preprocessor_arguments_with_value or argument == '-o':
+            index += 1
+        elif argument.startswith(tuple(_preprocessor_argument_prefixes)):
+            pass
+        elif argument.startswith(('/Fo', '-Fo')):
+            pass
+        elif argument in _dependency_arguments:
+            pass
+        elif argument != invocation['source_path']:
+            semantic_arguments.append(argument)
+
+        index += 1
+
+    return semantic_arguments
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _preprocess(compiler_arguments, invocation):
+    """Runs the preprocessor over the source file of a compiler invocation
+
+    @param  compiler_arguments  Command line the compiler would be run with
+    @param  invocation          Source and object file of the compiler invocation
+    @returns The preprocessed source code or None if preprocessing failed"""
+
+    preprocessor_arguments = [ compiler_arguments[0] ]
+
+    index = 1
+    while index < len(compiler_arguments):
+        argument = compiler_arguments[index]
+
+        if invocation['msvc']:
+            if argument.startswith(('/Fo', '-Fo')) or argument in [ '/c', '-c' ]:
+                pass
+            elif argument == '/sourceDependencies':
+                index += 1
+            else:
+                preprocessor_arguments.append(argument)
+        else:
+            if argument == '-o':
+                index += 1
+            elif argument != '-c': # Keeps -MD/-MMD, so the dependency file gets written
+                preprocessor_arguments.append(argument)
+
+        index += 1
+
+    if invocation['msvc']:
+        preprocessor_arguments.append('/E')
+    else:
+        preprocessor_arguments.append('-E')
+
+    preprocessor = subprocess.Popen(
+        preprocessor_arguments, stdout = subprocess.PIPE, stderr = subprocess.DEVNULL
+    )
+    preprocessed_source = preprocessor.communicate()[0]
+    if preprocessor.returncode != 0:
+        return None
+
+    return preprocessed_source
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _restore_from_cache(cache_entry_directory, invocation):
+    """Copies the object file of a compiler invocation from the cache
+
+    @param  cache_entry_directory  Directory of the cache entry for the invocation
+    @param  invocation             Source and object file of the compiler invocation
+    @returns True if the object file was restored, False if it was not cached"""
+
+    cached_object_path = os.path.join(cache_entry_directory, 'object')
+    if not os.path.isfile(cached_object_path):
+        return False
+
+    try:
+        shutil.copyfile(cached_object_path, invocation['object_path'])
+
+        cached_dependency_path = os.path.join(cache_entry_directory, 'dependencies')
+        if (invocation['dependency_path'] is not None) and os.path.isfile(cached_dependency_path):
+            shutil.copyfile(cached_dependency_path, invocation['dependency_path'])
+
+        if invocation['split_dwarf_path'] is not None:
+            cached_split_dwarf_path = os.path.join(cache_entry_directory, 'split-dwarf')
+            shutil.copyfile(cached_split_dwarf_path, invocation['split_dwarf_path'])
+
+        output_path = os.path.join(cache_entry_directory, 'output')
+        if os.path.isfile(output_path):
+            with open(output_path, 'rb') as output_file:
+                sys.stderr.buffer.write(output_file.read())
+
+        # The modification time of an entry is its last use time for the LRU eviction
+        os.utime(cache_entry_directory, None)
+    except OSError:
+        return False # Probably being evicted by a concurrent build
+
+    return True
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _store_in_cache(cache_entry_directory, invocation, output):
+    """Stores the object file produced by a compiler invocation in the cache
+
+    @param  cache_entry_directory  Directory of the cache entry for the invocation
+    @param  invocation             Source and object file of the compiler invocation
+    @param  output                 Messages the compiler printed while compiling
+    @remarks
+        The entry is assembled in a temporary directory and then renamed into place,
+        so concurrent builds will never see an incomplete entry."""
+
+    bucket_directory = os.path.dirname(cache_entry_directory)
+    if not os.path.isdir(bucket_directory):
+        os.makedirs(bucket_directory, exist_ok = True)
+
+    temporary_directory = tempfile.mkdtemp(prefix = '.incoming-', dir = bucket_directory)
+    try:
+        shutil.copyfile(invocation['object_path'], os.path.join(temporary_directory, 'object'))
+        if invocation['dependency_path'] is not None:
+            shutil.copyfile(
+                invocation['dependency_path'], os.path.join(temporary_directory, 'dependencies')
+            )
+        if invocation['split_dwarf_path'] is not None:
+            shutil.copyfile(
+                invocation['split_dwarf_path'], os.path.join(temporary_directory, 'split-dwarf')
+            )
+        if len(output) > 0:
+            with open(os.path.join(temporary_directory, 'output'), 'wb') as output_file:
+                output_file.write(output)
+
+        os.rename(temporary_directory, cache_entry_directory)
+    except OSError:
+        shutil.rmtree(temporary_directory, ignore_errors = True) # Lost a race, that's fine
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _record_statistic(cache_directory, hit_count, miss_count):
+    """Adds cache hits or misses to the counters in the statistics file
+
+    @param  cache_directory  Directory holding the cache entries
+    @param  hit_count        Number of hits that will be added
+    @param  miss_count       Number of misses that will be added
+    @returns A tuple of the total number of hits and misses after the update
+    @remarks
+        The file only holds the two counters and is locked while they are updated,
+        so it stays the same size no matter how many compiles were done."""
+
+    if not os.path.isdir(cache_directory):
+        os.makedirs(cache_directory, exist_ok = True)
+
+    counters = (hit_count, miss_count)
+
+    statistics_file = os.open(
+        os.path.join(cache_directory, 'statistics'), os.O_RDWR | os.O_CREAT
+    )
+    try:
+        _lock_statistics_file(statistics_file, True)
+        try:
+            counters = _read_counters(statistics_file)
+            counters = (counters[0] + hit_count, counters[1] + miss_count)
+
+            os.lseek(statistics_file, 0, os.SEEK_SET)
+            os.write(statistics_file, struct.pack(_statistics_format, *counters))
+        finally:
+            _lock_statistics_file(statistics_file, False)
+    finally:
+        os.close(statistics_file)
+
+    return counters
+
+# ----------------------------------------------------------------------------------------------- #
+
+def read_statistics(cache_directory):
+    """Reads the number of cache hits and misses from the statistics file
+
+    @param  cache_directory  Directory holding the cache entries
+    @returns A tuple of the number of hits and the number of misses"""
+
+    try:
+        statistics_file = os.open(os.path.join(cache_directory, 'statistics'), os.O_RDWR)
+    except OSError:
+        return (0, 0)
+
+    try:
+        _lock_statistics_file(statistics_file, True)
+        try:
+            return _read_counters(statistics_file)
+        finally:
+            _lock_statistics_file(statistics_file, False)
+    finally:
+        os.close(statistics_file)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _read_counters(statistics_file):
+    """Reads the hit and miss counters from the opened statistics file
+
+    @param  statistics_file  File descriptor of the statistics file
+    @returns A tuple of the number of hits and the number of misses
+    @remarks
+        Anything that isn't exactly two counters (a new file or the event log written
+        by earlier versions of this script) counts as zero hits and misses."""
+
+    os.lseek(statistics_file, 0, os.SEEK_SET)
+    contents = os.read(statistics_file, struct.calcsize(_statistics_format) + 1)
+    if len(contents) != struct.calcsize(_statistics_format):
+        os.ftruncate(statistics_file, 0)
+        return (0, 0)
+
+    return struct.unpack(_statistics_format, contents)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _lock_statistics_file(statistics_file, lock):
+    """Locks or unlocks the statistics file against concurrent updates
+
+    @param  statistics_file  File descriptor of the statistics file
+    @param  lock             True to wait for and take the lock, False to release it"""
+
+    if os.name == 'nt':
+        os.lseek(statistics_file, 0, os.SEEK_SET)
+        if lock:
+            msvcrt.locking(statistics_file, msvcrt.LK_LOCK, 1)
+        else:
+            msvcrt.locking(statistics_file, msvcrt.LK_UNLCK, 1)
+    else:
+        if lock:
+            fcntl.lockf(statistics_file, fcntl.LOCK_EX)
+        else:
+            fcntl.lockf(statistics_file, fcntl.LOCK_UN)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _print_statistics(cache_directory):
+    """Prints the hit/miss statistics and the size of the cache
+
+    @param  cache_directory  Directory holding the cache entries"""
+
+    hit_count, miss_count = read_statistics(cache_directory)
+
+    entry_count = 0
+    total_size = 0
+    for root, directory_names, file_names in os.walk(cache_directory):
+        if os.path.basename(root) != os.path.basename(cache_directory):
+            entry_count += file_names.count('object')
+        for file_name in file_names:
+            total_size += os.path.getsize(os.path.join(root, file_name))
+
+    print('Cache directory: \033[94m' + cache_directory + '\033[0m')
+    print('Cache hits: \033[94m' + str(hit_count) + '\033[0m')
+    print('Cache misses: \033[94m' + str(miss_count) + '\033[0m')
+    if hit_count + miss_count > 0:
+        hit_rate = 100.0 * hit_count / (hit_count + miss_count)
+        print('Hit rate: \033[94m' + ('%.1f' % hit_rate) + '%\033[0m')
+    print('Cached objects: \033[94m' + str(entry_count) + '\033[0m')
+    print('Cache size: \033[94m' + str(total_size // (1024 * 1024)) + ' MiB\033[0m')
+
+# ----------------------------------------------------------------------------------------------- #
+
+if __name__ == '__main__':
+    if sys.argv[1] == '--statistics':
+        _print_statistics(os.path.abspath(os.path.expanduser(sys.argv[2])))
+    elif sys.argv[1] == '--zero-statistics':
+        statistics_path = os.path.join(os.path.expanduser(sys.argv[2]), 'statistics')
+        if os.path.isfile(statistics_path):
+            os.remove(statistics_path)
+    else:
+        sys.exit(_main())
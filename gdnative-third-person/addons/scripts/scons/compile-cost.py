@@ -0,0 +1,453 @@
+#!/usr/bin/env python
+
+# Purpose:
+#   Wraps a C/C++ compiler invocation and records how much compile time each
+#   included header costs, then summarizes the costs of all compiles in a report.
+#
+#   With clang, the compiler is run with -ftime-trace and the trace it writes next
+#   to the object file tells exactly how long each header took to parse, inclusive
+#   of the headers it includes itself, and which templates were instantiated.
+#
+#   With GCC, the compiler is run with -ftime-report and -H. GCC only reports the
+#   total parse and template instantiation time of a translation unit, so the parse
+#   time is divided among the source file and the headers in the include tree by
+#   their line counts (again inclusive of the headers they include). This is an
+#   estimate, but it does point at the headers that drag in the most code.
+#
+# Usage:
+#   Invoke this script with the system's Python interpreter, followed by the
+#   compiler command line, which has to contain the flags from get_compiler_flags():
+#
+#   python compile-cost.py -- g++ -ftime-report -H -c -o a.o a.cpp
+#
+#   The costs are written into a file named like the object file plus '.cost.json'.
+#   To summarize the costs of all compiles below a directory in a report, use
+#   (this includes the cost files of objects whose sources have since been deleted,
+#   nuclex only reports on the object files that are part of the current build):
+#
+#   python compile-cost.py --report obj compile-cost-report.txt
+#
+#   Like with compile-cache.py, a launcher may precede the compiler, ending in
+#   its own '--' (i.e. remote-execution.py).
+#
+import sys
+import os
+import re
+import json
+import subprocess
+
+# ----------------------------------------------------------------------------------------------- #
+
+# Extension appended to the object file path for the file recording the compile's costs
+cost_file_extension = '.cost.json'
+
+# Number of entries listed for each table when the report is printed to the console
+_printed_entry_count = 10
+
+# Matches a line of GCC's -ftime-report, capturing the name and the wall clock time
+_gcc_time_report_pattern = re.compile(
+    r'^\s*\|?(.+?)\s*:\s*[\d.]+\s*\(\s*\d+%\)\s*[\d.]+\s*\(\s*\d+%\)\s*([\d.]+)\s*\('
+)
+
+# Matches a line of GCC's -H include tree, capturing the depth (number of dots) and path
+_gcc_include_pattern = re.compile(r'^(\.+) (.+)$')
+
+# Phases of GCC's -ftime-report that count as parsing
+_gcc_parse_phases = [ 'phase parsing', 'phase lang. deferred' ]
+
+# File extensions of the source files a translation unit can be compiled from
+_source_file_extensions = [ '.c', '.cpp', '.cc', '.cxx' ]
+
+# ----------------------------------------------------------------------------------------------- #
+
+def get_compiler_flags(compiler_name):
+    """Determines the compiler flags needed to record the costs of a compile
+
+    @param  compiler_name  Name of the compiler as returned by cplusplus.get_compiler_name()
+    @returns The flags to append to CCFLAGS or None if the compiler isn't supported"""
+
+    if 'clang' in os.path.basename(compiler_name):
+        return [ '-ftime-trace' ]
+    elif compiler_name == 'gcc':
+        return [ '-ftime-report', '-H' ]
+    else:
+        return None
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _main():
+    """Runs the compiler and records the costs of the compile"""
+
+    compiler_arguments = sys.argv[sys.argv.index('--') + 1:]
+
+    # A launcher may precede the compiler, the compiler itself follows its '--'
+    actual_compiler_arguments = compiler_arguments
+    while '--' in actual_compiler_arguments:
+        separator_index = actual_compiler_arguments.index('--')
+        actual_compiler_arguments = actual_compiler_arguments[separator_index + 1:]
+
+    object_path = None
+    for index, argument in enumerate(actual_compiler_arguments[:-1]):
+        if argument == '-o':
+            object_path = actual_compiler_arguments[index + 1]
+
+    source_path = None
+    for argument in actual_compiler_arguments[1:]:
+        if os.path.splitext(argument)[1] in _source_file_extensions:
+            if not argument.startswith('-'):
+                source_path = argument
+
+    compiler = subprocess.Popen(compiler_arguments, stderr = subprocess.PIPE)
+    errors = compiler.communicate()[1].decode('utf-8', 'replace')
+
+    if (compiler.returncode != 0) or (object_path is None):
+        sys.stderr.write(errors)
+        return compiler.returncode
+
+    if '-ftime-trace' in actual_compiler_arguments:
+        sys.stderr.write(errors)
+        trace_path = os.path.splitext(object_path)[0] + '.json'
+        costs = _read_clang_trace(trace_path)
+    else:
+        errors, costs = _read_gcc_reports(errors, source_path)
+        sys.stderr.write(errors)
+
+    if costs is not None:
+        with open(object_path + cost_file_extension, 'w') as cost_file:
+            json.dump(costs, cost_file)
+
+    return 0
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _read_clang_trace(trace_path):
+    """Extracts the costs of a compile from the trace clang wrote with -ftime-trace
+
+    @param  trace_path  Path of the JSON trace file
+    @returns A dictionary with the total parse and template instantiation time,
+             the costs of each header and the time spent on each template"""
+
+    try:
+        with open(trace_path, 'r') as trace_file:
+            trace = json.load(trace_file)
+    except (OSError, ValueError):
+        return None
+
+    costs = { 'parse_time': 0.0, 'template_time': 0.0, 'headers': {}, 'templates': {} }
+
+    for event in trace.get('traceEvents', []):
+        if event.get('ph') != 'X':
+            continue
+
+        name = event.get('name')
+        duration = event.get('dur', 0) / 1000000.0
+        details = event.get('args', {})
+
+        if name == 'Source':
+            header = _get_header_costs(costs, os.path.normpath(details.get('detail', '')))
+            header['parse_time'] += duration
+            header['include_count'] = 1
+        elif name in [ 'InstantiateClass', 'InstantiateFunction' ]:
+            template_name = details.get('detail', '')
+            costs['templates'][template_name] = (
+                costs['templates'].get(template_name, 0.0) + duration
+            )
+
+            # Newer clang versions tell where the template was declared
+            template_file = details.get('file')
+            if template_file:
+                template_file = os.path.normpath(re.sub(r':\d+:\d+$', '', template_file))
+                _get_header_costs(costs, template_file)['template_time'] += duration
+        elif name == 'Total Frontend':
+            costs['parse_time'] = duration
+        elif name in [ 'Total InstantiateClass', 'Total InstantiateFunction' ]:
+            costs['template_time'] += duration
+
+    # Instantiations nest, so their times overlap. Only the totals are exact.
+    return costs
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _read_gcc_reports(errors, source_path):
+    """Extracts the costs of a compile from GCC's -ftime-report and -H output
+
+    @param  errors       Everything the compiler printed to stderr
+    @param  source_path  Path of the source file that was compiled (None if unknown)
+    @returns The compiler output without the reports and a dictionary with the total
+             parse and template instantiation time plus the estimated costs of the
+             source file's own lines and of each header"""
+
+    remaining_lines = []
+    include_tree = []
+    timings = {}
+
+    in_include_guard_list = False
+    for line in errors.splitlines(True):
+        stripped_line = line.rstrip('\r\n')
+
+        # GCC lists headers that lack include guards after the include tree
+        if in_include_guard_list:
+            in_include_guard_list = (len(stripped_line) > 0)
+            continue
+
+        include = _gcc_include_pattern.match(stripped_line)
+        timing = _gcc_time_report_pattern.match(stripped_line)
+        if include is not None:
+            include_tree.append((len(include.group(1)), os.path.normpath(include.group(2))))
+        elif stripped_line.startswith('Multiple include guards may be useful for:'):
+            in_include_guard_list = True
+        elif timing is not None:
+            timings[timing.group(1)] = float(timing.group(2))
+        elif not stripped_line.startswith(('Time variable', ' TOTAL')):
+            remaining_lines.append(line)
+
+    parse_time = sum(timings.get(phase, 0.0) for phase in _gcc_parse_phases)
+    costs = {
+        'parse_time': parse_time,
+        'template_time': timings.get('template instantiation', 0.0),
+        'headers': {},
+        'templates': {},
+        'estimated': True
+    }
+
+    # Headers only contribute their lines the first time they're opened (include guards)
+    line_counts = []
+    seen_paths = set()
+    for depth, path in include_tree:
+        if path in seen_paths:
+            line_counts.append(0)
+        else:
+            seen_paths.add(path)
+            line_counts.append(_count_lines(path))
+
+    # Add the lines of all nested headers to each header to get the inclusive line counts.
+    # A header is complete when the tree returns to its depth, then it's added to its parent.
+    inclusive_line_counts = list(line_counts)
+    open_indices = []
+    for index, (depth, path) in enumerate(include_tree + [ (0, None) ]):
+        while (len(open_indices) > 0) and (include_tree[open_indices[-1]][0] >= depth):
+            completed_index = open_indices.pop()
+            if len(open_indices) > 0:
+                inclusive_line_counts[open_indices[-1]] += inclusive_line_counts[completed_index]
+        open_indices.append(index)
+
+    # The source file's own lines are parsed, too, so they get their share of the time
+    source_line_count = 0
+    if source_path is not None:
+        source_line_count = _count_lines(source_path)
+
+    total_line_count = source_line_count + sum(
+        inclusive_line_counts[index]
+        for index in range(len(include_tree)) if include_tree[index][0] == 1
+    )
+    if total_line_count == 0:
+        return ''.join(remaining_lines), costs
+
+    costs['source_parse_time'] = parse_time * source_line_count / total_line_count
+
+    for index, (depth, path) in enumerate(include_tree):
+        header = _get_header_costs(costs, path)
+        header['parse_time'] += parse_time * inclusive_line_counts[index] / total_line_count
+        header['include_count'] = 1
+
+    return ''.join(remaining_lines), costs
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_header_costs(costs, path):
+    """Looks up or adds the entry recording the costs of a header
+
+    @param  costs  Costs of the compile the header was included in
+    @param  path   Path of the header
+    @returns The dictionary recording the header's costs"""
+
+    header = costs['headers'].get(path)
+    if header is None:
+        header = { 'parse_time': 0.0, 'template_time': 0.0, 'include_count': 0 }
+        costs['headers'][path] = header
+
+    return header
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _count_lines(path):
+    """Counts the lines in a source file
+
+    @param  path  Path of the source file
+    @returns The number of lines in the file or 0 if it can't be read"""
+
+    try:
+        with open(path, 'rb') as source_file:
+            return source_file.read().count(b'\n') + 1
+    except OSError:
+        return 0
+
+# ----------------------------------------------------------------------------------------------- #
+
+def find_measured_objects(directory):
+    """Looks for the object files below a directory whose compile costs were recorded
+
+    @param  directory  Directory below which the cost files will be searched
+    @returns The paths of all object files that have a cost file"""
+
+    object_paths = []
+
+    for root, directory_names, file_names in os.walk(directory):
+        for file_name in file_names:
+            if file_name.endswith(cost_file_extension):
+                object_paths.append(os.path.join(root, file_name[:-len(cost_file_extension)]))
+
+    return object_paths
+
+# ----------------------------------------------------------------------------------------------- #
+
+def write_report(object_paths, report_path):
+    """Sums up the costs of the compiles of the specified object files and writes a report
+
+    @param  object_paths  Paths of the object files whose compile costs will be summed up
+    @param  report_path   Path of the text file the report will be written to
+    @returns The lines of a shortened report for printing or None if no costs were found"""
+
+    headers = {}
+    templates = {}
+    translation_units = []
+    estimated = False
+
+    for object_path in object_paths:
+        try:
+            with open(object_path + cost_file_extension, 'r') as cost_file:
+                costs = json.load(cost_file)
+        except (OSError, ValueError):
+            continue
+
+        estimated = estimated or costs.get('estimated', False)
+        translation_units.append(
+            (
+                costs['template_time'], costs['parse_time'],
+                costs.get('source_parse_time'), object_path
+            )
+        )
+
+        for path, header_costs in costs['headers'].items():
+            header = headers.setdefault(path, [ 0.0, 0, 0.0 ])
+            header[0] += header_costs['parse_time']
+            header[1] += header_costs['include_count']
+            header[2] += header_costs['template_time']
+
+        for template_name, duration in costs['templates'].items():
+            templates[template_name] = templates.get(template_name, 0.0) + duration
+
+    if len(translation_units) == 0:
+        return None
+
+    header_rows = sorted(
+        (
+            (parse_time, include_count, template_time, _get_display_path(path))
+            for path, (parse_time, include_count, template_time) in headers.items()
+        ),
+        reverse = True
+    )
+    translation_unit_rows = sorted(
+        (
+            (template_time, parse_time, source_parse_time, _get_display_path(object_path))
+            for template_time, parse_time, source_parse_time, object_path in translation_units
+        ),
+        key = lambda row: (row[0], row[1], row[3]),
+        reverse = True
+    )
+    template_rows = sorted(
+        ((duration, template_name) for template_name, duration in templates.items()),
+        reverse = True
+    )
+
+    report_lines = _format_report(
+        header_rows, translation_unit_rows, template_rows, estimated, None
+    )
+    with open(report_path, 'w') as report_file:
+        report_file.write('\n'.join(report_lines) + '\n')
+
+    return _format_report(
+        header_rows, translation_unit_rows, template_rows, estimated, _printed_entry_count
+    )
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _format_report(header_rows, translation_unit_rows, template_rows, estimated, entry_count):
+    """Formats the summed up costs as a text report
+
+    @param  header_rows            Parse time, include count, template time and path
+                                   of each header, most expensive first
+    @param  translation_unit_rows  Template time, parse time, parse time of the source
+                                   file's own lines (None if unknown) and object path
+                                   of each translation unit, most expensive first
+    @param  template_rows          Instantiation time and name of each template
+    @param  estimated              Whether header parse times were estimated (GCC)
+    @param  entry_count            Number of entries to list per table (None = all)
+    @returns The lines of the report"""
+
+    total_parse_time = sum(row[1] for row in translation_unit_rows)
+    total_template_time = sum(row[0] for row in translation_unit_rows)
+
+    lines = [
+        'Compile costs of ' + str(len(translation_unit_rows)) + ' translation units: ' +
+        '%.2fs parsing, %.2fs instantiating templates' % (total_parse_time, total_template_time),
+        '',
+        'Headers by inclusive parse time:'
+    ]
+    if estimated:
+        lines.append('(GCC: parse times estimated from line counts, template times need clang)')
+    lines.append('  Parse (s)  Includes  Templates (s)  Header')
+    for parse_time, include_count, template_time, path in header_rows[:entry_count]:
+        lines.append(
+            '%11.3f %9d %14.3f  %s' % (parse_time, include_count, template_time, path)
+        )
+
+    lines += [
+        '',
+        'Translation units by template instantiation time:',
+        '  Templates (s)  Parse (s)  Own lines (s)  Object file'
+    ]
+    for template_time, parse_time, source_parse_time, path in translation_unit_rows[:entry_count]:
+        if source_parse_time is None:
+            source_parse_time_column = '%14s' % '-'
+        else:
+            source_parse_time_column = '%14.3f' % source_parse_time
+        lines.append(
+            '%15.3f %10.3f %s  %s' % (template_time, parse_time, source_parse_time_column, path)
+        )
+
+    if len(template_rows) > 0:
+        lines += [
+            '',
+            'Templates by instantiation time (nested instantiations overlap):',
+            '  Time (s)  Template'
+        ]
+        for duration, template_name in template_rows[:entry_count]:
+            lines.append('%10.3f  %s' % (duration, template_name))
+
+    return lines
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_display_path(path):
+    """Shortens a path for the report if it's inside the current directory
+
+    @param  path  Path that will be shortened
+    @returns The path relative to the current directory or the absolute path"""
+
+    absolute_path = os.path.abspath(path)
+    relative_path = os.path.relpath(absolute_path)
+    if relative_path.startswith('..'):
+        return absolute_path
+
+    return relative_path
+
+# ----------------------------------------------------------------------------------------------- #
+
+if __name__ == '__main__':
+    if sys.argv[1] == '--report':
+        report_lines = write_report(find_measured_objects(sys.argv[2]), sys.argv[3])
+        if report_lines is not None:
+            print('\n'.join(report_lines))
+    else:
+        sys.exit(_main())
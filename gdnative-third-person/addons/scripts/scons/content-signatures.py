@@ -0,0 +1,308 @@
+#!/usr/bin/env python
+
+import os
+import mmap
+import atexit
+import hashlib
+import importlib
+import threading
+import concurrent.futures
+
+import SCons.Node.FS
+import SCons.Taskmaster
+import SCons.Util
+
+# Nuclex SCons libraries
+shared = importlib.import_module('shared')
+
+"""
+Persistent cache of the content signatures of large asset files
+
+Blender files, textures and audio files can be hundreds of megabytes large. With its
+content decider, SCons hashes them in a single thread whenever it can't be sure they
+are unchanged (i.e. after a checkout or if they were modified in the past two days).
+
+This keeps the content signature of each asset file together with its size,
+modification time and inode in a cache that lives across builds. A file is only hashed
+again when one of these changes, so a null build hashes nothing and a build after
+'git checkout' only hashes the files git actually rewrote. Once all build scripts have
+run, the asset files that need hashing are hashed in a thread pool, large ones via mmap.
+
+The signatures are the same ones SCons would calculate, so the signatures stored in
+.sconsign stay valid when the cache is turned on or off.
+"""
+
+# ----------------------------------------------------------------------------------------------- #
+
+# Extensions of the files whose content signatures are cached (Blender, textures, audio)
+asset_extensions = [
+    '.blend',
+    '.png', '.jpg', '.jpeg', '.tga', '.bmp', '.webp', '.exr', '.hdr', '.psd', '.dds', '.ktx',
+    '.wav', '.ogg', '.mp3', '.flac'
+]
+
+# Files up to this size are read at once, larger ones are hashed in blocks of this size
+_block_size = 16 * 1024 * 1024
+
+# Number of files that are hashed at the same time
+_thread_count = min(8, os.cpu_count() or 1)
+
+# Cached (size, modification time, inode, signature) tuples, keyed by absolute path
+_signatures = None
+
+# Path of the file in which the signatures are persisted between builds
+_signatures_path = None
+
+# Whether the signatures have changed since they were loaded
+_signatures_changed = False
+
+# Hashing still in progress, keyed by absolute path
+_pending_signatures = {}
+
+# Threads that hash the asset files needed by the build
+_thread_pool = None
+
+# Protects the signatures and pending hashes from concurrent updates
+_signatures_lock = threading.Lock()
+
+# ----------------------------------------------------------------------------------------------- #
+
+def enable(cache_path):
+    """Keeps the content signatures of asset files in a cache that lives across builds
+
+    @param  cache_path  Path of the file in which the signatures will be stored
+    @remarks
+        Only the first call has an effect, so all environments share one cache.
+        Environments need to use decide() as their decider for the cache to be used."""
+
+    global _signatures_path, _signatures
+    if _signatures_path is not None:
+        return
+
+    _signatures_path = cache_path
+    _signatures = _load_signatures()
+
+    atexit.register(_save_signatures)
+
+    # SCons creates its Taskmaster after all build scripts have run, at which point
+    # all asset files the build depends on are known and can be hashed in parallel
+    original_initializer = SCons.Taskmaster.Taskmaster.__init__
+
+    def initialize_and_hash_assets(
+        taskmaster, targets = [], tasker = None, order = None, trace = None
+    ):
+        _hash_all_assets()
+        original_initializer(taskmaster, targets, tasker, order, trace)
+
+    SCons.Taskmaster.Taskmaster.__init__ = initialize_and_hash_assets
+
+# ----------------------------------------------------------------------------------------------- #
+
+def decide(dependency, target, prev_ni, repo_node = None):
+    """Decider for SCons that takes the signatures of asset files from the cache
+
+    @param  dependency  Node that is being checked for changes
+    @param  target      Node that depends on the checked node
+    @param  prev_ni     Information stored about the dependency when the target was built
+    @param  repo_node   Node in the repository (unused)
+    @returns True if the dependency has changed since the target was built
+    @remarks
+        Files that aren't assets are checked by content like SCons does by default."""
+
+    if (_signatures is None) or (not isinstance(dependency, SCons.Node.FS.File)):
+        return dependency.changed_content(target, prev_ni, repo_node)
+
+    path = dependency.get_abspath()
+    if not _is_asset(path):
+        return dependency.changed_content(target, prev_ni, repo_node)
+
+    signature = get_signature(path)
+    if signature is None:
+        return dependency.changed_content(target, prev_ni, repo_node)
+
+    # SCons takes the node's signature from here from now on (i.e. for .sconsign)
+    dependency.get_ninfo().csig = signature
+
+    try:
+        return signature != prev_ni.csig
+    except AttributeError:
+        return True # Not built before
+
+# ----------------------------------------------------------------------------------------------- #
+
+def get_signature(path):
+    """Looks up or calculates the content signature of a file
+
+    @param  path  Absolute path of the file whose content signature will be returned
+    @returns The content signature or None if the file doesn't exist"""
+
+    with _signatures_lock:
+        pending_signature = _pending_signatures.get(path)
+
+    if pending_signature is not None:
+        return pending_signature.result()
+
+    return _get_or_calculate_signature(path)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _hash_all_assets():
+    """Starts hashing all asset files known to SCons whose signature isn't cached"""
+
+    global _thread_pool
+
+    file_system = SCons.Node.FS.get_default_fs()
+    for root_directory in list(file_system.Root.values()):
+        for node in list(root_directory._lookupDict.values()):
+            if not isinstance(node, SCons.Node.FS.File) or node.has_builder():
+                continue
+
+            path = node.get_abspath()
+            if (not _is_asset(path)) or _is_cached(path):
+                continue
+
+            with _signatures_lock:
+                if path in _pending_signatures:
+                    continue
+
+                if _thread_pool is None:
+                    _thread_pool = concurrent.futures.ThreadPoolExecutor(_thread_count)
+
+                _pending_signatures[path] = _thread_pool.submit(
+                    _get_or_calculate_signature, path
+                )
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _is_asset(path):
+    """Checks whether a file is an asset file whose signature is cached
+
+    @param  path  Path of the file that will be checked
+    @returns True if the file is an asset file, False otherwise"""
+
+    return os.path.splitext(path)[1].lower() in asset_extensions
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _is_cached(path):
+    """Checks whether the cached signature of a file is still valid
+
+    @param  path  Absolute path of the file that will be checked
+    @returns True if the file has a valid cached signature, False otherwise"""
+
+    try:
+        file_status = os.stat(path)
+    except OSError:
+        return True # Missing files aren't hashed, SCons will report them
+
+    with _signatures_lock:
+        cached_signature = _signatures.get(path)
+
+    file_key = shared.get_file_key(file_status)
+    return (cached_signature is not None) and (cached_signature[:3] == file_key)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_or_calculate_signature(path):
+    """Takes a file's signature from the cache or hashes the file if it changed
+
+    @param  path  Absolute path of the file whose content signature will be returned
+    @returns The content signature or None if the file doesn't exist"""
+
+    try:
+        file_status = os.stat(path)
+    except OSError:
+        return None
+
+    return shared.get_or_calculate_file_digest(
+        path, file_status, _load_cached_signature, _store_signature, _calculate_signature
+    )
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _load_cached_signature(path, file_key):
+    """Looks up the signature cached for a file
+
+    @param  path      Absolute path of the file whose signature will be looked up
+    @param  file_key  Size, modification time and inode the file has now
+    @returns The cached signature or None if the file changed since it was hashed"""
+
+    with _signatures_lock:
+        cached_signature = _signatures.get(path)
+
+    if (cached_signature is None) or (cached_signature[:3] != file_key):
+        return None
+
+    return cached_signature[3]
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _store_signature(path, file_key, signature):
+    """Caches the signature of a file
+
+    @param  path       Absolute path of the file whose signature will be cached
+    @param  file_key   Size, modification time and inode the file had when it was hashed
+    @param  signature  Content signature of the file"""
+
+    global _signatures_changed
+
+    with _signatures_lock:
+        _signatures[path] = file_key + (signature,)
+        _signatures_changed = True
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _calculate_signature(path, size):
+    """Hashes the contents of a file the way SCons does for its content signatures
+
+    @param  path  Path of the file that will be hashed
+    @param  size  Size of the file in bytes
+    @returns The content signature of the file
+    @remarks
+        Python's hash functions release the interpreter lock while hashing larger
+        blocks, so several files can be hashed in parallel by threads."""
+
+    hash_object = hashlib.new(SCons.Util.get_current_hash_algorithm_used())
+
+    with open(path, 'rb') as asset_file:
+        if size <= _block_size:
+            hash_object.update(asset_file.read())
+        else:
+            with mmap.mmap(asset_file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+                with memoryview(data) as contents:
+                    for offset in range(0, len(contents), _block_size):
+                        hash_object.update(contents[offset:offset + _block_size])
+
+    return hash_object.hexdigest()
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _load_signatures():
+    """Loads the signatures cached by earlier builds
+
+    @returns The cached signatures or an empty dictionary if there are none"""
+
+    # Signatures calculated with another hash algorithm (--hash-format) are useless
+    signatures = shared.load_pickled(
+        _signatures_path, SCons.Util.get_current_hash_algorithm_used()
+    )
+    if signatures is None:
+        return {}
+
+    return signatures
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _save_signatures():
+    """Persists the cached signatures if they were changed during the build"""
+
+    if not _signatures_changed:
+        return
+
+    with _signatures_lock:
+        existing_signatures = {
+            path: signature for path, signature in _signatures.items() if os.path.isfile(path)
+        }
+        shared.save_pickled(
+            _signatures_path, SCons.Util.get_current_hash_algorithm_used(), existing_signatures
+        )
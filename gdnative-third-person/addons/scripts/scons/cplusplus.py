@@ -6,11 +6,61 @@ import platform
 import subprocess
 import re
 import types
+import json
+import importlib
+import mmap
+import struct
+import time
+
+from SCons.Action import Action
 
 """
 Helpers for building C/C++ projects with SCons
 """
 
+# Nuclex SCons libraries
+shared = importlib.import_module('shared')
+
+# ----------------------------------------------------------------------------------------------- #
+
+# Matches #include directives and captures the kind of brackets and the included file
+_include_directive_regex = re.compile(r'^\s*#\s*include\s*([<"])([^>"]+)[>"]', re.MULTILINE)
+
+# Fastest linker each compiler can use, keyed by compiler executable
+_fastest_linkers = {}
+
+# Names of the dynamic relocation types, keyed by ELF machine number
+_relocation_type_names = {
+    3: { # i386
+        1: 'R_386_32', 2: 'R_386_PC32', 5: 'R_386_COPY', 6: 'R_386_GLOB_DAT',
+        7: 'R_386_JMP_SLOT', 8: 'R_386_RELATIVE', 14: 'R_386_TLS_TPOFF',
+        35: 'R_386_TLS_DTPMOD32', 36: 'R_386_TLS_DTPOFF32', 42: 'R_386_IRELATIVE'
+    },
+    40: { # ARM
+        2: 'R_ARM_ABS32', 17: 'R_ARM_TLS_DTPMOD32', 18: 'R_ARM_TLS_DTPOFF32',
+        19: 'R_ARM_TLS_TPOFF32', 20: 'R_ARM_COPY', 21: 'R_ARM_GLOB_DAT',
+        22: 'R_ARM_JUMP_SLOT', 23: 'R_ARM_RELATIVE', 160: 'R_ARM_IRELATIVE'
+    },
+    62: { # x86-64
+        1: 'R_X86_64_64', 5: 'R_X86_64_COPY', 6: 'R_X86_64_GLOB_DAT',
+        7: 'R_X86_64_JUMP_SLOT', 8: 'R_X86_64_RELATIVE', 16: 'R_X86_64_DTPMOD64',
+        17: 'R_X86_64_DTPOFF64', 18: 'R_X86_64_TPOFF64', 36: 'R_X86_64_TLSDESC',
+        37: 'R_X86_64_IRELATIVE'
+    },
+    183: { # AArch64
+        257: 'R_AARCH64_ABS64', 1024: 'R_AARCH64_COPY', 1025: 'R_AARCH64_GLOB_DAT',
+        1026: 'R_AARCH64_JUMP_SLOT', 1027: 'R_AARCH64_RELATIVE',
+        1028: 'R_AARCH64_TLS_DTPMOD', 1029: 'R_AARCH64_TLS_DTPREL',
+        1030: 'R_AARCH64_TLS_TPREL', 1031: 'R_AARCH64_TLSDESC', 1032: 'R_AARCH64_IRELATIVE'
+    }
+}
+
+# Prefixes of mangled names for vtables, typeinfo, guard variables and thunks
+_special_mangled_name_regex = re.compile(r'^(?:T[VTIS]|G[VR]|Thn?\d+_|Tvn?\d+_n?\d+_|L)')
+
+# Number of entries kept in the history files of analyzed binaries
+_binary_history_length = 100
+
 # ----------------------------------------------------------------------------------------------- #
 
 def setup(environment):
@@ -22,6 +72,7 @@ def setup(environment):
     environment.AddMethod(_add_library_directory, "add_library_directory")
     environment.AddMethod(_add_library, "add_library")
     environment.AddMethod(_get_build_directory_name, "get_build_directory_name")
+    environment.AddMethod(_analyze_binary, "analyze_binary")
 
 # ----------------------------------------------------------------------------------------------- #
 
@@ -41,19 +92,7 @@ def enumerate_headers(header_directory, variant_directory = None):
         '.inc'
     ]
 
-    headers = []
-
-    # Form a list of all files in the input directories recursively.
-    for root, directory_names, file_names in os.walk(header_directory):
-        for file_name in file_names:
-            file_title, file_extension = os.path.splitext(file_name)
-            if file_extension and any(file_extension in s for s in source_file_extensions):
-                if variant_directory is None:
-                    headers.append(os.path.join(root, file_name))
-                else:
-                    headers.append(os.path.join(variant_directory, os.path.join(root, file_name)))
-
-    return headers
+    return shared.enumerate_files(header_directory, source_file_extensions, variant_directory)
 
 # ----------------------------------------------------------------------------------------------- #
 
@@ -73,19 +112,7 @@ def enumerate_sources(source_directory, variant_directory = None):
         '.inc'
     ]
 
-    sources = []
-
-    # Form a list of all files in the input directories recursively.
-    for root, directory_names, file_names in os.walk(source_directory):
-        for file_name in file_names:
-            file_title, file_extension = os.path.splitext(file_name)
-            if file_extension and any(file_extension in s for s in source_file_extensions):
-                if variant_directory is None:
-                    sources.append(os.path.join(root, file_name))
-                else:
-                    sources.append(os.path.join(variant_directory, os.path.join(root, file_name)))
-
-    return sources
+    return shared.enumerate_files(source_directory, source_file_extensions, variant_directory)
 
 # ----------------------------------------------------------------------------------------------- #
 
@@ -289,6 +316,259 @@ def get_compiler_version(environment):
 
 # ----------------------------------------------------------------------------------------------- #
 
+def find_fastest_linker(environment):
+    """Looks for the fastest linker the C/C++ compiler can be told to use
+
+    @param  environment  Environment from which the C/C++ compiler executable will be looked up
+    @returns The name of the linker to pass to -fuse-ld= (mold, lld, gold or bfd) or
+             None if no linker could be used via -fuse-ld=
+    @remarks
+        Each linker is tried by letting the compiler ask it for its version, so linkers
+        that are installed but not supported by the compiler version will be skipped."""
+
+    compiler_executable = None
+
+    if 'CXX' in environment:
+        compiler_executable = environment['CXX']
+        if compiler_executable == "$CC":
+            compiler_executable = environment['CC']
+    elif 'CC' in environment:
+        compiler_executable = environment['CC']
+    else:
+        raise FileNotFoundError('No C/C++ compiler found')
+
+    if compiler_executable in _fastest_linkers:
+        return _fastest_linkers[compiler_executable]
+
+    fastest_linker = None
+    for linker in [ 'mold', 'lld', 'gold', 'bfd' ]:
+        try:
+            linker_process = subprocess.Popen(
+                [ compiler_executable, '-fuse-ld=' + linker, '-Wl,--version' ],
+                stdout = subprocess.DEVNULL,
+                stderr = subprocess.DEVNULL
+            )
+            linker_process.communicate()
+        except OSError:
+            break # Compiler not found, it won't be able to use any linker
+
+        if linker_process.returncode == 0:
+            fastest_linker = linker
+            break
+
+    _fastest_linkers[compiler_executable] = fastest_linker
+    return fastest_linker
+
+# ----------------------------------------------------------------------------------------------- #
+
+def get_compiler_fingerprint(environment):
+    """Forms a string that identifies the exact C/C++ compiler binary being used
+
+    @param  environment  Environment from which the C/C++ compiler executable will be looked up
+    @returns A string that changes whenever the compiler is replaced or updated
+    @remarks
+        This is meant for caches that store compiled code across builds. Unlike
+        get_compiler_version(), it also tells apart different builds of the same
+        compiler version (i.e. after a distribution update of the compiler package)."""
+
+    compiler_executable = None
+
+    if 'CXX' in environment:
+        compiler_executable = environment['CXX']
+        if compiler_executable == "$CC":
+            compiler_executable = environment['CC']
+    elif 'CC' in environment:
+        compiler_executable = environment['CC']
+    else:
+        raise FileNotFoundError('No C/C++ compiler found')
+
+    compiler_path = environment.WhereIs(compiler_executable)
+    if compiler_path is None:
+        compiler_path = compiler_executable
+    else:
+        compiler_path = os.path.realpath(compiler_path)
+
+    fingerprint = compiler_path + ';' + '.'.join(get_compiler_version(environment) or [])
+    if os.path.isfile(compiler_path):
+        compiler_status = os.stat(compiler_path)
+        fingerprint += ';' + str(compiler_status.st_size) + ';' + str(compiler_status.st_mtime)
+
+    return fingerprint
+
+# ----------------------------------------------------------------------------------------------- #
+
+def find_frequently_included_headers(source_paths, include_directories, minimum_share = 0.5):
+    """Looks for the headers that most of the specified source files include
+
+    @param  source_paths         Absolute paths of the source files that will be checked
+    @param  include_directories  Absolute paths of the directories searched for includes
+    @param  minimum_share        Share of the source files that need to include a header
+    @returns The absolute paths of the headers, in the order they were first included,
+             or names in angle brackets for headers not found in the include directories
+    @remarks
+        Headers pulled in through other frequently included headers are left out,
+        so the result only lists the headers a prefix header would need to include.
+
+        This only does a quick textual scan for #include directives and treats
+        headers included under some #if conditions as always included."""
+
+    direct_includes = {}
+    header_counts = {}
+    headers_in_order = []
+
+    for source_path in source_paths:
+        included_headers = _collect_included_headers(
+            source_path, include_directories, direct_includes
+        )
+        for included_header in included_headers:
+            if included_header not in header_counts:
+                header_counts[included_header] = 0
+                headers_in_order.append(included_header)
+
+            header_counts[included_header] += 1
+
+    minimum_count = max(1, minimum_share * len(source_paths))
+    frequent_headers = [
+        header for header in headers_in_order if header_counts[header] >= minimum_count
+    ]
+
+    # Drop headers that will already be included through another frequent header
+    covered_headers = set()
+    for frequent_header in frequent_headers:
+        if os.path.isabs(frequent_header):
+            included_headers = _collect_included_headers(
+                frequent_header, include_directories, direct_includes
+            )
+            covered_headers.update(included_headers)
+
+    return [header for header in frequent_headers if header not in covered_headers]
+
+# ----------------------------------------------------------------------------------------------- #
+
+def read_dependency_file(dependency_file_path):
+    """Reads the files a source file depended on from a compiler-written dependency file
+
+    @param  dependency_file_path  Path of a make-style .d file written by GCC or clang
+                                  (-MD/-MMD) or of a .json file written by MSVC
+                                  (/sourceDependencies)
+    @returns The paths of the source file and of all headers it included"""
+
+    with open(dependency_file_path, 'r', errors = 'replace') as dependency_file:
+        contents = dependency_file.read()
+
+    if dependency_file_path.endswith('.json'):
+        data = json.loads(contents)['Data']
+        return [ data['Source'] ] + data.get('Includes', [])
+
+    # Make-style rule, only the first rule is of interest (-MP adds more after it)
+    contents = contents.replace('\\\r\n', ' ').replace('\\\n', ' ')
+    rule_separator = re.search(r':(?=\s|$)', contents)
+    if rule_separator is None:
+        return []
+
+    dependencies = contents[rule_separator.end():].split('\n', 1)[0]
+
+    dependency_paths = []
+    for dependency in re.split(r'(?<!\\)\s+', dependencies.strip()):
+        if len(dependency) > 0:
+            dependency_paths.append(
+                dependency.replace('\\ ', ' ').replace('\\#', '#').replace('$$', '$')
+            )
+
+    return dependency_paths
+
+# ----------------------------------------------------------------------------------------------- #
+
+def read_binary_statistics(binary_path):
+    """Reads the size and load cost figures of an ELF shared library or executable
+
+    @param  binary_path  Path of the ELF file that will be analyzed
+    @returns A dictionary with the file size ('file_size'), the number of bytes mapped
+             into memory ('load_size'), lists of (name, size) tuples for the sections
+             ('sections') and the defined symbols ('symbols'), the number of dynamic
+             relocations by type ('relocations'), the number of exported dynamic symbols
+             ('exported_symbols') and the number of static initializers
+             ('static_initializers')
+    @remarks
+        The file is read via mmap in pure Python, so this works without binutils.
+
+        Only dynamic relocations are counted since those are what the dynamic loader
+        has to process each time the binary is loaded. Static initializers are the
+        entries in .init_array, usually one per translation unit with global
+        constructors plus one from the C runtime."""
+
+    with open(binary_path, 'rb') as binary_file:
+        with mmap.mmap(binary_file.fileno(), 0, access = mmap.ACCESS_READ) as data:
+            return _read_elf_statistics(data)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _collect_included_headers(file_path, include_directories, direct_includes):
+    """Collects all headers a source file includes, directly or indirectly
+
+    @param  file_path            Absolute path of the source file that will be scanned
+    @param  include_directories  Absolute paths of the directories searched for includes
+    @param  direct_includes      Dictionary caching the direct includes of each file
+    @returns A list of the included headers (not including the file itself)"""
+
+    included_headers = []
+    visited_files = set([ file_path ])
+    pending_files = [ file_path ]
+
+    while len(pending_files) > 0:
+        current_file_path = pending_files.pop(0)
+        if current_file_path not in direct_includes:
+            direct_includes[current_file_path] = _get_direct_includes(
+                current_file_path, include_directories
+            )
+
+        for included_header in direct_includes[current_file_path]:
+            if included_header not in visited_files:
+                visited_files.add(included_header)
+                included_headers.append(included_header)
+                if os.path.isabs(included_header):
+                    pending_files.append(included_header)
+
+    return included_headers
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_direct_includes(file_path, include_directories):
+    """Lists the headers a source file includes directly
+
+    @param  file_path            Absolute path of the source file that will be scanned
+    @param  include_directories  Absolute paths of the directories searched for includes
+    @returns The absolute paths of the included headers (names in angle brackets for
+             headers not found in the include directories)"""
+
+    try:
+        with open(file_path, 'r', errors = 'replace') as source_file:
+            contents = source_file.read()
+    except OSError:
+        return []
+
+    included_headers = []
+    for bracket, header_name in _include_directive_regex.findall(contents):
+        candidate_directories = include_directories
+        if bracket == '"':
+            candidate_directories = [ os.path.dirname(file_path) ] + include_directories
+
+        header_path = None
+        for candidate_directory in candidate_directories:
+            candidate_path = os.path.normpath(os.path.join(candidate_directory, header_name))
+            if os.path.isfile(candidate_path):
+                header_path = candidate_path
+                break
+
+        if header_path is not None:
+            included_headers.append(header_path)
+        elif bracket == '<':
+            included_headers.append('<' + header_name + '>')
+
+    return included_headers
+
+# ----------------------------------------------------------------------------------------------- #
+
 def _get_build_directory_name(environment):
     """Determines the name of the build directory for the current compiler version
     and output settings (such as platform and whether it's a debug or release build)
@@ -413,3 +693,460 @@ def _add_library(environment, library_name):
         libMyAwesomeThing.so (the toolchain will automatically try the lib prefix, though)"""
 
     environment.Append(LIBS=[library_name])
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _analyze_binary(environment, binary, report_path = None):
+    """Writes a report on the size and load cost of a shared library or executable
+
+    @param  environment  Environment in which the analysis will run
+    @param  binary       ELF shared library or executable (path or build step) to analyze
+    @param  report_path  Text file the report will be written to (None = next to the binary)
+    @returns The build step that writes the report
+    @remarks
+        The figures of each analysis are added to a history file next to the report.
+        When the size or the number of dynamic relocations of the binary grew by more
+        than BINARY_GROWTH_THRESHOLD (a fraction, default 0.05) since the previous
+        analysis, a warning is printed. See read_binary_statistics() for the figures."""
+
+    binary_node = environment.arg2nodes(binary, environment.File)[0]
+    if report_path is None:
+        report_path = str(binary_node) + '.analysis.txt'
+
+    history_path = os.path.splitext(environment.File(report_path).abspath)[0] + '.history'
+
+    analysis = environment.Command(
+        source = binary_node,
+        action = Action(_write_binary_analysis, 'Analyzing size and load cost of $SOURCE'),
+        target = report_path,
+        BINARY_HISTORY_PATH = history_path,
+        PROFILE_CATEGORY = 'analyze_binary'
+    )
+
+    # The history needs to be updated, so the report can't come from the build cache
+    environment.NoCache(analysis)
+
+    return analysis
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _write_binary_analysis(target, source, env):
+    """Writes the size and load cost report and warns if the binary grew
+
+    @param  target  Text file the report will be written to
+    @param  source  ELF shared library or executable that will be analyzed
+    @param  env     Environment containing the history path and growth threshold"""
+
+    binary_path = os.path.abspath(str(source[0]))
+    binary_name = os.path.basename(binary_path)
+
+    try:
+        statistics = read_binary_statistics(binary_path)
+    except (ValueError, struct.error) as error:
+        print('Could not analyze ' + binary_path + ': ' + str(error))
+        return 1
+
+    with open(str(target[0]), 'w') as report_file:
+        report_file.write('\n'.join(_format_binary_statistics(binary_name, statistics)) + '\n')
+
+    summary = {
+        'time': int(time.time()),
+        'file_size': statistics['file_size'],
+        'load_size': statistics['load_size'],
+        'relocations': sum(statistics['relocations'].values()),
+        'exported_symbols': statistics['exported_symbols'],
+        'static_initializers': statistics['static_initializers']
+    }
+    _add_to_binary_history(
+        env['BINARY_HISTORY_PATH'], binary_name, summary,
+        float(env.get('BINARY_GROWTH_THRESHOLD', 0.05))
+    )
+
+    return 0
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _add_to_binary_history(history_path, binary_name, summary, threshold):
+    """Adds the figures of an analysis to the history and compares them with the last one
+
+    @param  history_path  Path of the JSON file holding the figures of earlier analyses
+    @param  binary_name   File name of the analyzed binary, used in the warning
+    @param  summary       Figures of the current analysis
+    @param  threshold     Fraction by which a figure can grow before a warning is printed"""
+
+    history = []
+    if os.path.isfile(history_path):
+        try:
+            with open(history_path, 'r') as history_file:
+                history = json.load(history_file)
+        except ValueError:
+            history = [] # Damaged history, start over
+
+    if len(history) > 0:
+        growths = []
+        for key, description in [
+            ('file_size', 'File size'),
+            ('load_size', 'Loaded size'),
+            ('relocations', 'Dynamic relocations')
+        ]:
+            previous_value = history[-1].get(key, 0)
+            if (previous_value > 0) and (summary[key] > previous_value * (1.0 + threshold)):
+                growth = float(summary[key] - previous_value) / previous_value
+                growths.append(
+                    '  \033[93m+' + '%.1f' % (growth * 100.0) + '%\033[0m  ' + description + ': ' +
+                    format(previous_value, ',') + ' -> ' + format(summary[key], ',')
+                )
+
+        if len(growths) > 0:
+            print(
+                'Warning: ' + binary_name + ' grew by more than ' +
+                str(threshold * 100.0) + '% since the previous build:'
+            )
+            print('\n'.join(growths))
+
+    history.append(summary)
+    with open(history_path, 'w') as history_file:
+        json.dump(history[-_binary_history_length:], history_file, indent = 1)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _format_binary_statistics(binary_name, statistics, entry_count = 20):
+    """Formats the figures of an analyzed binary as the lines of a text report
+
+    @param  binary_name  File name of the analyzed binary
+    @param  statistics   Figures returned by read_binary_statistics()
+    @param  entry_count  Number of scopes and symbols that will be listed
+    @returns The lines of the report"""
+
+    def format_line(number, text):
+        return '%14s  ' % format(number, ',') + text
+
+    lines = [
+        'Size and load cost of ' + binary_name,
+        '',
+        format_line(statistics['file_size'], 'bytes in the file'),
+        format_line(statistics['load_size'], 'bytes mapped into memory'),
+        format_line(statistics['exported_symbols'], 'exported dynamic symbols'),
+        format_line(statistics['static_initializers'], 'static initializers (.init_array)'),
+        '',
+        'Sections:'
+    ]
+    for name, size in statistics['sections']:
+        lines.append(format_line(size, name))
+
+    # Group the symbols by the outermost namespace or class they belong to
+    scopes = {}
+    for name, size in statistics['symbols']:
+        scope = _get_symbol_scope(name)
+        scope_size, scope_symbol_count = scopes.get(scope, (0, 0))
+        scopes[scope] = (scope_size + size, scope_symbol_count + 1)
+
+    lines.append('')
+    lines.append('Largest namespaces and classes:')
+    if len(statistics['symbols']) == 0:
+        lines.append('  (no symbol table, the binary is stripped)')
+    largest_scopes = sorted(scopes.items(), key = lambda item: -item[1][0])[:entry_count]
+    for scope, (size, symbol_count) in largest_scopes:
+        lines.append(format_line(size, scope + ' (' + str(symbol_count) + ' symbols)'))
+
+    lines.append('')
+    lines.append('Largest symbols:')
+    largest_symbols = statistics['symbols'][:entry_count]
+    demangled_names = _demangle_symbol_names([ name for name, size in largest_symbols ])
+    for (name, size), demangled_name in zip(largest_symbols, demangled_names):
+        lines.append(format_line(size, demangled_name))
+
+    lines.append('')
+    lines.append('Dynamic relocations:')
+    relocations = sorted(statistics['relocations'].items(), key = lambda item: -item[1])
+    for type_name, count in relocations:
+        lines.append(format_line(count, type_name))
+    lines.append(format_line(sum(statistics['relocations'].values()), 'total'))
+
+    return lines
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_symbol_scope(symbol_name):
+    """Determines the outermost namespace or class of a symbol from its mangled name
+
+    @param  symbol_name  Symbol name as mangled by the Itanium C++ ABI (GCC, clang)
+    @returns The name of the outermost namespace or class, '(global)' for C symbols
+             and symbols in the global namespace"""
+
+    if not symbol_name.startswith('_Z'):
+        return '(global)'
+
+    # Vtables, typeinfo, guard variables and static locals belong to what they describe
+    name = symbol_name[2:]
+    while True:
+        special_prefix = _special_mangled_name_regex.match(name)
+        if special_prefix is not None:
+            name = name[special_prefix.end():]
+        elif name.startswith('Z'):
+            name = name[1:] # Entity local to a function, continues with the function's name
+        else:
+            break
+
+    if name.startswith('St'):
+        return 'std'
+    if not name.startswith('N'):
+        return '(global)'
+
+    # Nested name, skip the qualifiers of member functions
+    name = name[1:].lstrip('rVKRO')
+    if name.startswith('S'):
+        return 'std' # Abbreviations such as Sa (std::allocator) or Ss (std::string)
+
+    length = re.match(r'\d+', name)
+    if length is None:
+        return '(global)'
+
+    identifier = name[length.end():length.end() + int(length.group())]
+    if identifier.startswith('_GLOBAL__N'):
+        return '(anonymous namespace)'
+
+    return identifier
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _demangle_symbol_names(symbol_names):
+    """Turns mangled C++ symbol names into readable ones via c++filt if it is installed
+
+    @param  symbol_names  Symbol names that will be demangled
+    @returns The demangled symbol names or the original names if c++filt isn't available"""
+
+    demangler_path = shutil.which('c++filt')
+    if (demangler_path is None) or (len(symbol_names) == 0):
+        return symbol_names
+
+    try:
+        demangler_process = subprocess.Popen(
+            [ demangler_path ],
+            stdin = subprocess.PIPE,
+            stdout = subprocess.PIPE,
+            stderr = subprocess.DEVNULL,
+            universal_newlines = True
+        )
+        output, errors = demangler_process.communicate('\n'.join(symbol_names) + '\n')
+    except OSError:
+        return symbol_names
+
+    demangled_names = output.split('\n')[:len(symbol_names)]
+    if (demangler_process.returncode != 0) or (len(demangled_names) != len(symbol_names)):
+        return symbol_names
+
+    return demangled_names
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _read_elf_statistics(data):
+    """Reads the size and load cost figures from the contents of an ELF file
+
+    @param  data  Memory-mapped contents of the ELF file
+    @returns The figures as described in read_binary_statistics()"""
+
+    if (len(data) < 52) or (data[0:4] != b'\x7fELF'):
+        raise ValueError('Not an ELF file')
+
+    is_64_bit = (data[4] == 2)
+    byte_order = '<' if (data[5] == 1) else '>'
+    pointer_size = 8 if is_64_bit else 4
+
+    if is_64_bit:
+        header_format = byte_order + 'HHIQQQIHHHHHH'
+        section_format = byte_order + 'IIQQQQIIQQ'
+    else:
+        header_format = byte_order + 'HHIIIIIHHHHHH'
+        section_format = byte_order + 'IIIIIIIIII'
+
+    header = struct.unpack_from(header_format, data, 16)
+    machine = header[1]
+    section_table_offset = header[5]
+    section_header_size = header[10]
+    section_count = header[11]
+    section_names_index = header[12]
+
+    # Section headers: (name, type, flags, address, offset, size, link, info, ...)
+    sections = []
+    if section_table_offset > 0:
+        first_section = struct.unpack_from(section_format, data, section_table_offset)
+        if section_count == 0:
+            section_count = first_section[5] # Too many sections, count stored here
+        if section_names_index == 0xffff:
+            section_names_index = first_section[6]
+
+        for index in range(section_count):
+            sections.append(
+                struct.unpack_from(
+                    section_format, data, section_table_offset + index * section_header_size
+                )
+            )
+
+    section_names = []
+    for section in sections:
+        if section_names_index < len(sections):
+            section_names.append(
+                _read_elf_string(data, sections[section_names_index][4] + section[0])
+            )
+        else:
+            section_names.append('')
+
+    statistics = {
+        'file_size': len(data),
+        'load_size': 0,
+        'sections': [],
+        'symbols': [],
+        'relocations': {},
+        'exported_symbols': 0,
+        'static_initializers': 0
+    }
+
+    symbol_table = None
+    dynamic_symbol_table = None
+    for section, name in zip(sections, section_names):
+        section_type, flags, offset, size = section[1], section[2], section[4], section[5]
+        if section_type == 0: # SHT_NULL
+            continue
+
+        statistics['sections'].append((name, size))
+        if flags & 0x2: # SHF_ALLOC
+            statistics['load_size'] += size
+
+        if section_type == 2: # SHT_SYMTAB
+            symbol_table = section
+        elif section_type == 11: # SHT_DYNSYM
+            dynamic_symbol_table = section
+        elif section_type == 14: # SHT_INIT_ARRAY
+            statistics['static_initializers'] += size // pointer_size
+        elif (section_type in (4, 9, 19)) and (flags & 0x2): # SHT_RELA, SHT_REL, SHT_RELR
+            _count_elf_relocations(
+                data[offset:offset + size], section_type, is_64_bit, byte_order, machine,
+                statistics['relocations']
+            )
+
+    statistics['sections'].sort(key = lambda section: -section[1])
+
+    if dynamic_symbol_table is not None:
+        dynamic_symbols = _read_elf_symbols(
+            data, dynamic_symbol_table, sections, is_64_bit, byte_order
+        )
+        for symbol in dynamic_symbols:
+            name, info, other, section_index = symbol[0], symbol[1], symbol[2], symbol[3]
+            is_global = (info >> 4) in (1, 2, 10) # STB_GLOBAL, STB_WEAK, STB_GNU_UNIQUE
+            is_visible = (other & 0x3) in (0, 3) # STV_DEFAULT, STV_PROTECTED
+            if (section_index != 0) and (len(name) > 0) and is_global and is_visible:
+                statistics['exported_symbols'] += 1
+
+    # The full symbol table is gone from stripped binaries, the dynamic one still has
+    # the exported symbols at least
+    if symbol_table is None:
+        symbol_table = dynamic_symbol_table
+    if symbol_table is not None:
+        symbol_addresses = set()
+        symbols = _read_elf_symbols(data, symbol_table, sections, is_64_bit, byte_order)
+        for name, info, other, section_index, value, size in symbols:
+            if (size == 0) or (section_index == 0) or (section_index >= 0xff00):
+                continue
+            if (info & 0xf) not in (1, 2, 6, 10): # Object, function, TLS or indirect function
+                continue
+
+            # Constructors and destructors are often emitted as aliases of each other
+            address = (section_index, value, size)
+            if address not in symbol_addresses:
+                symbol_addresses.add(address)
+                statistics['symbols'].append((name, size))
+
+        statistics['symbols'].sort(key = lambda symbol: -symbol[1])
+
+    return statistics
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _read_elf_symbols(data, symbol_table, sections, is_64_bit, byte_order):
+    """Reads the symbols from a symbol table in an ELF file
+
+    @param  data          Memory-mapped contents of the ELF file
+    @param  symbol_table  Section header of the symbol table
+    @param  sections      Section headers of all sections in the ELF file
+    @param  is_64_bit     Whether the ELF file uses the 64 bit format
+    @param  byte_order    Byte order character for the struct module
+    @returns A list of (name, info, other, section index, value, size) tuples"""
+
+    string_table_offset = sections[symbol_table[6]][4]
+    table_offset, table_size = symbol_table[4], symbol_table[5]
+    table = data[table_offset:table_offset + table_size]
+
+    symbols = []
+    if is_64_bit:
+        symbol_entries = struct.iter_unpack(byte_order + 'IBBHQQ', table)
+        for name_offset, info, other, section_index, value, size in symbol_entries:
+            symbols.append(
+                (
+                    _read_elf_string(data, string_table_offset + name_offset),
+                    info, other, section_index, value, size
+                )
+            )
+    else:
+        symbol_entries = struct.iter_unpack(byte_order + 'IIIBBH', table)
+        for name_offset, value, size, info, other, section_index in symbol_entries:
+            symbols.append(
+                (
+                    _read_elf_string(data, string_table_offset + name_offset),
+                    info, other, section_index, value, size
+                )
+            )
+
+    return symbols
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _count_elf_relocations(entries, section_type, is_64_bit, byte_order, machine, counts):
+    """Counts the relocations in a relocation section of an ELF file by their type
+
+    @param  entries       Contents of the relocation section
+    @param  section_type  Type of the relocation section (SHT_RELA, SHT_REL or SHT_RELR)
+    @param  is_64_bit     Whether the ELF file uses the 64 bit format
+    @param  byte_order    Byte order character for the struct module
+    @param  machine       ELF machine number, selects the names of the relocation types
+    @param  counts        Dictionary in which the relocations will be counted by type name"""
+
+    word_format = 'Q' if is_64_bit else 'I'
+
+    # Packed relative relocations, each odd entry is a bitmap of the following words
+    if section_type == 19:
+        count = 0
+        for (entry,) in struct.iter_unpack(byte_order + word_format, entries):
+            if entry & 1:
+                count += bin(entry >> 1).count('1')
+            else:
+                count += 1
+
+        counts['RELR (packed relative)'] = counts.get('RELR (packed relative)', 0) + count
+        return
+
+    entry_format = word_format * 3 if (section_type == 4) else word_format * 2
+    type_names = _relocation_type_names.get(machine, {})
+    for entry in struct.iter_unpack(byte_order + entry_format, entries):
+        if is_64_bit:
+            relocation_type = entry[1] & 0xffffffff
+        else:
+            relocation_type = entry[1] & 0xff
+
+        type_name = type_names.get(relocation_type, 'type ' + str(relocation_type))
+        counts[type_name] = counts.get(type_name, 0) + 1
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _read_elf_string(data, offset):
+    """Reads a zero-terminated string from an ELF string table
+
+    @param  data    Memory-mapped contents of the ELF file
+    @param  offset  Offset of the string in the file
+    @returns The string"""
+
+    end = data.find(b'\0', offset)
+    if end == -1:
+        end = len(data)
+
+    return data[offset:end].decode('utf-8', 'replace')
@@ -3,9 +3,13 @@
 import os
 import shutil
 import platform
+import importlib
 import xml.etree.ElementTree as ET
 from SCons.Script import Scanner
 
+# Nuclex SCons libraries
+shared = importlib.import_module('shared')
+
 # ----------------------------------------------------------------------------------------------- #
 
 # Paths in which the 32 bit version of MSBuild can be found on Windows systems
@@ -83,19 +87,7 @@ def enumerate_sources(source_directory, variant_directory = None):
         '.vb'
     ]
 
-    sources = []
-
-    # Form a list of all files in the input directories recursively.
-    for root, directory_names, file_names in os.walk(source_directory):
-        for file_name in file_names:
-            file_title, file_extension = os.path.splitext(file_name)
-            if file_extension and any(file_extension in s for s in source_file_extensions):
-                if variant_directory is None:
-                    sources.append(os.path.join(root, file_name))
-                else:
-                    sources.append(os.path.join(variant_directory, os.path.join(root, file_name)))
-
-    return sources
+    return shared.enumerate_files(source_directory, source_file_extensions, variant_directory)
 
 # ----------------------------------------------------------------------------------------------- #
 
@@ -279,7 +271,8 @@ def _call_msbuild(environment, msbuild_project_path, output_directory):
     return environment.Command(
         source = msbuild_project_file,
         action = '"' + msbuild_executable + '" $SOURCE' + extra_arguments,
-        target = outputs
+        target = outputs,
+        PROFILE_CATEGORY = 'MSBuild'
     )
 
 # ----------------------------------------------------------------------------------------------- #
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+# Purpose:
+#   Generates the Godot-CPP bindings (the C++ wrapper classes for all classes
+#   listed in Godot's api.json) without compiling anything.
+#
+#   Godot-CPP's own SConstruct can only generate the bindings as part of
+#   a full build of the library. Running the binding generator as its own
+#   build step lets SCons know exactly which files are produced by it.
+#
+# Usage:
+#   Invoke this script with the system's Python interpreter:
+#
+#   python godot-cpp-generate-bindings.py addons/godot-cpp api.json
+#
+#   - The first argument (addons/godot-cpp) is the directory into which
+#     Godot-CPP has been checked out
+#
+#   - The second argument (api.json) is the path of the api.json file
+#     exported by Godot for which the bindings will be generated
+#
+#   - The third argument and further (optional) are the names of the classes
+#     bindings will be generated for. If none are given, bindings for all
+#     classes in the api.json will be generated.
+#
+#   Generated files of classes that are not (or no longer) generated will be
+#   deleted, so they won't be picked up when compiling Godot-CPP.
+#
+#   The bindings are generated into a scratch directory first and only those
+#   files whose contents changed are copied over. So when switching to a new
+#   Godot release, only the wrappers of classes whose API changed will be
+#   touched (and recompiled).
+#
+import sys
+import os
+import importlib
+import inspect
+import json
+import tempfile
+import shutil
+import filecmp
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _main():
+    """Runs Godot-CPP's binding generator"""
+
+    godot_cpp_directory = os.path.abspath(sys.argv[1])
+    api_json_path = os.path.abspath(sys.argv[2])
+
+    print('Godot-CPP directory: \033[94m' + godot_cpp_directory + '\033[0m')
+    print('API description: \033[94m' + api_json_path + '\033[0m')
+
+    # The binding generator imports its helpers from the Godot-CPP directory
+    sys.path.insert(0, godot_cpp_directory)
+    binding_generator = importlib.import_module('binding_generator')
+
+    with open(api_json_path, 'r') as api_json_file:
+        classes = json.load(api_json_file)
+
+    # If only some classes are wanted, run the generator on a trimmed api.json
+    class_names = sys.argv[3:]
+    if len(class_names) > 0:
+        classes = [godot_class for godot_class in classes if godot_class['name'] in class_names]
+        print('Generating bindings for \033[94m' + str(len(classes)) + '\033[0m classes')
+
+    # The binding generator writes its outputs relative to the working directory,
+    # so we let it run in a scratch directory and pick the changed files from there
+    scratch_directory = tempfile.mkdtemp(prefix = 'godot-cpp-bindings-')
+    try:
+        os.chdir(scratch_directory)
+        _create_directory_if_missing(os.path.join('include', 'gen'))
+        _create_directory_if_missing(os.path.join('src', 'gen'))
+
+        if len(class_names) > 0:
+            trimmed_api_json_path = os.path.join(scratch_directory, 'api.json')
+            with open(trimmed_api_json_path, 'w') as trimmed_api_json_file:
+                json.dump(classes, trimmed_api_json_file)
+
+            _run_binding_generator(binding_generator, trimmed_api_json_path)
+        else:
+            _run_binding_generator(binding_generator, api_json_path)
+
+        os.chdir(godot_cpp_directory)
+        _create_directory_if_missing(os.path.join('include', 'gen'))
+        _create_directory_if_missing(os.path.join('src', 'gen'))
+
+        _copy_changed_generated_files(scratch_directory)
+    finally:
+        os.chdir(godot_cpp_directory)
+        shutil.rmtree(scratch_directory, ignore_errors = True)
+
+    _delete_stale_generated_files(classes)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _run_binding_generator(binding_generator, api_json_path):
+    """Calls the generate_bindings() method of Godot-CPP's binding generator
+
+    @param  binding_generator  Binding generator module from the Godot-CPP directory
+    @param  api_json_path      Path of the api.json file the bindings will be generated for
+    @remarks
+        Older versions of Godot-CPP only take the path to the api.json while newer
+        ones also want to know whether to generate the templated get_node() method."""
+
+    parameters = inspect.signature(binding_generator.generate_bindings).parameters
+    if len(parameters) >= 2:
+        binding_generator.generate_bindings(api_json_path, False)
+    else:
+        binding_generator.generate_bindings(api_json_path)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _copy_changed_generated_files(scratch_directory):
+    """Copies generated files from the scratch directory if they differ from
+    the files already present in the Godot-CPP directory
+
+    @param  scratch_directory  Directory the binding generator has been run in
+    @remarks
+        Files whose contents did not change are left untouched, keeping their
+        modification times, so the wrappers of classes whose API did not change
+        will not be compiled again."""
+
+    changed_file_count = 0
+    unchanged_file_count = 0
+
+    for directory in [ os.path.join('include', 'gen'), os.path.join('src', 'gen') ]:
+        for file_name in sorted(os.listdir(os.path.join(scratch_directory, directory))):
+            generated_path = os.path.join(scratch_directory, directory, file_name)
+            existing_path = os.path.join(directory, file_name)
+
+            if os.path.isfile(existing_path):
+                if filecmp.cmp(generated_path, existing_path, shallow = False):
+                    unchanged_file_count += 1
+                    continue
+
+                print('Updating \033[94m' + existing_path + '\033[0m')
+
+            shutil.copyfile(generated_path, existing_path)
+            changed_file_count += 1
+
+    print(
+        'Wrote \033[94m' + str(changed_file_count) + '\033[0m changed files, ' +
+        'kept \033[94m' + str(unchanged_file_count) + '\033[0m unchanged files'
+    )
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _delete_stale_generated_files(classes):
+    """Deletes generated headers and sources that don't belong to any of the classes
+
+    @param  classes  Classes for which bindings have been generated"""
+
+    expected_file_titles = set([ '__icalls', '__init_method_bindings', '__register_types' ])
+    for godot_class in classes:
+        expected_file_titles.add(_strip_class_name(godot_class['name']))
+
+    generated_directories = [
+        (os.path.join('include', 'gen'), '.hpp'),
+        (os.path.join('src', 'gen'), '.cpp')
+    ]
+
+    for directory, extension in generated_directories:
+        for file_name in os.listdir(directory):
+            file_title, file_extension = os.path.splitext(file_name)
+            if (file_extension == extension) and (file_title not in expected_file_titles):
+                print('Deleting stale \033[94m' + os.path.join(directory, file_name) + '\033[0m')
+                os.remove(os.path.join(directory, file_name))
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _strip_class_name(class_name):
+    """Strips the leading underscore Godot uses for some classes' internal names
+
+    @param  class_name  Name of the class as listed in the api.json
+    @returns The name the class and its generated files have in Godot-CPP"""
+
+    if class_name.startswith('_'):
+        return class_name[1:]
+    else:
+        return class_name
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _create_directory_if_missing(directory):
+    """Creates a directory unless it already exists
+
+    @param  directory  Directory that will be created"""
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+# ----------------------------------------------------------------------------------------------- #
+
+print(str())
+print("godot-cpp-generate-bindings.py running...")
+print('\033[95m===============================================================================\033[0m')
+
+_main()
+
+print('\033[95m===============================================================================\033[0m')
+print(str())
@@ -5,10 +5,30 @@ import importlib
 import os
 import platform
 import errno
+import json
+import re
+import hashlib
+import shutil
+import subprocess
+import tempfile
 from SCons.Script import Configure
 
+# Nuclex SCons libraries
+shared = importlib.import_module('shared')
+cplusplus = importlib.import_module('cplusplus')
+
 # ----------------------------------------------------------------------------------------------- #
 
+# Matches #include directives and captures the name of the included file
+_include_directive_regex = re.compile(r'^\s*#\s*include\s*[<"]([^>"]+)[>"]', re.MULTILINE)
+
+# Default size limit for the machine-wide cache of prebuilt Godot-CPP libraries
+_default_maximum_cache_size = 2 * 1024 * 1024 * 1024
+
+# Directory this script is in. Resolved on import because SCons changes the working
+# directory while reading nested SConstruct/SConscript files.
+_own_directory = os.path.dirname(os.path.abspath(__file__))
+
 # Subset of the files in the godot_headers submodule, to verify that it has been
 # downloaded from Git. Forgetting --recurse-submodules in the checkout command is
 # a popular mistake :)
@@ -88,11 +108,141 @@ def generate_gdnative_api_json(environment, godot_cpp_directory):
 
 # ----------------------------------------------------------------------------------------------- #
 
-def compile(environment, godot_cpp_directory):
+def enumerate_generated_files(
+    godot_cpp_directory, headers = True, sources = True, class_names = None
+):
+    """Lists the files Godot-CPP's binding generator will produce from the api.json
+
+    @param  godot_cpp_directory  Directory holding the Godot-CPP library
+    @param  headers              Whether to include the generated headers in the list
+    @param  sources              Whether to include the generated sources in the list
+    @param  class_names          Classes bindings will be generated for (None = all)
+    @returns A list of the generated files or None if the api.json does not exist (yet)
+    @remarks
+        This mirrors the naming used in Godot-CPP's binding_generator.py: a header and
+        a source file per class (with leading underscores stripped) plus the header
+        holding the icalls, the method binding initializer and the type registry."""
+
+    classes = _load_api_json(godot_cpp_directory)
+    if classes is None:
+        return None
+
+    generated_headers_directory = os.path.join(godot_cpp_directory, 'include', 'gen')
+    generated_sources_directory = os.path.join(godot_cpp_directory, 'src', 'gen')
+
+    generated_files = []
+
+    for godot_class in classes:
+        if (class_names is not None) and (godot_class['name'] not in class_names):
+            continue
+
+        class_name = _strip_class_name(godot_class['name'])
+        if headers:
+            generated_files.append(os.path.join(generated_headers_directory, class_name + '.hpp'))
+        if sources:
+            generated_files.append(os.path.join(generated_sources_directory, class_name + '.cpp'))
+
+    if headers:
+        generated_files.append(os.path.join(generated_headers_directory, '__icalls.hpp'))
+    if sources:
+        generated_files.append(os.path.join(generated_sources_directory, '__init_method_bindings.cpp'))
+        generated_files.append(os.path.join(generated_sources_directory, '__register_types.cpp'))
+
+    return generated_files
+
+# ----------------------------------------------------------------------------------------------- #
+
+def generate_bindings(
+    environment, godot_cpp_directory, used_by = None, required_classes = None
+):
+    """Generates the C++ wrappers for the Godot classes listed in the api.json
+
+    @param  environment          Environment used to run the binding generator
+    @param  godot_cpp_directory  Directory holding the Godot-CPP library
+    @param  used_by              Source directories whose includes decide which classes
+                                 bindings are generated for (None = all classes)
+    @param  required_classes     Additional classes to generate bindings for when
+                                 only the classes in use are generated
+    @returns The generated headers and sources or None if the api.json does not exist yet
+    @remarks
+        Because each generated file is a declared target, SCons knows which build step
+        produces the headers included by Godot-CPP and by the game's own sources,
+        so those can start compiling as soon as the headers are in place.
+
+        When only generating the classes in use, Godot-CPP will not know the classes
+        left out. Casting an object whose actual class was left out (for example
+        a MeshInstance found via get_node()) to one of its base classes will then
+        fail, so list such classes in required_classes."""
+
+    class_names = None
+    if used_by is not None:
+        class_names = find_required_classes(godot_cpp_directory, used_by, required_classes)
+
+    return _generate_bindings_for_classes(environment, godot_cpp_directory, class_names)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def find_required_classes(godot_cpp_directory, source_directories, required_classes = None):
+    """Determines the Godot classes whose bindings are needed by a set of sources
+
+    @param  godot_cpp_directory  Directory holding the Godot-CPP library
+    @param  source_directories   Directories whose sources will be scanned for includes
+    @param  required_classes     Additional classes that will always be included
+    @returns The names (as listed in the api.json) of all classes that are required
+    @remarks
+        Classes whose generated headers are included by the sources or by Godot-CPP's
+        core are required, as are their base classes and any classes appearing in
+        the signatures of their methods (because the generated wrappers include those)."""
+
+    classes = _load_api_json(godot_cpp_directory)
+    if classes is None:
+        return None
+
+    classes_by_name = {}
+    for godot_class in classes:
+        classes_by_name[godot_class['name']] = godot_class
+        classes_by_name[_strip_class_name(godot_class['name'])] = godot_class
+
+    # Godot-CPP's own core sources use some of the generated classes, too
+    scanned_directories = [
+        os.path.join(godot_cpp_directory, 'include', 'core'),
+        os.path.join(godot_cpp_directory, 'src', 'core')
+    ]
+    scanned_directories.extend(source_directories)
+
+    pending_class_names = []
+    if required_classes is not None:
+        pending_class_names.extend(required_classes)
+
+    for directory in scanned_directories:
+        file_paths = cplusplus.enumerate_headers(directory) + cplusplus.enumerate_sources(directory)
+        for file_path in file_paths:
+            for included_file in _get_included_files(file_path):
+                class_name, extension = os.path.splitext(os.path.basename(included_file))
+                if extension == '.hpp':
+                    pending_class_names.append(class_name)
+
+    # Form the transitive closure over base classes and method signatures
+    required_class_names = set()
+    while pending_class_names:
+        godot_class = classes_by_name.get(pending_class_names.pop())
+        if (godot_class is None) or (godot_class['name'] in required_class_names):
+            continue
+
+        required_class_names.add(godot_class['name'])
+        pending_class_names.extend(_get_referenced_class_names(godot_class))
+
+    return required_class_names
+
+# ----------------------------------------------------------------------------------------------- #
+
+def compile(environment, godot_cpp_directory, bindings = None):
     """Compiles the Godot-CPP library
 
     @param  environment          Environment used for the build settings to Godot-CPP
     @param  godot_cpp_directory  Directory holding the Godot-CPP library
+    @param  bindings             Generated bindings returned by generate_bindings()
+                                 If this is 'None', Godot-CPP will generate them itself
     @return A scons list of target created by the build"""
 
     if platform.system() == 'Windows':
@@ -105,33 +255,40 @@ def compile(environment, godot_cpp_directory):
     else:
         godot_cpp_build_type = 'release'
 
-
-    # We only want to pass 'generate_bindings=yes' if the bindings aren't
-    # generated yet. This will cause one unneccessary rebuild, but it seems
-    # generating the binding would instead cause a rebuild *every* time.
-    #
-    # Maybe some issue with the Godot-CPP SConstruct file?
-    generated_headers_directory = os.path.join(godot_cpp_directory, 'include', 'gen')
-    generated_sources_directory = os.path.join(godot_cpp_directory, 'src', 'gen')
-
-    header_count = 0
-    if os.path.isdir(generated_sources_directory):
-        header_count = len(os.listdir(generated_headers_directory))
-
-    source_count = 0
-    if os.path.isdir(generated_headers_directory):
-        source_count = len(os.listdir(generated_sources_directory))
-
     additional_arguments = (
         ' platform=' + godot_cpp_platform +
         ' target=' + godot_cpp_build_type
     )
 
-    if (header_count == 0) or (source_count == 0):
-        additional_arguments += ' generate_bindings=yes'
-
     input_files_subset = []
 
+    if bindings:
+
+        # The bindings are a separate build step with an exact list of outputs,
+        # so Godot-CPP's SConstruct only needs to compile them
+        input_files_subset.extend(bindings)
+
+    else:
+
+        # We only want to pass 'generate_bindings=yes' if the bindings aren't
+        # generated yet. This will cause one unneccessary rebuild, but it seems
+        # generating the binding would instead cause a rebuild *every* time.
+        #
+        # Maybe some issue with the Godot-CPP SConstruct file?
+        generated_headers_directory = os.path.join(godot_cpp_directory, 'include', 'gen')
+        generated_sources_directory = os.path.join(godot_cpp_directory, 'src', 'gen')
+
+        header_count = 0
+        if os.path.isdir(generated_sources_directory):
+            header_count = len(os.listdir(generated_headers_directory))
+
+        source_count = 0
+        if os.path.isdir(generated_headers_directory):
+            source_count = len(os.listdir(generated_sources_directory))
+
+        if (header_count == 0) or (source_count == 0):
+            additional_arguments += ' generate_bindings=yes'
+
     godot_headers_directory = os.path.join(godot_cpp_directory, 'godot_headers')
     for file in godot_headers_files_subset:
         input_files_subset.append(os.path.join(godot_headers_directory, file))
@@ -141,16 +298,170 @@ def compile(environment, godot_cpp_directory):
     sconstruct_file_path = os.path.join(godot_cpp_directory, 'SConstruct')
     input_files_subset.append(sconstruct_file_path)
 
-    godot_cpp_library_path = os.path.join(
-        godot_cpp_directory, 'bin', _get_godot_cpp_library_name(environment)
-    )
-
     return environment.build_scons(
         source = input_files_subset,
         arguments = '-j8 --directory=' + godot_cpp_directory + ' bits=64' + additional_arguments,
-        target = godot_cpp_library_path
+        target = _get_godot_cpp_library_path(environment, godot_cpp_directory)
+    )
+
+# ----------------------------------------------------------------------------------------------- #
+
+def build_static_library(environment, godot_cpp_directory, bindings = None):
+    """Compiles the Godot-CPP library as part of the current SCons build
+
+    @param  environment          Nuclex C++ environment used to compile Godot-CPP
+    @param  godot_cpp_directory  Directory holding the Godot-CPP library
+    @param  bindings             Generated bindings returned by generate_bindings()
+                                 If this is 'None', the nested build via compile() is used
+    @return A scons list of targets created by the build
+    @remarks
+        Unlike compile(), this does not run Godot-CPP's own SConstruct in a child SCons
+        process. Godot-CPP's core and generated sources are compiled into the intermediate
+        directory with the settings of the provided environment, so its object files are
+        scheduled together with everything else in the build."""
+
+    if not bindings:
+        return compile(environment, godot_cpp_directory)
+
+    library_environment = environment.Clone()
+    library_environment['SOURCE_DIRECTORY'] = os.path.join(godot_cpp_directory, 'src')
+    library_environment['HEADER_DIRECTORY'] = os.path.join(godot_cpp_directory, 'include')
+
+    library_environment.add_include_directory(os.path.join(godot_cpp_directory, 'godot_headers'))
+    library_environment.add_include_directory(os.path.join(godot_cpp_directory, 'include', 'core'))
+    library_environment.add_include_directory(os.path.join(godot_cpp_directory, 'include', 'gen'))
+
+    # This is third-party code, don't drown the build output in its warnings
+    if platform.system() == 'Windows':
+        library_environment.Append(CXXFLAGS='/w')
+    else:
+        library_environment.Append(CXXFLAGS='-w')
+
+    # The core sources are checked in and will be compiled via the variant directory
+    sources = cplusplus.enumerate_sources(os.path.join(godot_cpp_directory, 'src', 'core'))
+
+    # Generated sources can't go through the variant directory (SCons would look for them
+    # in the source directory before they're generated), so their object files are put
+    # into the intermediate directory explicitly
+    intermediate_build_directory = os.path.join(
+        environment['INTERMEDIATE_DIRECTORY'], environment.get_build_directory_name()
+    )
+
+    object_environment = library_environment.Clone()
+    object_environment.add_include_directory(library_environment['HEADER_DIRECTORY'])
+    if platform.system() != 'Windows':
+        object_environment.Append(CXXFLAGS='-fpic') # Use position-independent code
+
+    for generated_file in bindings:
+        generated_file_path = str(generated_file)
+        if generated_file_path.endswith('.cpp'):
+            object_path = os.path.join(
+                intermediate_build_directory, os.path.splitext(generated_file_path)[0]
+            )
+            sources.extend(object_environment.StaticObject(object_path, generated_file))
+
+    build_library = library_environment.build_library(
+        'godot-cpp', static = True, sources = sources
+    )
+
+    # Place the library where add_package() expects Godot-CPP's own build to put it
+    return library_environment.InstallAs(
+        _get_godot_cpp_library_path(environment, godot_cpp_directory), build_library
+    )
+
+# ----------------------------------------------------------------------------------------------- #
+
+def build(
+    environment, godot_cpp_directory, used_by = None, required_classes = None,
+    use_cache = True, cache_directory = None, maximum_cache_size = _default_maximum_cache_size
+):
+    """Generates the Godot-CPP bindings and compiles the Godot-CPP library, reusing
+    a prebuilt library from a machine-wide cache if one exists
+
+    @param  environment          Nuclex C++ environment used to compile Godot-CPP
+    @param  godot_cpp_directory  Directory holding the Godot-CPP library
+    @param  used_by              Source directories whose includes decide which classes
+                                 bindings are generated for (None = all classes)
+    @param  required_classes     Additional classes to generate bindings for when
+                                 only the classes in use are generated
+    @param  use_cache            Whether to look up and store prebuilt libraries
+    @param  cache_directory      Directory holding the prebuilt libraries
+                                 (None = machine-wide default for the current user)
+    @param  maximum_cache_size   Number of bytes after which old entries get evicted
+    @return A scons list of targets created by the build
+    @remarks
+        Cache entries are keyed by the api.json, the Godot-CPP revision, the compiler,
+        the compiler flags and the build configuration. On a cache hit, the generated
+        headers and the static library are copied from the cache and nothing gets
+        generated or compiled. After a regular build, the results are published to
+        the cache. See generate_bindings() for details on the used_by parameter.
+
+        The cache key is determined while the build scripts are being read, so it is
+        based on the api.json present at that time."""
+
+    class_names = None
+    if used_by is not None:
+        class_names = find_required_classes(godot_cpp_directory, used_by, required_classes)
+
+    generated_headers = enumerate_generated_files(
+        godot_cpp_directory, sources = False, class_names = class_names
+    )
+
+    cache_key = None
+    if use_cache and (generated_headers is not None):
+        cache_key = _get_cache_key(environment, godot_cpp_directory, generated_headers)
+
+    if cache_key is None:
+        bindings = _generate_bindings_for_classes(environment, godot_cpp_directory, class_names)
+        return build_static_library(environment, godot_cpp_directory, bindings)
+
+    if cache_directory is None:
+        cache_directory = shared.get_default_cache_directory('godot-cpp')
+
+    cache_entry_directory = os.path.join(cache_directory, cache_key)
+    library_path = _get_godot_cpp_library_path(environment, godot_cpp_directory)
+
+    # Cache hit: copy the generated headers and the library from the cache
+    if os.path.isdir(cache_entry_directory):
+        print("\033[92mUsing prebuilt Godot-CPP from " + cache_entry_directory + "\033[0m")
+        restore_from_cache = environment.Command(
+            source = environment.Value(cache_key),
+            action = environment.Action(
+                _restore_from_cache, 'Restoring Godot-CPP from cache'
+            ),
+            target = generated_headers + [ library_path ],
+            GODOT_CPP_CACHE_ENTRY = cache_entry_directory,
+            PROFILE_CATEGORY = 'godot_cpp_cache'
+        )
+
+        # Already cached here, no need to store it in the build cache as well
+        environment.NoCache(restore_from_cache)
+
+        return restore_from_cache
+
+    # Cache miss: do a normal build and publish its results to the cache afterwards
+    bindings = _generate_bindings_for_classes(environment, godot_cpp_directory, class_names)
+    build_library = build_static_library(environment, godot_cpp_directory, bindings)
+
+    publish_stamp_path = os.path.join(
+        environment['INTERMEDIATE_DIRECTORY'],
+        environment.get_build_directory_name(),
+        'godot-cpp-' + cache_key + '.published'
+    )
+    publish_to_cache = environment.Command(
+        source = [ library_path ] + generated_headers,
+        action = environment.Action(_publish_to_cache, 'Publishing Godot-CPP to cache'),
+        target = publish_stamp_path,
+        GODOT_CPP_CACHE_ENTRY = cache_entry_directory,
+        GODOT_CPP_MAXIMUM_CACHE_SIZE = maximum_cache_size,
+        PROFILE_CATEGORY = 'godot_cpp_cache'
     )
 
+    # The stamp taken from the build cache would skip publishing to the Godot-CPP cache
+    environment.NoCache(publish_to_cache)
+
+    return build_library + publish_to_cache
+
 # ----------------------------------------------------------------------------------------------- #
 
 def add_package(environment, godot_cpp_directory):
@@ -174,6 +485,46 @@ def add_package(environment, godot_cpp_directory):
 
 # ----------------------------------------------------------------------------------------------- #
 
+def _generate_bindings_for_classes(environment, godot_cpp_directory, class_names):
+    """Sets up the build step that generates the C++ wrappers for Godot classes
+
+    @param  environment          Environment used to run the binding generator
+    @param  godot_cpp_directory  Directory holding the Godot-CPP library
+    @param  class_names          Names of the classes bindings will be generated for
+                                 If this is 'None', all classes will be generated
+    @returns The generated headers and sources or None if the api.json does not exist yet"""
+
+    generated_files = enumerate_generated_files(
+        godot_cpp_directory, class_names = class_names
+    )
+    if generated_files is None:
+        print("\033[93mWARNING: api.json not found, letting Godot-CPP generate its bindings\033[0m")
+        return None
+
+    absolute_script_path = os.path.join(_own_directory, 'godot-cpp-generate-bindings.py')
+
+    api_json_path = os.path.join(godot_cpp_directory, 'godot_headers', 'api.json')
+    binding_generator_path = os.path.join(godot_cpp_directory, 'binding_generator.py')
+
+    extra_arguments = str()
+    if class_names is not None:
+        for class_name in sorted(class_names):
+            extra_arguments += ' ' + class_name
+
+    return environment.Command(
+        source = [ api_json_path, binding_generator_path, absolute_script_path ],
+        action = (
+            '"' + sys.executable + '" "' + absolute_script_path + '"' +
+            ' "' + godot_cpp_directory + '"' +
+            ' "$SOURCE"' +
+            extra_arguments
+        ),
+        target = generated_files,
+        PROFILE_CATEGORY = 'generate_bindings'
+    )
+
+# ----------------------------------------------------------------------------------------------- #
+
 def _get_godot_cpp_library_name(environment):
     """Returns the name of the Godot-CPP static library that would get built for
     the current platform and build type (debug/release)
@@ -190,3 +541,244 @@ def _get_godot_cpp_library_name(environment):
             return 'godot-cpp.linux.debug.64'
         else:
             return 'godot-cpp.linux.release.64'
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_godot_cpp_library_path(environment, godot_cpp_directory):
+    """Returns the path of the file the Godot-CPP static library will be written to
+
+    @param  environment          Environment under which the library path will be checked
+    @param  godot_cpp_directory  Directory holding the Godot-CPP library
+    @returns The path of the Godot-CPP static library file
+    @remarks
+        This is the actual file name, unlike the name returned by
+        _get_godot_cpp_library_name() which is meant for the linker's search."""
+
+    library_name = _get_godot_cpp_library_name(environment)
+    if platform.system() != 'Windows':
+        library_name = 'lib' + library_name + '.a'
+
+    return os.path.join(godot_cpp_directory, 'bin', library_name)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _strip_class_name(class_name):
+    """Strips the leading underscore Godot uses for some classes' internal names
+
+    @param  class_name  Name of the class as listed in the api.json
+    @returns The name the class and its generated files have in Godot-CPP"""
+
+    if class_name.startswith('_'):
+        return class_name[1:]
+    else:
+        return class_name
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _load_api_json(godot_cpp_directory):
+    """Loads the class list from the api.json in Godot-CPP's godot_headers directory
+
+    @param  godot_cpp_directory  Directory holding the Godot-CPP library
+    @returns The classes described in the api.json or None if it does not exist (yet)"""
+
+    api_json_path = os.path.join(godot_cpp_directory, 'godot_headers', 'api.json')
+    if not os.path.isfile(api_json_path):
+        return None
+
+    with open(api_json_path, 'r') as api_json_file:
+        return json.load(api_json_file)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_included_files(file_path):
+    """Lists the files a C/C++ source or header includes
+
+    @param  file_path  Path of the source or header file that will be scanned
+    @returns The names of all files included via an #include directive"""
+
+    with open(file_path, 'r', errors = 'replace') as source_file:
+        return _include_directive_regex.findall(source_file.read())
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_referenced_class_names(godot_class):
+    """Lists the classes a Godot class derives from or uses in its method signatures
+
+    @param  godot_class  Class from the api.json whose referenced classes will be listed
+    @returns The names of all classes the generated wrapper of the class depends on"""
+
+    class_names = []
+
+    if godot_class['base_class']:
+        class_names.append(godot_class['base_class'])
+
+    for method in godot_class['methods']:
+        class_names.append(_get_class_name_from_type(method['return_type']))
+        for argument in method['arguments']:
+            class_names.append(_get_class_name_from_type(argument['type']))
+
+    return class_names
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_class_name_from_type(type_name):
+    """Extracts the class name from a type as it appears in the api.json
+
+    @param  type_name  Type name from the api.json, i.e. 'Node' or 'enum.Node::PauseMode'
+    @returns The name of the class the type belongs to
+    @remarks
+        Built-in types (int, String, Vector3...) are returned unchanged. They're not
+        classes in the api.json, so they will simply be ignored when looked up."""
+
+    if type_name.startswith('enum.'):
+        return type_name[5:].split('::')[0]
+    else:
+        return type_name
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_cache_key(environment, godot_cpp_directory, generated_headers):
+    """Calculates the key under which a prebuilt Godot-CPP library would be cached
+
+    @param  environment          Environment whose compiler and build settings will be used
+    @param  godot_cpp_directory  Directory holding the Godot-CPP library
+    @param  generated_headers    Headers that will be generated by the binding generator
+    @returns The cache key or None if the inputs can't be identified reliably"""
+
+    key_hash = hashlib.sha256()
+
+    with open(os.path.join(godot_cpp_directory, 'godot_headers', 'api.json'), 'rb') as api_json:
+        key_hash.update(api_json.read())
+
+    key_hash.update(_get_godot_cpp_revision(godot_cpp_directory).encode('utf-8'))
+    key_hash.update(cplusplus.get_compiler_fingerprint(environment).encode('utf-8'))
+    key_hash.update(environment.subst('$CXXFLAGS $CCFLAGS $_CPPDEFFLAGS').encode('utf-8'))
+    key_hash.update(environment.get_build_directory_name().encode('utf-8'))
+
+    # Covers the set of classes when only the classes in use are generated
+    for generated_header in generated_headers:
+        key_hash.update(os.path.basename(generated_header).encode('utf-8'))
+
+    return key_hash.hexdigest()[:32]
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_godot_cpp_revision(godot_cpp_directory):
+    """Determines the revision of the Godot-CPP source code
+
+    @param  godot_cpp_directory  Directory holding the Godot-CPP library
+    @returns The git revision or, if Godot-CPP has local changes or isn't a git
+             checkout, a hash over the contents of its hand-written sources"""
+
+    try:
+        git_revision = subprocess.check_output(
+            [ 'git', 'rev-parse', 'HEAD' ],
+            cwd = godot_cpp_directory, stderr = subprocess.DEVNULL
+        )
+        git_changes = subprocess.check_output(
+            [ 'git', 'status', '--porcelain', '--untracked-files=no' ],
+            cwd = godot_cpp_directory, stderr = subprocess.DEVNULL
+        )
+        if len(git_changes.strip()) == 0:
+            return git_revision.decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+
+    source_hash = hashlib.sha256()
+
+    source_directories = [
+        os.path.join(godot_cpp_directory, 'godot_headers'),
+        os.path.join(godot_cpp_directory, 'include', 'core'),
+        os.path.join(godot_cpp_directory, 'src', 'core')
+    ]
+    for source_directory in source_directories:
+        file_paths = (
+            cplusplus.enumerate_headers(source_directory) +
+            cplusplus.enumerate_sources(source_directory)
+        )
+        for file_path in sorted(set(file_paths)):
+            source_hash.update(file_path.encode('utf-8'))
+            with open(file_path, 'rb') as source_file:
+                source_hash.update(source_file.read())
+
+    with open(os.path.join(godot_cpp_directory, 'binding_generator.py'), 'rb') as generator_file:
+        source_hash.update(generator_file.read())
+
+    return source_hash.hexdigest()
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _restore_from_cache(target, source, env):
+    """Copies the generated headers and the library from a Godot-CPP cache entry
+
+    @param  target  Generated headers followed by the path of the static library
+    @param  source  Value node holding the cache key
+    @param  env     Environment providing the cache entry directory"""
+
+    cache_entry_directory = env['GODOT_CPP_CACHE_ENTRY']
+
+    for target_node in target[:-1]:
+        shutil.copyfile(
+            os.path.join(cache_entry_directory, 'include', os.path.basename(target_node.abspath)),
+            target_node.abspath
+        )
+
+    library_node = target[-1]
+    shutil.copyfile(
+        os.path.join(cache_entry_directory, 'lib', os.path.basename(library_node.abspath)),
+        library_node.abspath
+    )
+
+    # The modification time of an entry is its last use time for the LRU eviction
+    os.utime(cache_entry_directory, None)
+
+    return 0
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _publish_to_cache(target, source, env):
+    """Stores the library and the generated headers of a build in the Godot-CPP cache
+
+    @param  target  Stamp file that will be written when the entry has been published
+    @param  source  Path of the static library followed by the generated headers
+    @param  env     Environment providing the cache entry directory and size limit
+    @remarks
+        The entry is assembled in a temporary directory and then renamed into place,
+        so concurrent builds will never see an incomplete entry."""
+
+    cache_entry_directory = env['GODOT_CPP_CACHE_ENTRY']
+    cache_directory = os.path.dirname(cache_entry_directory)
+
+    if not os.path.isdir(cache_entry_directory):
+        if not os.path.isdir(cache_directory):
+            os.makedirs(cache_directory)
+
+        temporary_directory = tempfile.mkdtemp(prefix = '.incoming-', dir = cache_directory)
+        try:
+            os.makedirs(os.path.join(temporary_directory, 'lib'))
+            os.makedirs(os.path.join(temporary_directory, 'include'))
+
+            library_path = source[0].abspath
+            shutil.copyfile(
+                library_path,
+                os.path.join(temporary_directory, 'lib', os.path.basename(library_path))
+            )
+            for header_node in source[1:]:
+                header_path = header_node.abspath
+                shutil.copyfile(
+                    header_path,
+                    os.path.join(temporary_directory, 'include', os.path.basename(header_path))
+                )
+
+            os.rename(temporary_directory, cache_entry_directory)
+        except OSError:
+            shutil.rmtree(temporary_directory, ignore_errors = True)
+            if not os.path.isdir(cache_entry_directory):
+                raise # Failed for another reason than a concurrent build publishing it
+
+    shared.evict_least_recently_used(cache_directory, env['GODOT_CPP_MAXIMUM_CACHE_SIZE'])
+
+    with open(target[0].abspath, 'w') as stamp_file:
+        stamp_file.write(cache_entry_directory + '\n')
+
+    return 0
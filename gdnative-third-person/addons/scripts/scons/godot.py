@@ -3,6 +3,10 @@
 import os
 import shutil
 import platform
+import importlib
+
+# Nuclex SCons libraries
+shared = importlib.import_module('shared')
 
 # ----------------------------------------------------------------------------------------------- #
 
@@ -113,19 +117,19 @@ def _recursively_collect_assets(assets, directory):
         '.import'
     ]
 
-    # If this directory contains a .gdignore file, don't process it
-    gd_ignore_file = os.path.join(directory, ".gdignore")
-    if os.path.isfile(gd_ignore_file):
-        return
+    asset_file_extensions = frozenset(asset_file_extensions)
+
+    for root, directory_names, file_names in shared.walk(directory):
+
+        # If this directory contains a .gdignore file, don't process it
+        if ".gdignore" in file_names:
+            del directory_names[:]
+            continue
 
-    for entry in os.listdir(directory):
-        path = os.path.join(directory, entry)
-        if os.path.isdir(path):
-            _recursively_collect_build_scripts(scripts, path)
-        elif os.path.isfile(path):
+        for file_name in file_names:
             file_title, file_extension = os.path.splitext(file_name)
-            if file_extension and any(file_extension in s for s in asset_file_extensions):
-                assets.append(path)
+            if file_extension in asset_file_extensions:
+                assets.append(os.path.join(root, file_name))
 
 # ----------------------------------------------------------------------------------------------- #
 
@@ -216,7 +220,8 @@ def _call_godot(environment, source, arguments, target):
     #    source = godot_executable
 
     return environment.Command(
-        target, source, '"' + godot_executable + '" ' + arguments
+        target, source, '$REMOTE_EXECUTION_LAUNCHER "' + godot_executable + '" ' + arguments,
+        PROFILE_CATEGORY = 'call_godot'
     )
 
 # ----------------------------------------------------------------------------------------------- #
@@ -0,0 +1,360 @@
+#!/usr/bin/env python
+
+import os
+import subprocess
+import xml.etree.ElementTree
+
+from SCons.Action import Action
+
+"""
+Sharded execution of googletest unit test executables
+
+Runs a unit test executable as several processes (shards), each executing a part of
+the tests and writing its own XML report, then merges the reports into one.
+
+Tests are split among the shards using the durations recorded in the merged report
+of the previous run, so all shards take about equally long. When there is no earlier
+report, googletest's own sharding (GTEST_TOTAL_SHARDS/GTEST_SHARD_INDEX) is used.
+"""
+
+# ----------------------------------------------------------------------------------------------- #
+
+# Number of slowest tests that will be listed after the results have been merged
+_slowest_test_count = 5
+
+# Attributes of test suites that hold counts which are summed up when merging
+_counted_attributes = [ 'tests', 'failures', 'disabled', 'skipped', 'errors' ]
+
+# Longest GTEST_FILTER handed to a shard. Linux limits each environment variable to
+# 128 KiB and Windows limits each one to 32767 characters.
+_maximum_filter_length = 32000
+
+# ----------------------------------------------------------------------------------------------- #
+
+def run_sharded(environment, test_executable_path, test_results_path, shard_count):
+    """Runs a unit test executable in parallel shards and merges their results
+
+    @param  environment           Environment in which the unit tests will be run
+    @param  test_executable_path  Path of the googletest unit test executable
+    @param  test_results_path     Path of the XML file the merged results are written to
+    @param  shard_count           Number of shards the tests will be split into
+    @returns The SCons build step that produces the merged results"""
+
+    shard_results = []
+    for shard_index in range(shard_count):
+        shard_results_path = os.path.join(
+            os.path.dirname(str(test_executable_path)),
+            'gtest-shard-' + str(shard_index + 1) + '-of-' + str(shard_count) + '.xml'
+        )
+        shard_results += environment.Command(
+            source = test_executable_path,
+            action = Action(_run_shard, 'Running unit test shard $SHARD_NUMBER of $SHARD_COUNT'),
+            target = shard_results_path,
+            SHARD_INDEX = shard_index,
+            SHARD_NUMBER = shard_index + 1,
+            SHARD_COUNT = shard_count,
+            PREVIOUS_TEST_RESULTS = environment.File(test_results_path).abspath,
+            PROFILE_CATEGORY = 'run_unit_tests'
+        )
+
+    # Keep the previous results until they're replaced, the shards learn
+    # how long each test took from them
+    merge_results = environment.Command(
+        source = shard_results,
+        action = Action(_merge_results, 'Merging unit test results into $TARGET'),
+        target = test_results_path,
+        PROFILE_CATEGORY = 'merge_test_results'
+    )
+    environment.Precious(merge_results)
+
+    # Tests should run on each machine rather than their results coming from the build cache
+    environment.NoCache(shard_results + merge_results)
+
+    return merge_results
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _run_shard(target, source, env):
+    """Runs one shard of the unit tests
+
+    @param  target  XML file to which the shard's results will be written
+    @param  source  Unit test executable that will be run
+    @param  env     Environment with the shard index, count and previous results path
+    @returns Always 0, failed tests don't fail the build (like in run_unit_tests())"""
+
+    test_executable_path = os.path.abspath(str(source[0]))
+    shard_results_path = os.path.abspath(str(target[0]))
+    shard_index = int(env['SHARD_INDEX'])
+    shard_count = int(env['SHARD_COUNT'])
+
+    process_environment = {}
+    for name, value in env['ENV'].items():
+        process_environment[name] = str(value)
+
+    tests = _assign_tests_to_shards(
+        test_executable_path, env['PREVIOUS_TEST_RESULTS'], shard_count, process_environment
+    )
+    if tests is None:
+        process_environment['GTEST_TOTAL_SHARDS'] = str(shard_count)
+        process_environment['GTEST_SHARD_INDEX'] = str(shard_index)
+    elif len(tests[shard_index]) == 0:
+        process_environment['GTEST_FILTER'] = '-*' # More shards than tests
+    else:
+        process_environment['GTEST_FILTER'] = ':'.join(tests[shard_index])
+
+    if os.path.isfile(shard_results_path):
+        os.remove(shard_results_path)
+
+    try:
+        exit_status = subprocess.call(
+            [ test_executable_path, '--gtest_output=xml:' + shard_results_path ],
+            env = process_environment
+        )
+        message = 'Unit tests exited with status ' + str(exit_status) + ' without results'
+    except OSError as error:
+        message = 'Unit tests could not be started: ' + str(error)
+
+    # If the executable crashed, make sure the crash shows up in the merged results
+    if not os.path.isfile(shard_results_path):
+        _write_crashed_shard_results(shard_results_path, shard_index, message)
+
+    return 0
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _assign_tests_to_shards(
+    test_executable_path, previous_results_path, shard_count, process_environment
+):
+    """Splits the tests among the shards by how long they took in the previous run
+
+    @param  test_executable_path   Path of the unit test executable
+    @param  previous_results_path  Merged results of the previous run
+    @param  shard_count            Number of shards the tests will be split into
+    @param  process_environment    Environment variables to run the executable with
+    @returns A list of the full test names to run for each shard or None if no
+             durations are known and googletest's own sharding should be used
+    @remarks
+        All shards arrive at the same split independently, so they don't need to
+        coordinate (the previous results are only replaced after all shards ran).
+        For the same reason, googletest's own sharding is used by all shards if the
+        test names of any shard are too long for an environment variable."""
+
+    test_durations = _read_test_durations(previous_results_path)
+    if len(test_durations) == 0:
+        return None
+
+    test_names = _list_tests(test_executable_path, process_environment)
+    if test_names is None:
+        return None
+
+    # Tests that didn't exist in the previous run are assumed to take an average time
+    average_duration = sum(test_durations.values()) / len(test_durations)
+    durations = {}
+    for test_name in test_names:
+        durations[test_name] = test_durations.get(test_name, average_duration)
+
+    # Longest processing time first: hand the slowest remaining test to the shard
+    # with the least work so far. Ties are broken by name so all shards agree.
+    tests = [ [] for shard_index in range(shard_count) ]
+    shard_durations = [ 0.0 ] * shard_count
+    for test_name in sorted(test_names, key = lambda name: (-durations[name], name)):
+        shard_index = shard_durations.index(min(shard_durations))
+        tests[shard_index].append(test_name)
+        shard_durations[shard_index] += durations[test_name]
+
+    for shard_tests in tests:
+        if len(':'.join(shard_tests)) > _maximum_filter_length:
+            return None
+
+    return tests
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _list_tests(test_executable_path, process_environment):
+    """Asks a unit test executable for the names of the tests it contains
+
+    @param  test_executable_path  Path of the unit test executable
+    @param  process_environment   Environment variables to run the executable with
+    @returns The full names (Suite.Test) of all tests or None if they couldn't be listed"""
+
+    try:
+        test_list = subprocess.run(
+            [ test_executable_path, '--gtest_list_tests' ],
+            stdout = subprocess.PIPE, stderr = subprocess.DEVNULL,
+            env = process_environment, universal_newlines = True
+        )
+    except OSError:
+        return None
+
+    if test_list.returncode != 0:
+        return None
+
+    # Suites are listed unindented, their tests indented below them. Parameterized
+    # tests have a comment with the parameter appended.
+    test_names = []
+    suite_name = ''
+    for line in test_list.stdout.splitlines():
+        name = line.split('#', 1)[0].strip()
+        if len(name) == 0:
+            continue
+
+        if line[0].isspace():
+            test_names.append(suite_name + name)
+        else:
+            suite_name = name
+
+    return test_names
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _read_test_durations(results_path):
+    """Reads how long each test took from a googletest XML report
+
+    @param  results_path  Path of the XML report that will be read
+    @returns A dictionary of test durations in seconds, keyed by full test name"""
+
+    test_durations = {}
+
+    try:
+        results = xml.etree.ElementTree.parse(results_path).getroot()
+    except (OSError, xml.etree.ElementTree.ParseError):
+        return test_durations
+
+    for test_case in results.iter('testcase'):
+        try:
+            test_name = test_case.get('classname') + '.' + test_case.get('name')
+            test_durations[test_name] = float(test_case.get('time', '0'))
+        except (TypeError, ValueError):
+            pass
+
+    return test_durations
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _merge_results(target, source, env):
+    """Merges the XML reports of all shards into one and lists the slowest tests
+
+    @param  target  XML file the merged results will be written to
+    @param  source  XML reports written by the shards
+    @param  env     Environment the merge runs in"""
+
+    merged_results = xml.etree.ElementTree.Element('testsuites')
+    for attribute in _counted_attributes:
+        merged_results.set(attribute, '0')
+    merged_results.set('name', 'AllTests')
+
+    merged_suites = {}
+    longest_shard_time = 0.0
+
+    for shard_results_node in source:
+        shard_results = xml.etree.ElementTree.parse(str(shard_results_node)).getroot()
+
+        # The shards ran in parallel, so the overall time is that of the slowest shard
+        longest_shard_time = max(longest_shard_time, float(shard_results.get('time', '0')))
+        if merged_results.get('timestamp') is None and shard_results.get('timestamp'):
+            merged_results.set('timestamp', shard_results.get('timestamp'))
+
+        _add_counts(merged_results, shard_results)
+
+        # Each shard may have run some of the tests of a suite
+        for shard_suite in shard_results.findall('testsuite'):
+            suite_name = shard_suite.get('name')
+            merged_suite = merged_suites.get(suite_name)
+            if merged_suite is None:
+                merged_suite = xml.etree.ElementTree.SubElement(merged_results, 'testsuite')
+                merged_suite.set('name', suite_name)
+                for attribute in _counted_attributes:
+                    merged_suite.set(attribute, '0')
+                merged_suite.set('time', '0')
+                merged_suites[suite_name] = merged_suite
+
+            _add_counts(merged_suite, shard_suite)
+            merged_suite.set(
+                'time',
+                _format_time(float(merged_suite.get('time')) + float(shard_suite.get('time', '0')))
+            )
+            for test_case in shard_suite:
+                merged_suite.append(test_case)
+
+    merged_results.set('time', _format_time(longest_shard_time))
+
+    xml.etree.ElementTree.ElementTree(merged_results).write(
+        str(target[0]), encoding = 'UTF-8', xml_declaration = True
+    )
+
+    _print_slowest_tests(merged_results)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _add_counts(merged_element, shard_element):
+    """Adds the test counts of a shard's report element to the merged element
+
+    @param  merged_element  Element in the merged report receiving the counts
+    @param  shard_element   Element in a shard's report providing the counts"""
+
+    for attribute in _counted_attributes:
+        merged_element.set(
+            attribute,
+            str(int(merged_element.get(attribute, '0')) + int(shard_element.get(attribute, '0')))
+        )
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _format_time(seconds):
+    """Formats a duration the way googletest writes it into its reports
+
+    @param  seconds  Duration in seconds that will be formatted
+    @returns The duration as a string with millisecond precision"""
+
+    return '%.3f' % seconds
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _print_slowest_tests(results):
+    """Lists the tests that took the longest to run
+
+    @param  results  Merged XML report containing all tests"""
+
+    test_durations = []
+    for test_case in results.iter('testcase'):
+        test_name = str(test_case.get('classname')) + '.' + str(test_case.get('name'))
+        test_durations.append((float(test_case.get('time', '0')), test_name))
+
+    if len(test_durations) == 0:
+        return
+
+    test_durations.sort(reverse = True)
+
+    print('Slowest unit tests:')
+    for duration, test_name in test_durations[:_slowest_test_count]:
+        print('  \033[94m' + _format_time(duration) + 's\033[0m  ' + test_name)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _write_crashed_shard_results(shard_results_path, shard_index, message):
+    """Writes an XML report for a shard whose executable ended without writing one
+
+    @param  shard_results_path  Path the shard's XML report should have been written to
+    @param  shard_index         Index of the shard whose unit test executable crashed
+    @param  message             Description of what happened to the unit test executable"""
+
+    suite_name = 'Shard' + str(shard_index + 1)
+
+    results = xml.etree.ElementTree.Element(
+        'testsuites', tests = '1', failures = '0', disabled = '0', errors = '1', time = '0'
+    )
+    suite = xml.etree.ElementTree.SubElement(
+        results, 'testsuite',
+        name = suite_name, tests = '1', failures = '0', disabled = '0', errors = '1', time = '0'
+    )
+    test_case = xml.etree.ElementTree.SubElement(
+        suite, 'testcase', name = 'Crashed', classname = suite_name, time = '0'
+    )
+    xml.etree.ElementTree.SubElement(
+        test_case, 'error',
+        message = message
+    )
+
+    xml.etree.ElementTree.ElementTree(results).write(
+        shard_results_path, encoding = 'UTF-8', xml_declaration = True
+    )
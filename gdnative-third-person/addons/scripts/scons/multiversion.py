@@ -0,0 +1,441 @@
+#!/usr/bin/env python
+
+import os
+import re
+import platform
+
+from SCons.Action import Action
+
+"""
+Builds of a library for several x86-64 instruction set levels
+
+The library is compiled once for each instruction set level (x86-64 baseline, x86-64-v2
+with SSE4.2, x86-64-v3 with AVX2 and FMA, x86-64-v4 with AVX-512). A small generated
+loader library takes the place of the original library. When its first entry point is
+called, it checks which instruction sets the CPU and OS support, loads the best variant
+from its own directory and forwards all entry points to it.
+
+So GDNativeLibrary resources (.gdnlib/.tres) keep pointing to the same library file.
+The variant libraries are listed as its dependencies, so exports ship them as well.
+The baseline variant is always built, so every x86-64 CPU can load one of the variants.
+"""
+
+# ----------------------------------------------------------------------------------------------- #
+
+# Instruction set levels variants can be built for, with the number the loader compares
+_isa_levels = { 'x86-64': 1, 'x86-64-v2': 2, 'x86-64-v3': 3, 'x86-64-v4': 4 }
+
+# Compiler switches for MSVC, which only knows about AVX2 and AVX-512
+_msvc_isa_flags = {
+    'x86-64': [], 'x86-64-v2': [], 'x86-64-v3': [ '/arch:AVX2' ], 'x86-64-v4': [ '/arch:AVX512' ]
+}
+
+# Level every x86-64 CPU supports, a variant for it is always built
+baseline_isa_variant = 'x86-64'
+
+# Names of the platforms in GDNativeLibrary resources, keyed by operating system
+_gdnative_platform_names = { 'Linux': 'X11.64', 'Windows': 'Windows.64', 'Darwin': 'OSX.64' }
+
+# Functions Godot looks up in GDNative libraries, forwarded by the loader by default
+gdnative_entry_points = [
+    'godot_gdnative_init',
+    'godot_gdnative_terminate',
+    'godot_gdnative_singleton',
+    'godot_nativescript_init',
+    'godot_nativescript_terminate',
+    'godot_nativescript_frame',
+    'godot_nativescript_thread_enter',
+    'godot_nativescript_thread_exit'
+]
+
+# Source code of the loader, completed with the variants and entry points
+_loader_template = r'''// Generated by multiversion.py - do not edit
+//
+// Loads the variant of the library built for the best instruction set level
+// the CPU supports and forwards the library's entry points to it.
+
+#if !defined(_WIN32)
+  #define _GNU_SOURCE // For dladdr()
+#endif
+
+#include <stddef.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#if defined(_WIN32)
+  #include <windows.h>
+  #include <intrin.h>
+  #define LOADER_API __declspec(dllexport)
+#else
+  #include <dlfcn.h>
+  #define LOADER_API __attribute__((visibility("default")))
+#endif
+
+// --------------------------------------------------------------------------------------------- //
+
+typedef void (*EntryPoint)(void *);
+
+// Variant libraries (best first) and the instruction set level they require
+static const struct { const char *FileName; int Level; } variants[] = {
+%(variants)s
+};
+
+// Names of the entry points that will be looked up in the variant library
+static const char *entryPointNames[] = {
+%(entry_point_names)s
+};
+
+// Entry points of the loaded variant library
+static EntryPoint entryPoints[sizeof(entryPointNames) / sizeof(entryPointNames[0])];
+
+// Whether loading the best variant has been attempted already
+static int variantLoaded = 0;
+
+// --------------------------------------------------------------------------------------------- //
+
+#if defined(_MSC_VER) && !defined(__clang__)
+
+// Determines the x86-64 instruction set level supported by the CPU and OS
+static int getSupportedLevel(void) {
+  int registers[4];
+
+  __cpuid(registers, 1);
+  int features1 = registers[2];
+  if(!((features1 & (1 << 9)) && (features1 & (1 << 20)) && (features1 & (1 << 23)))) {
+    return 1; // No SSSE3, SSE4.2 or POPCNT
+  }
+  if((features1 & (1 << 27)) == 0) {
+    return 2; // OS doesn't save extended registers (OSXSAVE)
+  }
+
+  unsigned long long enabledState = _xgetbv(0);
+  __cpuidex(registers, 7, 0);
+  int features7 = registers[1];
+  if(
+    ((enabledState & 0x6) != 0x6) ||
+    !((features1 & (1 << 12)) && (features7 & (1 << 5)) && (features7 & (1 << 8)))
+  ) {
+    return 2; // No AVX state, FMA, AVX2 or BMI2
+  }
+  if(
+    ((enabledState & 0xE6) != 0xE6) ||
+    !(
+      (features7 & (1 << 16)) && (features7 & (1 << 17)) && (features7 & (1 << 28)) &&
+      (features7 & (1 << 30)) && (features7 & (1u << 31))
+    )
+  ) {
+    return 3; // No AVX-512 state or no AVX-512 F, DQ, CD, BW and VL
+  }
+
+  return 4;
+}
+
+#else
+
+// Determines the x86-64 instruction set level supported by the CPU and OS
+static int getSupportedLevel(void) {
+  __builtin_cpu_init();
+
+  if(
+    !__builtin_cpu_supports("ssse3") || !__builtin_cpu_supports("sse4.2") ||
+    !__builtin_cpu_supports("popcnt")
+  ) {
+    return 1;
+  }
+  if(
+    !__builtin_cpu_supports("avx2") || !__builtin_cpu_supports("fma") ||
+    !__builtin_cpu_supports("bmi2")
+  ) {
+    return 2;
+  }
+  if(
+    !__builtin_cpu_supports("avx512f") || !__builtin_cpu_supports("avx512dq") ||
+    !__builtin_cpu_supports("avx512cd") || !__builtin_cpu_supports("avx512bw") ||
+    !__builtin_cpu_supports("avx512vl")
+  ) {
+    return 3;
+  }
+
+  return 4;
+}
+
+#endif
+
+// --------------------------------------------------------------------------------------------- //
+
+// Loads the best variant library and looks up its entry points, aborts if none loads
+static void loadBestVariant(void) {
+  if(variantLoaded) {
+    return;
+  }
+  variantLoaded = 1;
+
+  int supportedLevel = getSupportedLevel();
+
+#if defined(_WIN32)
+  HMODULE loaderModule;
+  if(
+    !GetModuleHandleExW(
+      GET_MODULE_HANDLE_EX_FLAG_FROM_ADDRESS | GET_MODULE_HANDLE_EX_FLAG_UNCHANGED_REFCOUNT,
+      (LPCWSTR)&variantLoaded, &loaderModule
+    )
+  ) {
+    return;
+  }
+
+  wchar_t path[MAX_PATH];
+  DWORD pathLength = GetModuleFileNameW(loaderModule, path, MAX_PATH);
+  while((pathLength > 0) && (path[pathLength - 1] != L'\\') && (path[pathLength - 1] != L'/')) {
+    --pathLength;
+  }
+
+  for(size_t index = 0; index < sizeof(variants) / sizeof(variants[0]); ++index) {
+    if(variants[index].Level > supportedLevel) {
+      continue;
+    }
+
+    size_t fileNameLength = strlen(variants[index].FileName);
+    if(pathLength + fileNameLength >= MAX_PATH) {
+      continue;
+    }
+    for(size_t character = 0; character <= fileNameLength; ++character) {
+      path[pathLength + character] = (wchar_t)variants[index].FileName[character];
+    }
+
+    HMODULE variantModule = LoadLibraryW(path);
+    if(variantModule != NULL) {
+      for(size_t entry = 0; entry < sizeof(entryPoints) / sizeof(entryPoints[0]); ++entry) {
+        entryPoints[entry] = (EntryPoint)GetProcAddress(variantModule, entryPointNames[entry]);
+      }
+      return;
+    }
+  }
+#else
+  // Any address inside the loader will do, a variable avoids function pointer casts
+  Dl_info loaderInfo;
+  if((dladdr(&variantLoaded, &loaderInfo) == 0) || (loaderInfo.dli_fname == NULL)) {
+    return;
+  }
+
+  char path[4096];
+  const char *directoryEnd = strrchr(loaderInfo.dli_fname, '/');
+  size_t pathLength = (directoryEnd == NULL) ? 0 : (directoryEnd - loaderInfo.dli_fname + 1);
+  if(pathLength >= sizeof(path)) {
+    return;
+  }
+  memcpy(path, loaderInfo.dli_fname, pathLength);
+
+  for(size_t index = 0; index < sizeof(variants) / sizeof(variants[0]); ++index) {
+    if(variants[index].Level > supportedLevel) {
+      continue;
+    }
+
+    size_t fileNameLength = strlen(variants[index].FileName);
+    if(pathLength + fileNameLength >= sizeof(path)) {
+      continue;
+    }
+    memcpy(path + pathLength, variants[index].FileName, fileNameLength + 1);
+
+    void *variantHandle = dlopen(path, RTLD_NOW | RTLD_LOCAL);
+    if(variantHandle != NULL) {
+      for(size_t entry = 0; entry < sizeof(entryPoints) / sizeof(entryPoints[0]); ++entry) {
+        *(void **)&entryPoints[entry] = dlsym(variantHandle, entryPointNames[entry]);
+      }
+      return;
+    }
+  }
+#endif
+
+  // Continuing would silently leave the game without any of its native code
+  fprintf(
+    stderr,
+    "No variant of the library could be loaded for this CPU (level %%d). Are the variant "
+    "libraries missing next to the loader?\n",
+    supportedLevel
+  );
+  fflush(stderr);
+  abort();
+}
+
+// --------------------------------------------------------------------------------------------- //
+%(forwarders)s'''
+
+# Source code of a function forwarding a call to the loaded variant library
+_forwarder_template = r'''
+LOADER_API void %(name)s(void *argument) {
+  loadBestVariant();
+  if(entryPoints[%(index)d] != NULL) {
+    entryPoints[%(index)d](argument);
+  }
+}
+
+// --------------------------------------------------------------------------------------------- //
+'''
+
+# ----------------------------------------------------------------------------------------------- #
+
+def sort_by_level(isa_variants):
+    """Orders instruction set levels from the most to the least capable
+
+    @param  isa_variants  Names of the instruction set levels (i.e. 'x86-64-v3')
+    @returns The instruction set levels, most capable first, always including the baseline"""
+
+    isa_variants = set(isa_variants)
+    isa_variants.add(baseline_isa_variant)
+
+    return sorted(isa_variants, key = lambda isa_variant: -_isa_levels[isa_variant])
+
+# ----------------------------------------------------------------------------------------------- #
+
+def get_compiler_flags(environment, isa_variant):
+    """Determines the compiler flags that target an x86-64 instruction set level
+
+    @param  environment  Environment whose compiler will receive the flags
+    @param  isa_variant  Name of the instruction set level (i.e. 'x86-64-v3')
+    @returns The compiler flags to append to CCFLAGS
+    @remarks
+        GCC 11 and clang 12 or later are needed for the -march=x86-64-vN levels.
+        MSVC has no switch for x86-64-v2, so that variant is built like the baseline."""
+
+    if platform.system() == 'Windows':
+        return _msvc_isa_flags[isa_variant]
+    else:
+        return [ '-march=' + isa_variant ]
+
+# ----------------------------------------------------------------------------------------------- #
+
+def generate_loader(environment, loader_source_path, variants, entry_points):
+    """Generates the source code of the loader that picks the best variant library
+
+    @param  environment         Environment in which the source code will be generated
+    @param  loader_source_path  Path of the C source file that will be written
+    @param  variants            List of (library file name, instruction set level name)
+                                tuples, most capable first
+    @param  entry_points        Names of the functions the loader will forward
+    @returns The build step that writes the loader's source code
+    @remarks
+        The entry points must take at most one pointer and return nothing, which
+        is the case for all GDNative entry points."""
+
+    loader_settings = (
+        [ (file_name, _isa_levels[isa_variant]) for file_name, isa_variant in variants ],
+        list(entry_points)
+    )
+
+    return environment.Command(
+        source = environment.Value(repr(loader_settings)),
+        action = Action(_write_loader_source, 'Generating ISA variant loader $TARGET'),
+        target = loader_source_path,
+        LOADER_SETTINGS = loader_settings
+    )
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _write_loader_source(target, source, env):
+    """Writes the loader's source code
+
+    @param  target  C source file that will be written
+    @param  source  Value node holding the loader settings
+    @param  env     Environment containing the loader settings"""
+
+    variants, entry_points = env['LOADER_SETTINGS']
+
+    variant_lines = []
+    for file_name, level in variants:
+        variant_lines.append('  { "' + file_name + '", ' + str(level) + ' }')
+
+    entry_point_lines = []
+    forwarders = ''
+    for index, entry_point in enumerate(entry_points):
+        entry_point_lines.append('  "' + entry_point + '"')
+        forwarders += _forwarder_template % { 'name': entry_point, 'index': index }
+
+    with open(str(target[0]), 'w') as loader_file:
+        loader_file.write(
+            _loader_template % {
+                'variants': ',\n'.join(variant_lines),
+                'entry_point_names': ',\n'.join(entry_point_lines),
+                'forwarders': forwarders
+            }
+        )
+
+# ----------------------------------------------------------------------------------------------- #
+
+def register_gdnative_dependencies(environment, resource_path, libraries, stamp_path):
+    """Lists the variant libraries as dependencies in a GDNativeLibrary resource
+
+    @param  environment    Environment in which the resource will be updated
+    @param  resource_path  Path of the GDNativeLibrary resource (.gdnlib/.tres)
+    @param  libraries      Installed library files as returned by build_library(),
+                           the first shared library is the one Godot loads
+    @param  stamp_path     File recording the dependencies written to the resource
+    @returns The build step that updates the resource
+    @remarks
+        Godot only exports the files a GDNativeLibrary names, so without this an
+        exported game would ship the loader but none of the variants it loads.
+        The dependencies are placed in the directory of the resource's entry for
+        the current platform. Without variants, the dependency list is emptied."""
+
+    shared_library_suffix = environment.subst('$SHLIBSUFFIX')
+    shared_library_names = [
+        os.path.basename(str(library)) for library in libraries
+        if str(library).endswith(shared_library_suffix)
+    ]
+
+    update_resource = environment.Command(
+        source = [ resource_path, environment.Value(repr(shared_library_names[1:])) ],
+        action = Action(_update_gdnative_dependencies, 'Registering ISA variants in $SOURCE'),
+        target = stamp_path,
+        GDNATIVE_DEPENDENCIES = shared_library_names[1:]
+    )
+
+    # A cache hit would skip the change to the resource, which is a source file
+    environment.NoCache(update_resource)
+
+    return update_resource
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _update_gdnative_dependencies(target, source, env):
+    """Writes the dependencies of a GDNativeLibrary resource for the current platform
+
+    @param  target  File recording the dependencies that were written
+    @param  source  GDNativeLibrary resource and value node holding the dependencies
+    @param  env     Environment containing the dependencies' file names"""
+
+    resource_path = str(source[0])
+    platform_name = _gdnative_platform_names.get(platform.system())
+    if platform_name is None:
+        print('GDNative libraries have no ISA variants on ' + platform.system())
+        return 1
+
+    with open(resource_path, 'r') as resource_file:
+        resource = resource_file.read()
+
+    entry = re.search(
+        r'^entry/' + re.escape(platform_name) + r'\s*=\s*"([^"]*)"', resource, re.MULTILINE
+    )
+    if entry is None:
+        print('No entry/' + platform_name + ' library found in ' + resource_path)
+        return 1
+
+    directory = entry.group(1).rpartition('/')[0]
+    dependencies = [ '"' + directory + '/' + name + '"' for name in env['GDNATIVE_DEPENDENCIES'] ]
+    dependency_line = 'dependency/' + platform_name + ' = [ ' + ', '.join(dependencies) + ' ]'
+
+    dependency_pattern = re.compile(
+        r'^dependency/' + re.escape(platform_name) + r'\s*=.*$', re.MULTILINE
+    )
+    if dependency_pattern.search(resource) is None:
+        updated_resource = resource[:entry.end()] + '\n' + dependency_line + resource[entry.end():]
+    else:
+        updated_resource = dependency_pattern.sub(lambda match: dependency_line, resource)
+
+    # Only touch the resource if something changed, Godot reimports it otherwise
+    if updated_resource != resource:
+        with open(resource_path, 'w') as resource_file:
+            resource_file.write(updated_resource)
+
+    with open(str(target[0]), 'w') as stamp_file:
+        stamp_file.write(dependency_line + '\n')
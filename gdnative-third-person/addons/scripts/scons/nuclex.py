@@ -1,18 +1,32 @@
 #!/usr/bin/env python
 
 import os
+import sys
 import importlib
 import platform
 import types
+import hashlib
+import atexit
 
 from SCons.Environment import Environment
 from SCons.Variables import Variables
 from SCons.Variables import EnumVariable
 from SCons.Variables import PathVariable
 from SCons.Variables import BoolVariable
+from SCons.Variables import ListVariable
 from SCons.Script import ARGUMENTS
 from SCons.Script import Dir
+from SCons.Script import GetOption
+from SCons.Script import Delete
+from SCons.Script import Mkdir
+from SCons.Action import Action
+from SCons.Tool import CScanner
+from SCons.Scanner import ScannerBase
+from SCons.Scanner import FindPathDirs
 from SCons.Util import WhereIs
+from SCons.Util import hash_signature
+
+import SCons.Node.FS
 
 # Nuclex SCons libraries
 shared = importlib.import_module('shared')
@@ -20,6 +34,42 @@ cplusplus = importlib.import_module('cplusplus')
 dotnet = importlib.import_module('dotnet')
 blender = importlib.import_module('blender')
 godot = importlib.import_module('godot')
+build_cache = importlib.import_module('build-cache')
+compile_cache = importlib.import_module('compile-cache')
+compile_cost = importlib.import_module('compile-cost')
+content_signatures = importlib.import_module('content-signatures')
+profiling = importlib.import_module('profiling')
+scheduling = importlib.import_module('scheduling')
+gtest = importlib.import_module('gtest')
+benchmark = importlib.import_module('benchmark')
+multiversion = importlib.import_module('multiversion')
+
+# Functions a GDNative library needs to export, for use with EXPORTED_SYMBOLS
+gdnative_exports = [ 'godot_gdnative_init', 'godot_gdnative_terminate', 'godot_nativescript_init' ]
+
+# Environments set up by the create_*_environment() functions, keyed by kind
+_base_environments = {}
+
+# Hits and misses of each compile cache when the build started, keyed by cache directory
+_compile_cache_statistics_baselines = {}
+
+# Intermediate directory whose compile costs are summed up, keyed by report path
+_compile_cost_reports = {}
+
+# Dependencies read from compiler-written dependency files, keyed by dependency file path
+_dependency_file_cache = None
+
+# Path of the file in which the dependency file cache is persisted between builds
+_dependency_file_cache_path = None
+
+# Version of the dependency file cache's format, older caches will be discarded
+_dependency_file_cache_version = 1
+
+# Whether the dependency file cache has changed since it was loaded
+_dependency_file_cache_changed = False
+
+# Share of the sources that must include a header for it to be precompiled automatically
+_automatic_precompiled_header_share = 0.5
 
 # Plan:
 #   - if TARGET_ARCH is set, use it. For multi-builds,
@@ -35,6 +85,15 @@ def create_generic_environment():
 
     @return A new SCons environment without support for specific builds"""
 
+    return _clone_base_environment('generic', _create_generic_base_environment)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _create_generic_base_environment():
+    """Sets up the base environment for general-purpose builds
+
+    @returns The base environment, see create_generic_environment()"""
+
     environment = Environment(
         variables = _parse_default_command_line_options()
     )
@@ -48,7 +107,29 @@ def create_generic_environment():
 def create_cplusplus_environment():
     """Creates a new environment with the required variables for building C/C++ projects
 
-    @returns A new SCons environment set up for C/C++ builds"""
+    @returns A new SCons environment set up for C/C++ builds
+    @remarks
+        To compile with a precompiled header, set PRECOMPILED_HEADER in the environment
+        to the path of a prefix header or to 'auto' to precompile the headers included
+        by most of the sources.
+
+        Benchmarks run by run_benchmarks() fail the build if they become slower than
+        in the baseline by more than BENCHMARK_REGRESSION_THRESHOLD (a fraction).
+
+        Shared libraries only export the symbols listed in EXPORTED_SYMBOLS if it is set
+        (i.e. to gdnative_exports), see _build_cplusplus_library().
+
+        With BINARY_ANALYSIS, a warning is printed when a linked binary grows by more
+        than BINARY_GROWTH_THRESHOLD (a fraction) in size or dynamic relocations."""
+
+    return _clone_base_environment('cplusplus', _create_cplusplus_base_environment)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _create_cplusplus_base_environment():
+    """Sets up the base environment for C/C++ builds
+
+    @returns The base environment, see create_cplusplus_environment()"""
 
     environment = Environment(
         variables = _parse_default_command_line_options(),
@@ -56,7 +137,16 @@ def create_cplusplus_environment():
         HEADER_DIRECTORY = 'Include',
         TESTS_DIRECTORY = 'Tests',
         TESTS_RESULT_FILE = "gtest-results.xml",
-        REFERENCES_DIRECTORY = 'References'
+        BENCHMARKS_DIRECTORY = 'Benchmarks',
+        BENCHMARKS_RESULT_FILE = "benchmark-results.json",
+        BENCHMARKS_BASELINE_FILE = "benchmark-baseline.json",
+        BENCHMARK_REPETITIONS = 5,
+        BENCHMARK_REGRESSION_THRESHOLD = 0.1,
+        BINARY_GROWTH_THRESHOLD = 0.05,
+        REFERENCES_DIRECTORY = 'References',
+        PRECOMPILED_HEADER = None,
+        EXPORTED_SYMBOLS = None,
+        SPLIT_DEBUG_INFORMATION = False
     )
 
     # Extension methods from the C/C++ module
@@ -68,6 +158,21 @@ def create_cplusplus_environment():
     _register_generic_extension_methods(environment)
     _register_cplusplus_extension_methods(environment)
 
+    if environment['FAST_LINK']:
+        _enable_fast_link(environment)
+    if (environment['LTO'] != 'off') and (not _is_debug_build(environment)):
+        _enable_link_time_optimization(environment)
+    if environment['DEPENDENCY_FILES']:
+        _use_compiler_dependency_files(environment)
+    if environment['REMOTE_EXECUTION']:
+        _enable_remote_execution(environment)
+    if environment['COMPILE_COST_REPORT']:
+        _enable_compile_cost_report(environment)
+    if environment['COMPILE_CACHE']:
+        _enable_compile_cache(environment)
+    if environment['BUILD_CACHE']:
+        _enable_build_cache(environment, 'C++')
+
     return environment
 
 # ----------------------------------------------------------------------------------------------- #
@@ -77,6 +182,15 @@ def create_dotnet_environment():
 
     @returns A new scons environment set up for .NET builds"""
 
+    return _clone_base_environment('dotnet', _create_dotnet_base_environment)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _create_dotnet_base_environment():
+    """Sets up the base environment for .NET builds
+
+    @returns The base environment, see create_dotnet_environment()"""
+
     environment = Environment(
         variables = _parse_default_command_line_options(),
         SOURCE_DIRECTORY = 'Source',
@@ -100,6 +214,15 @@ def create_blender_environment():
 
     @returns A new scons environment set up for Blender exports"""
 
+    return _clone_base_environment('blender', _create_blender_base_environment)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _create_blender_base_environment():
+    """Sets up the base environment for Blender exports
+
+    @returns The base environment, see create_blender_environment()"""
+
     environment = Environment(
         variables = _parse_default_command_line_options()
     )
@@ -110,6 +233,14 @@ def create_blender_environment():
     _register_generic_extension_methods(environment)
     _register_blender_extension_methods(environment)
 
+    if environment['CONTENT_SIGNATURE_CACHE']:
+        environment.Decider(content_signatures.decide)
+
+    if environment['REMOTE_EXECUTION']:
+        _enable_remote_execution(environment)
+    if environment['BUILD_CACHE']:
+        _enable_build_cache(environment, 'Blender')
+
     return environment
 
 # ----------------------------------------------------------------------------------------------- #
@@ -119,6 +250,15 @@ def create_godot_environment():
 
     @returns A new scons environment set up for Godot exports"""
 
+    return _clone_base_environment('godot', _create_godot_base_environment)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _create_godot_base_environment():
+    """Sets up the base environment for Godot exports
+
+    @returns The base environment, see create_godot_environment()"""
+
     environment = Environment(
         variables = _parse_default_command_line_options()
     )
@@ -129,10 +269,40 @@ def create_godot_environment():
     _register_generic_extension_methods(environment)
     _register_godot_extension_methods(environment)
 
+    if environment['CONTENT_SIGNATURE_CACHE']:
+        environment.Decider(content_signatures.decide)
+
+    if environment['REMOTE_EXECUTION']:
+        _enable_remote_execution(environment)
+    if environment['BUILD_CACHE']:
+        _enable_build_cache(environment, 'Godot')
+
     return environment
 
 # ----------------------------------------------------------------------------------------------- #
 
+def _clone_base_environment(kind, create_base_environment):
+    """Provides a copy of the base environment of the specified kind
+
+    @param  kind                     Kind of environment (i.e. 'cplusplus' or 'blender')
+    @param  create_base_environment  Function that sets up the base environment
+    @returns A new environment cloned from the base environment
+    @remarks
+        Creating an SCons environment detects all tools and parses the command line
+        variables, which takes far longer than cloning one. build_all() runs one build
+        script per asset directory, so each kind of environment is only set up once and
+        every further create_*_environment() call gets a clone of it. The base
+        environment itself is never handed out, so changes to a clone stay local."""
+
+    base_environment = _base_environments.get(kind)
+    if base_environment is None:
+        base_environment = create_base_environment()
+        _base_environments[kind] = base_environment
+
+    return base_environment.Clone()
+
+# ----------------------------------------------------------------------------------------------- #
+
 def build_all(environment, root_directory):
     """Compiles all SCons build scripts below the specified directory
 
@@ -153,10 +323,8 @@ def _get_all_build_scripts(root_directory):
 
     scripts = []
 
-    for entry in os.listdir(root_directory):
-        path = os.path.join(root_directory, entry)
-        if os.path.isdir(path):
-            _recursively_collect_build_scripts(scripts, path)
+    for subdirectory in shared.enumerate_subdirectories(root_directory):
+        _recursively_collect_build_scripts(scripts, os.path.join(root_directory, subdirectory))
 
     #scripts.reverse()
 
@@ -170,13 +338,10 @@ def _recursively_collect_build_scripts(scripts, directory):
     @param  scripts    List to which any discovered build scripts will be added
     @param  directory  Directory from which on the method will recursively search"""
 
-    for entry in os.listdir(directory):
-        path = os.path.join(directory, entry)
-        if os.path.isdir(path):
-            _recursively_collect_build_scripts(scripts, path)
-        elif os.path.isfile(path):
-            if ('SConstruct' in entry) or ('SConscript' in entry):
-                scripts.append(path)
+    for root, directory_names, file_names in shared.walk(directory):
+        for file_name in file_names:
+            if ('SConstruct' in file_name) or ('SConscript' in file_name):
+                scripts.append(os.path.join(root, file_name))
 
 
 # ----------------------------------------------------------------------------------------------- #
@@ -217,6 +382,136 @@ def _parse_default_command_line_options():
         )
     )
 
+    # Link-time optimization for release builds
+    command_line_variables.Add(
+        EnumVariable(
+            'LTO',
+            'Link-time optimization in release builds (thin = incremental where supported)',
+            'full',
+            allowed_values=('off', 'full', 'thin')
+        )
+    )
+
+    # Additional builds of shared libraries for newer x86-64 instruction set levels
+    command_line_variables.Add(
+        ListVariable(
+            'ISA_VARIANTS',
+            'x86-64 levels to build shared libraries for (picked at runtime, baseline added)',
+            'none',
+            [ 'x86-64', 'x86-64-v2', 'x86-64-v3', 'x86-64-v4' ]
+        )
+    )
+
+    # Faster linking for quicker edit-compile cycles
+    command_line_variables.Add(
+        BoolVariable(
+            'FAST_LINK',
+            'Whether to use the fastest linker available and split debug information',
+            False
+        )
+    )
+
+    # Unity builds (combining several C++ sources into one translation unit)
+    command_line_variables.Add(
+        BoolVariable(
+            'UNITY_BUILD',
+            'Whether to compile C++ sources in groups, each as one translation unit',
+            False
+        )
+    )
+    command_line_variables.Add(
+        'UNITY_BUILD_MAXIMUM_SIZE',
+        'Number of bytes of source code after which a unity group will be split',
+        262144,
+        None,
+        int
+    )
+
+    # Take the dependencies of C/C++ sources from the compiler instead of scanning
+    command_line_variables.Add(
+        BoolVariable(
+            'DEPENDENCY_FILES',
+            'Whether to use compiler-written dependency files instead of scanning sources',
+            True
+        )
+    )
+
+    # Cache for compiled object files shared by all builds of the current user
+    command_line_variables.Add(
+        BoolVariable(
+            'COMPILE_CACHE',
+            'Whether to reuse object files from earlier compilations of the same code',
+            False
+        )
+    )
+    command_line_variables.Add(
+        PathVariable(
+            'COMPILE_CACHE_DIRECTORY',
+            'Directory in which cached object files will be stored (empty = default)',
+            '',
+            PathVariable.PathAccept
+        )
+    )
+    command_line_variables.Add(
+        'COMPILE_CACHE_MAXIMUM_SIZE',
+        'Number of bytes after which the least recently used objects will be evicted',
+        5 * 1024 * 1024 * 1024,
+        None,
+        int
+    )
+
+    # Worker (started via remote-worker.py) that runs compiles and asset exports
+    command_line_variables.Add(
+        'REMOTE_EXECUTION',
+        'Address (host:port) of a worker that runs compiles and exports (empty = local)',
+        ''
+    )
+
+    # Cache for built files (objects, libraries, exports) shared by builds and machines
+    command_line_variables.Add(
+        PathVariable(
+            'BUILD_CACHE',
+            'Directory (local or network share) in which built files are cached (empty = off)',
+            '',
+            PathVariable.PathAccept
+        )
+    )
+    command_line_variables.Add(
+        'BUILD_CACHE_MAXIMUM_SIZE',
+        'Number of bytes after which the least recently used built files will be evicted',
+        20 * 1024 * 1024 * 1024,
+        None,
+        int
+    )
+
+    # Cache of the content signatures of large assets (Blender files, textures, audio)
+    command_line_variables.Add(
+        BoolVariable(
+            'CONTENT_SIGNATURE_CACHE',
+            'Whether to only hash asset files again when their size or modification time changed',
+            True
+        )
+    )
+
+    # Report of the headers that take the most time to compile
+    command_line_variables.Add(
+        PathVariable(
+            'COMPILE_COST_REPORT',
+            'Text file into which the compile time spent on each header will be written',
+            '',
+            PathVariable.PathAccept
+        )
+    )
+
+    # Size and load cost reports for linked shared libraries and executables
+    command_line_variables.Add(
+        BoolVariable(
+            'BINARY_ANALYSIS',
+            'Whether to report section sizes, symbols and relocations of linked binaries (ELF)',
+            False
+        )
+    )
+
     # Directory for intermediate files
     command_line_variables.Add(
         PathVariable(
@@ -237,6 +532,26 @@ def _parse_default_command_line_options():
         )
     )
 
+    # Build profiling (a trace of all build steps for chrome://tracing or Perfetto)
+    command_line_variables.Add(
+        PathVariable(
+            'PROFILE_BUILD',
+            'Chrome trace event file into which the timings of all build steps will be written',
+            '',
+            PathVariable.PathAccept
+        )
+    )
+
+    # Starting the longest chains of build steps first, based on earlier builds (opt-in,
+    # the template's own build showed no measurable gain at -j8 or -j32)
+    command_line_variables.Add(
+        BoolVariable(
+            'CRITICAL_PATH_SCHEDULING',
+            'Whether to start the build steps with the longest chains behind them first',
+            False
+        )
+    )
+
     return command_line_variables
 
 # ----------------------------------------------------------------------------------------------- #
@@ -249,6 +564,33 @@ def _register_generic_extension_methods(environment):
     environment.AddMethod(_build_scons, "build_scons")
     environment.AddMethod(_is_debug_build, "is_debug_build")
 
+    _set_up_build_wide_services(environment)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _set_up_build_wide_services(environment):
+    """Sets up the helpers that are shared by all environments of a build
+
+    @param  environment  Environment whose settings will be used for the helpers
+    @remarks
+        Each of the helpers is only set up by the first environment created."""
+
+    intermediate_directory = os.path.join(
+        environment.Dir('#').abspath, environment['INTERMEDIATE_DIRECTORY']
+    )
+
+    # Directory listings for the enumerate_*() helpers are kept between builds
+    shared.use_tree_index(os.path.join(intermediate_directory, 'tree.index'))
+
+    if environment['PROFILE_BUILD']:
+        profiling.enable(os.path.join(environment.Dir('#').abspath, environment['PROFILE_BUILD']))
+
+    if environment['CRITICAL_PATH_SCHEDULING']:
+        scheduling.enable(os.path.join(intermediate_directory, 'build-history.cache'))
+
+    if environment['CONTENT_SIGNATURE_CACHE']:
+        content_signatures.enable(os.path.join(intermediate_directory, 'content-signatures.cache'))
+
 # ----------------------------------------------------------------------------------------------- #
 
 def _register_cplusplus_extension_methods(environment):
@@ -259,8 +601,12 @@ def _register_cplusplus_extension_methods(environment):
     environment.AddMethod(_add_cplusplus_package, "add_package")
     environment.AddMethod(_build_cplusplus_library, "build_library")
     environment.AddMethod(_build_cplusplus_library_with_tests, "build_library_with_tests")
+    environment.AddMethod(_build_cplusplus_library_pgo, "build_library_pgo")
+    environment.AddMethod(_build_cplusplus_library_with_benchmarks, "build_library_with_benchmarks")
     environment.AddMethod(_build_cplusplus_executable, "build_executable")
+    environment.AddMethod(_register_gdnative_dependencies, "register_gdnative_dependencies")
     environment.AddMethod(_run_cplusplus_unit_tests, "run_unit_tests")
+    environment.AddMethod(_run_cplusplus_benchmarks, "run_benchmarks")
 
 # ----------------------------------------------------------------------------------------------- #
 
@@ -341,13 +687,11 @@ def _set_standard_cplusplus_compiler_flags(environment):
         else:
             environment.Append(CXXFLAGS='/O2') # Optimize for speed
             environment.Append(CXXFLAGS='/Gy') # Function-level linking for better trimming
-            environment.Append(CXXFLAGS='/GL') # Whole program optimizaton (merged build)
             environment.Append(CXXFLAGS='/MD') # Link shared multithreaded release runtime
             environment.Append(CXXFLAGS='/Gw') # Enable whole-program *data* optimization
 
             environment.Append(CFLAGS='/O2') # Optimize for speed
             environment.Append(CFLAGS='/Gy') # Function-level linking for better trimming
-            environment.Append(CFLAGS='/GL') # Whole program optimizaton (merged build)
             environment.Append(CFLAGS='/MD') # Link shared multithreaded release runtime
             environment.Append(CFLAGS='/Gw') # Enable whole-program *data* optimization
 
@@ -375,10 +719,12 @@ def _set_standard_cplusplus_compiler_flags(environment):
             environment.Append(CFLAGS='-g') # Generate debugging information
         else:
             environment.Append(CXXFLAGS='-O3') # Optimize for speed
-            environment.Append(CXXFLAGS='-flto') # Merge all code before compiling
+            environment.Append(CXXFLAGS='-ffunction-sections') # Section per function for GC
+            environment.Append(CXXFLAGS='-fdata-sections') # Section per variable for GC
 
             environment.Append(CFLAGS='-O3') # Optimize for speed
-            environment.Append(CFLAGS='-flto') # Merge all code before compiling
+            environment.Append(CFLAGS='-ffunction-sections') # Section per function for GC
+            environment.Append(CFLAGS='-fdata-sections') # Section per variable for GC
 
 # ----------------------------------------------------------------------------------------------- #
 
@@ -388,137 +734,696 @@ def _set_standard_cplusplus_linker_flags(environment):
     @param  environment  Environment in which the C++ compiler linker wlll be set."""
 
     if platform.system() == 'Windows':
-        if _is_debug_build(environment):
-            pass
-        else:
-            environment.Append(LINKFLAGS='/LTCG') # Merge all code before compiling
-            environment.Append(LIBFLAGS='/LTCG') # Merge all code before compiling
-
+        if not _is_debug_build(environment):
+            environment.Append(LINKFLAGS='/OPT:REF') # Drop unreferenced functions and data
+            environment.Append(LINKFLAGS='/OPT:ICF') # Fold identical functions
     else:
         environment.Append(LINKFLAGS='-z defs') # Detect unresolved symbols in shared object
         environment.Append(LINKFLAGS='-Bsymbolic') # Prevent replacement on shared object syms
+        if not _is_debug_build(environment):
+            environment.Append(LINKFLAGS='-Wl,--gc-sections') # Drop unreferenced sections
 
 # ----------------------------------------------------------------------------------------------- #
 
-def _build_scons(environment, source, arguments, target):
-    """Builds another SCons script.
+def _enable_fast_link(environment):
+    """Sets up the linker and debug information for the shortest possible link times
 
-    @param  environment  Environment that will be used to search for the SCons executable
-    @param  source       Input file(s) for the build
-    @param  arguments    Arguments that will be passed to SCons
-    @param  target       Output file(s) produced by the build
-    @returns A scons build action producing the target file"""
+    @param  environment  Environment whose linker settings will be adjusted
+    @remarks
+        Picks the fastest linker available (mold, lld, gold, then bfd). In debug builds,
+        debug information is kept in .dwo files next to the object files rather than
+        being copied into the binary, an index for the debugger is generated by the
+        linker and the remaining debug sections are compressed. The .dwo files are not
+        compressed since the dwp tools can't read compressed .dwo files."""
 
-    # Clone the environment and use the real search PATH. This will not pollute
-    # the environment in which the SCons subprocess runs, but is the only way
-    # to invoke SCons in Windows because it's a batch file that exepcts Python
-    # to also be in the system search PATH.
-    cloned_environment = environment.Clone(ENV=os.environ)
+    if platform.system() == 'Windows':
+        if _is_debug_build(environment):
+            environment.Append(LINKFLAGS='/DEBUG:FASTLINK') # Leave debug info in the .obj files
+        return
+
+    linker = cplusplus.find_fastest_linker(environment)
+    if (linker is not None) and (linker != 'bfd'):
+        environment.Append(LINKFLAGS='-fuse-ld=' + linker)
+
+    if _is_debug_build(environment):
+        environment.Append(CCFLAGS='-gsplit-dwarf') # Debug information goes into .dwo files
+        environment.Append(LINKFLAGS='-gz') # Compress debug sections in the linked binary
+        if (linker is not None) and (linker != 'bfd'):
+            environment.Append(LINKFLAGS='-Wl,--gdb-index') # Index so gdb loads .dwo lazily
+
+        # The .dwo files are packaged into a .dwp file for installation. GNU's dwp
+        # and gold can't handle DWARF 5, so stay with DWARF 4 if we have to use them.
+        dwp_executable = environment.WhereIs('llvm-dwp')
+        if (dwp_executable is None) or (linker == 'gold'):
+            environment.Append(CCFLAGS='-gdwarf-4')
+            if dwp_executable is None:
+                dwp_executable = environment.WhereIs('dwp')
+
+        environment['SPLIT_DEBUG_INFORMATION'] = True
+        environment['DWP'] = dwp_executable
 
-    # Try to locate SCons with the environment's new search path
-    scons_path = cloned_environment.WhereIs('scons')
+# ----------------------------------------------------------------------------------------------- #
 
-    # If not found, try with SCons.Util.WhereIs() which actually works differently
-    # from environment.WhereIs()...
-    if scons_path is None:
-        scons_path = WhereIs('scons')
+def _enable_link_time_optimization(environment):
+    """Sets up link-time optimization in the mode selected via the LTO variable
 
-    # Still not found? Just blindly shout 'scons' and if it fails that will
-    # at least produce a meaningful error message that might make the user add
-    # SCons to the system search PATH.
-    if scons_path is None:
-        scons_path = 'scons'
+    @param  environment  Environment whose compiler and linker settings will be adjusted
+    @remarks
+        'full' merges all code at link time and generates the machine code in parallel
+        jobs. 'thin' uses ThinLTO with clang, keeping a cache of optimized modules in
+        the intermediate directory so that relinks only redo the modules that changed.
+        MSVC does the same via incremental LTCG, GCC has no ThinLTO and uses its
+        incremental LTO (GCC 15 and later) or else falls back to 'full'."""
 
     if platform.system() == 'Windows':
-        return cloned_environment.Command(
-            source = source,
-            action = '"' + scons_path + '" ' + arguments,
-            target = target
-        )
+        environment.Append(CXXFLAGS='/GL') # Whole program optimizaton (merged build)
+        environment.Append(CFLAGS='/GL') # Whole program optimizaton (merged build)
+        if environment['LTO'] == 'thin':
+            environment.Append(LINKFLAGS='/LTCG:INCREMENTAL') # Only redo changed functions
+        else:
+            environment.Append(LINKFLAGS='/LTCG') # Merge all code before compiling
+        environment.Append(LIBFLAGS='/LTCG') # Merge all code before compiling
+        return
+
+    lto_cache_directory = os.path.join(
+        environment.Dir('#').abspath,
+        environment['INTERMEDIATE_DIRECTORY'],
+        environment.get_build_directory_name(),
+        'lto-cache'
+    )
+
+    if 'clang' in os.path.basename(cplusplus.get_compiler_name(environment)):
+
+        # The system's default linker (GNU ld) can't read LLVM bitcode, so unless
+        # FAST_LINK already picked a linker, use the best one that understands it
+        linker = cplusplus.find_fastest_linker(environment)
+        if (not environment['FAST_LINK']) and (linker is not None) and (linker != 'bfd'):
+            environment.Append(LINKFLAGS='-fuse-ld=' + linker)
+
+        if environment['LTO'] == 'thin':
+            environment.Append(CCFLAGS='-flto=thin') # Summarize modules for ThinLTO
+            environment.Append(LINKFLAGS='-flto=thin') # Optimize modules in parallel
+            if platform.system() == 'Darwin':
+                environment.Append(LINKFLAGS='-Wl,-cache_path_lto,' + lto_cache_directory)
+            elif linker == 'lld':
+                environment.Append(LINKFLAGS='-Wl,--thinlto-cache-dir=' + lto_cache_directory)
+            else:
+                environment.Append(LINKFLAGS='-Wl,-plugin-opt,cache-dir=' + lto_cache_directory)
+        else:
+            environment.Append(CCFLAGS='-flto=full') # Merge all code before compiling
+            environment.Append(LINKFLAGS='-flto=full') # Merge all code before compiling
+            if linker == 'lld':
+                environment.Append( # Generate machine code in parallel
+                    LINKFLAGS='-Wl,--lto-partitions=' + str(os.cpu_count() or 1)
+                )
+
     else:
-        return cloned_environment.Command(
-            source = source,
-            action = scons_path + ' ' + arguments,
-            target = target
-        )
+        environment.Append(CCFLAGS='-flto') # Merge all code before compiling
 
-# ----------------------------------------------------------------------------------------------- #
+        # GCC only does the link-time code generation in parallel if asked to
+        compiler_version = cplusplus.get_compiler_version(environment)
+        if compiler_version is None:
+            version = [ 0 ]
+        else:
+            version = [ int(part) for part in compiler_version[:1] ]
 
-def _add_cplusplus_package(environment, universal_package_name, universal_library_names = None):
-    """Adds a precompiled package consisting of some header files and a code library
-    to the current build.
+        if version >= [ 10 ]:
+            environment.Append(LINKFLAGS='-flto=auto') # Use make's jobserver or all cores
+        else:
+            environment.Append(LINKFLAGS='-flto=' + str(os.cpu_count() or 1))
 
-    @param  environment              Environment to which a package will be added
-    @param  universal_package_name   Name of the package that will be added to the build
-    @param  universal_library_names  Names of libraries (inside the package) that need to
-                                     be linked.
-    @remarks
-        If no universal_library_names are given, a library with the same name as
-        the package is assumed. The universal_library_name can be used if a package
-        offers multiple linkable library (i.e. boost modules, gtest + gtest_main)"""
+        if (environment['LTO'] == 'thin') and (version >= [ 15 ]):
+            environment.Append(LINKFLAGS='-flto-incremental=' + lto_cache_directory)
 
-    references_directory = os.path.join('..', environment['REFERENCES_DIRECTORY'])
-    package_directory = os.path.join(references_directory, universal_package_name)
+# ----------------------------------------------------------------------------------------------- #
 
-    # Path for the package's headers
-    include_directory = cplusplus.find_or_guess_include_directory(package_directory)
-    if include_directory is None:
-        raise FileNotFoundError('Could not find include directory for package')
+def _use_compiler_dependency_files(environment):
+    """Lets the compiler write a dependency file for each object file and takes
+    the object files' implicit dependencies from those instead of scanning the sources
 
-    environment.add_include_directory(include_directory)
+    @param  environment  Environment whose object files will use dependency files
+    @remarks
+        As long as an object file has no dependency file (or its source changed after
+        the dependency file was written), its sources are scanned like SCons would
+        normally do. Parsed dependency files are kept in a cache in the intermediate
+        directory, so a null build doesn't scan or parse anything at all."""
 
-    # Path for the package's libraries
-    library_directory = cplusplus.find_or_guess_library_directory(environment, package_directory)
-    if library_directory is None:
-        raise FileNotFoundError('Could not find library directory for package')
+    # MSVC writes dependency files since Visual Studio 2019 16.7 (cl.exe 19.27)
+    if platform.system() == 'Windows':
+        compiler_version = cplusplus.get_compiler_version(environment)
+        if compiler_version is None:
+            return
 
-    environment.add_library_directory(library_directory)
+        version = [ int(part) for part in compiler_version[:2] ]
+        if version < [ 19, 27 ]:
+            return
 
-    # Library that needs to be linked
-    if universal_library_names is None:
-        environment.add_library(universal_package_name)
-    elif isinstance(universal_library_names, list):
-        for universal_library_name in universal_library_names:
-            environment.add_library(universal_library_name)
+        environment.Append(CCFLAGS = [ '/sourceDependencies', '${TARGET}.json' ])
+        dependency_file_suffix = '.json'
     else:
-        environment.add_library(universal_library_names)
+        environment.Append(CCFLAGS = [ '-MMD', '-MF', '${TARGET}.d' ])
+        dependency_file_suffix = '.d'
+
+    # Object files taken from the build cache need their dependency files, too
+    environment['BUILD_CACHE_COMPANION_SUFFIXES'] = [ dependency_file_suffix ]
+
+    global _dependency_file_cache_path
+    if _dependency_file_cache_path is None:
+        _dependency_file_cache_path = os.path.join(
+            environment.Dir('#').abspath,
+            environment['INTERMEDIATE_DIRECTORY'],
+            'dependencies.cache'
+        )
+        atexit.register(_save_dependency_file_cache)
+
+    no_scanner = ScannerBase(_scan_nothing, name = 'NoScanner')
+    dependency_file_scanner = ScannerBase(
+        _scan_dependency_file,
+        name = 'DependencyFileScanner',
+        path_function = FindPathDirs('CPPPATH')
+    )
+
+    # The dependency file belongs to the object file, so it is read by a target
+    # scanner while the sources themselves are no longer scanned
+    for builder_name in [ 'StaticObject', 'SharedObject' ]:
+        builder = environment['BUILDERS'][builder_name]
+        builder = getattr(builder, 'builder', builder) # Unwrap SCons' CompositeBuilder
+        builder.source_scanner = no_scanner
+        builder.target_scanner = dependency_file_scanner
 
 # ----------------------------------------------------------------------------------------------- #
 
-def _build_cplusplus_library(
-  environment, universal_library_name, static = False, sources = None
-):
-    """Creates a shared C/C++ library
+def _scan_nothing(node, env, path):
+    """Scanner function that doesn't find any dependencies
 
-    @param  environment             Environment controlling the build settings
-    @param  universal_library_name  Name of the library in universal format
-                                    (i.e. 'My.Awesome.Stuff')
-    @param  static                  Whether to build a static library (default: no)
-    @param  sources                 Source files to use (None = auto)
-    @remarks
-        Assumes the default conventions, i.e. all source code is contained in a directory
-        named 'Source' and all headers in a directory named 'Include'.
+    @param  node  Node that would be scanned
+    @param  env   Environment the node is built in
+    @param  path  Directories that would be searched for includes
+    @returns An empty list"""
 
-        See get_platform_specific_library_name() for how the universal_library_name parameter
-        is used to produce the output filename on different platforms."""
+    return []
 
-    environment = environment.Clone()
+# ----------------------------------------------------------------------------------------------- #
 
-    # Include directories
-    # These will automatically be scanned by SCons for changes
-    environment.add_include_directory(environment['HEADER_DIRECTORY'])
+def _scan_dependency_file(node, env, path):
+    """Looks up the dependencies of an object file from its dependency file
 
-    # Recursively search for the source code files or transform the existing file list
-    sources = _add_variantdir_and_enumerate_cplusplus_sources(
-        environment, environment['SOURCE_DIRECTORY'], sources
-    )
-    library_path = _put_in_intermediate_path(
-        environment, cplusplus.get_platform_specific_library_name(universal_library_name, static)
-    )
+    @param  node  Object file whose dependencies will be looked up
+    @param  env   Environment the object file is built in
+    @param  path  Directories searched for includes
+    @returns The headers the object file's sources included when last compiled
+    @remarks
+        The dependencies are sorted so they're listed in the same order no matter
+        whether they came from scanning or from a dependency file. Otherwise, SCons
+        would see a changed dependency list and rebuild the object file."""
 
     if platform.system() == 'Windows':
-        if _is_debug_build(environment):
-            pdb_file_path = os.path.splitext(library_path)[0] + '.pdb'
+        dependency_file_path = node.abspath + '.json'
+    else:
+        dependency_file_path = node.abspath + '.d'
+
+    dependency_paths = _get_cached_dependencies(dependency_file_path, node.sources)
+
+    # A dependency file written by a different command (i.e. before a precompiled header
+    # was turned on) may list different headers than the next compile will include
+    if dependency_paths is not None:
+        if _was_built_with_different_command(node):
+            dependency_paths = None
+
+    # Without a dependency file, scan the sources just like SCons normally would
+    if dependency_paths is None:
+        dependencies = set()
+        for source in node.sources:
+            dependencies.update(source.get_implicit_deps(env, CScanner, lambda scanner: path))
+
+        return sorted(dependencies, key = str)
+
+    # Paths in the dependency file are relative to where the compiler was run
+    top_directory = env.Dir('#').abspath
+
+    # The sources are already dependencies (via their variant dir path, if any)
+    sources = set(node.sources)
+    for source in node.sources:
+        sources.add(source.srcnode())
+
+    # Headers covered by a precompiled header are missing from the object file's
+    # dependency file, so take them from the precompiled header's dependency file
+    precompiled_header = env.get('PRECOMPILED_HEADER_BINARY')
+    if precompiled_header is not None:
+        precompiled_header_dependency_paths = _get_cached_dependencies(
+            precompiled_header.abspath + os.path.splitext(dependency_file_path)[1],
+            precompiled_header.sources
+        )
+        if precompiled_header_dependency_paths is not None:
+            dependency_paths = dependency_paths + precompiled_header_dependency_paths
+
+    dependencies = set()
+    for dependency_path in dependency_paths:
+        dependency = env.fs.File(os.path.join(top_directory, dependency_path))
+        if dependency in sources:
+            continue
+
+        # The generated prefix header is not included by the sources themselves
+        if (precompiled_header is not None) and (dependency.dir == precompiled_header.dir):
+            continue
+
+        # Headers that were deleted since won't be included anymore or fail the build
+        if dependency.exists() or dependency.is_derived():
+            dependencies.add(dependency)
+
+    return sorted(dependencies, key = str)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _was_built_with_different_command(node):
+    """Checks whether a node was last built with a different command than it would be now
+
+    @param  node  Node whose previous build command will be checked
+    @returns True if the node was last built with a different command"""
+
+    try:
+        stored_action_signature = node.get_stored_info().binfo.bactsig
+    except AttributeError:
+        return True # Never built or built by an older SCons version
+
+    action_signature = hash_signature(node.get_executor().get_contents())
+    return action_signature != stored_action_signature
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_cached_dependencies(dependency_file_path, sources):
+    """Reads a dependency file or takes its contents from the dependency file cache
+
+    @param  dependency_file_path  Absolute path of the dependency file
+    @param  sources               Source files the object file is compiled from
+    @returns The paths listed in the dependency file or None if it doesn't exist
+             or is older than one of the sources"""
+
+    try:
+        dependency_file_status = os.stat(dependency_file_path)
+        for source in sources:
+            source_status = os.stat(source.srcnode().abspath)
+            if source_status.st_mtime_ns > dependency_file_status.st_mtime_ns:
+                return None # The source may include different headers now
+    except OSError:
+        return None
+
+    global _dependency_file_cache, _dependency_file_cache_changed
+    if _dependency_file_cache is None:
+        _dependency_file_cache = _load_dependency_file_cache()
+
+    cache_entry = _dependency_file_cache.get(dependency_file_path)
+    if cache_entry is not None:
+        if cache_entry[0] == dependency_file_status.st_mtime_ns:
+            if cache_entry[1] == dependency_file_status.st_size:
+                return cache_entry[2]
+
+    try:
+        dependency_paths = cplusplus.read_dependency_file(dependency_file_path)
+    except (OSError, ValueError, KeyError):
+        return None
+
+    _dependency_file_cache[dependency_file_path] = (
+        dependency_file_status.st_mtime_ns, dependency_file_status.st_size, dependency_paths
+    )
+    _dependency_file_cache_changed = True
+
+    return dependency_paths
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _load_dependency_file_cache():
+    """Loads the dependency file cache persisted by an earlier build
+
+    @returns The dependency file cache or an empty dictionary if there is none"""
+
+    dependency_file_cache = shared.load_pickled(
+        _dependency_file_cache_path, _dependency_file_cache_version
+    )
+    if dependency_file_cache is None:
+        return {}
+
+    return dependency_file_cache
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _save_dependency_file_cache():
+    """Persists the dependency file cache if it was changed during the build"""
+
+    if not _dependency_file_cache_changed:
+        return
+
+    shared.save_pickled(
+        _dependency_file_cache_path, _dependency_file_cache_version, _dependency_file_cache
+    )
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _enable_compile_cache(environment):
+    """Routes all C/C++ compiler invocations through the compile cache
+
+    @param  environment  Environment whose compiler invocations will be cached
+    @remarks
+        The wrapper is excluded from SCons' command signatures, so turning the compile
+        cache on or off doesn't cause everything to be recompiled. See compile-cache.py
+        for how the cache key is formed."""
+
+    cache_directory = environment['COMPILE_CACHE_DIRECTORY']
+    if not cache_directory:
+        cache_directory = shared.get_default_cache_directory('compile-cache')
+    cache_directory = os.path.abspath(cache_directory)
+
+    script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'compile-cache.py')
+
+    wrapper = (
+        '$( "' + sys.executable + '" "' + script_path + '"' +
+        ' "' + cache_directory + '"' +
+        ' ' + str(environment['COMPILE_CACHE_MAXIMUM_SIZE']) +
+        ' -- $) '
+    )
+    for command_variable in [ 'CCCOM', 'SHCCCOM', 'CXXCOM', 'SHCXXCOM' ]:
+        environment[command_variable] = wrapper + environment[command_variable]
+
+    # Report how well the cache did when the build is finished
+    if cache_directory not in _compile_cache_statistics_baselines:
+        if len(_compile_cache_statistics_baselines) == 0:
+            atexit.register(_print_compile_cache_statistics)
+
+        _compile_cache_statistics_baselines[cache_directory] = (
+            compile_cache.read_statistics(cache_directory)
+        )
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _enable_build_cache(environment, category):
+    """Takes the environment's built files from the build cache and stores them in it
+
+    @param  environment  Environment whose built files will be cached
+    @param  category     Kind of build steps the hits and misses are reported under
+    @remarks
+        Unlike the compile cache, this caches the outputs of all build steps (by their
+        SCons build signature), so Blender exports and linked libraries are shared, too.
+        See build-cache.py for the size limit and the statistics."""
+
+    cache_directory = os.path.join(
+        environment.Dir('#').abspath, os.path.expanduser(environment['BUILD_CACHE'])
+    )
+
+    build_cache.enable(
+        environment, cache_directory, environment['BUILD_CACHE_MAXIMUM_SIZE'], category
+    )
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _enable_compile_cost_report(environment):
+    """Records the compile time spent on each header and reports it after the build
+
+    @param  environment  Environment whose compiles will be measured
+    @remarks
+        The compiler flags become part of the command signatures, so turning the report
+        on recompiles everything and the report covers the whole library. See
+        compile-cost.py for how the costs are measured with GCC and clang."""
+
+    compiler_flags = compile_cost.get_compiler_flags(cplusplus.get_compiler_name(environment))
+    if compiler_flags is None:
+        print('Compile cost reports need GCC or clang, COMPILE_COST_REPORT is ignored')
+        return
+
+    environment.Append(CCFLAGS = compiler_flags)
+
+    script_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'compile-cost.py')
+    wrapper = '$( "' + sys.executable + '" "' + script_path + '" -- $) '
+    for command_variable in [ 'CCCOM', 'SHCCCOM', 'CXXCOM', 'SHCXXCOM' ]:
+        environment[command_variable] = wrapper + environment[command_variable]
+
+    # Write the report when the build is finished
+    report_path = os.path.join(environment.Dir('#').abspath, environment['COMPILE_COST_REPORT'])
+    if report_path not in _compile_cost_reports:
+        if len(_compile_cost_reports) == 0:
+            atexit.register(_write_compile_cost_reports)
+
+        _compile_cost_reports[report_path] = os.path.join(
+            environment.Dir('#').abspath, environment['INTERMEDIATE_DIRECTORY']
+        )
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _write_compile_cost_reports():
+    """Writes the compile cost reports and prints the most expensive headers"""
+
+    for report_path, intermediate_directory in _compile_cost_reports.items():
+        object_paths = _get_measured_object_paths(report_path, intermediate_directory)
+        report_lines = compile_cost.write_report(object_paths, report_path)
+        if report_lines is not None:
+            print('\n'.join(report_lines))
+            print('Full compile cost report written to \033[94m' + report_path + '\033[0m')
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_measured_object_paths(report_path, intermediate_directory):
+    """Lists the object files of the current build whose compile costs go into a report
+
+    @param  report_path             Path of the compile cost report
+    @param  intermediate_directory  Intermediate directory of the environments writing it
+    @returns The absolute paths of the object files that have a cost file
+    @remarks
+        Cost files left over from deleted sources are not part of the build and the
+        ISA variants and instrumented PGO builds use their own intermediate directories,
+        so neither of them shows up in the report."""
+
+    object_paths = []
+
+    file_system = SCons.Node.FS.get_default_fs()
+    for root_directory in list(file_system.Root.values()):
+        for node in list(root_directory._lookupDict.values()):
+            if not isinstance(node, SCons.Node.FS.File) or not node.has_builder():
+                continue
+
+            object_path = node.get_abspath()
+            if not os.path.isfile(object_path + compile_cost.cost_file_extension):
+                continue
+
+            build_environment = node.get_build_env()
+            if not build_environment.get('COMPILE_COST_REPORT'):
+                continue
+
+            top_directory = build_environment.Dir('#').abspath
+            node_report_path = os.path.join(
+                top_directory, build_environment['COMPILE_COST_REPORT']
+            )
+            node_intermediate_directory = os.path.join(
+                top_directory, build_environment['INTERMEDIATE_DIRECTORY']
+            )
+            if (node_report_path == report_path) and (
+                node_intermediate_directory == intermediate_directory
+            ):
+                object_paths.append(object_path)
+
+    return object_paths
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _enable_remote_execution(environment):
+    """Sends C/C++ compiles, Blender exports and Godot calls to a remote worker
+
+    @param  environment  Environment whose actions will be run by the worker
+    @remarks
+        The worker is started with remote-worker.py (see there). Like the compile cache,
+        the launcher is excluded from SCons' command signatures. Actions that have other
+        inputs besides their sources can list them in REMOTE_EXECUTION_INPUTS.
+
+        The worker's secret is taken from the REMOTE_EXECUTION_TOKEN environment
+        variable and handed to the launcher through the environment, so it never
+        appears on a command line or in the build log."""
+
+    token = os.environ.get('REMOTE_EXECUTION_TOKEN')
+    if not token:
+        print('REMOTE_EXECUTION_TOKEN is not set, all actions will run locally')
+    else:
+        environment['ENV']['REMOTE_EXECUTION_TOKEN'] = token
+
+    script_path = os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), 'remote-execution.py'
+    )
+    launcher = '"' + sys.executable + '" "' + script_path + '" "$REMOTE_EXECUTION"'
+
+    environment['REMOTE_EXECUTION_INPUTS'] = []
+    environment['REMOTE_EXECUTION_LAUNCHER'] = (
+        '$( ' + launcher +
+        ' --inputs $SOURCES $REMOTE_EXECUTION_INPUTS --outputs $TARGETS -- $)'
+    )
+
+    # Compiles find out their included headers and additional outputs by themselves
+    compile_launcher = '$( ' + launcher + ' --compile -- $) '
+    for command_variable in [ 'CCCOM', 'SHCCCOM', 'CXXCOM', 'SHCXXCOM' ]:
+        if command_variable in environment:
+            environment[command_variable] = compile_launcher + environment[command_variable]
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _print_compile_cache_statistics():
+    """Prints the hits and misses of the compile cache during this build"""
+
+    for cache_directory, baseline in _compile_cache_statistics_baselines.items():
+        hit_count, miss_count = compile_cache.read_statistics(cache_directory)
+        hit_count -= baseline[0]
+        miss_count -= baseline[1]
+        if hit_count + miss_count > 0:
+            print(
+                'Compile cache: \033[94m' + str(hit_count) + '\033[0m hits, ' +
+                '\033[94m' + str(miss_count) + '\033[0m misses'
+            )
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _build_scons(environment, source, arguments, target):
+    """Builds another SCons script.
+
+    @param  environment  Environment that will be used to search for the SCons executable
+    @param  source       Input file(s) for the build
+    @param  arguments    Arguments that will be passed to SCons
+    @param  target       Output file(s) produced by the build
+    @returns A scons build action producing the target file"""
+
+    # Clone the environment and use the real search PATH. This will not pollute
+    # the environment in which the SCons subprocess runs, but is the only way
+    # to invoke SCons in Windows because it's a batch file that exepcts Python
+    # to also be in the system search PATH.
+    cloned_environment = environment.Clone(ENV=os.environ)
+
+    # Try to locate SCons with the environment's new search path
+    scons_path = cloned_environment.WhereIs('scons')
+
+    # If not found, try with SCons.Util.WhereIs() which actually works differently
+    # from environment.WhereIs()...
+    if scons_path is None:
+        scons_path = WhereIs('scons')
+
+    # Still not found? Just blindly shout 'scons' and if it fails that will
+    # at least produce a meaningful error message that might make the user add
+    # SCons to the system search PATH.
+    if scons_path is None:
+        scons_path = 'scons'
+
+    if platform.system() == 'Windows':
+        build = cloned_environment.Command(
+            source = source,
+            action = '"' + scons_path + '" ' + arguments,
+            target = target,
+            PROFILE_CATEGORY = 'build_scons'
+        )
+    else:
+        build = cloned_environment.Command(
+            source = source,
+            action = scons_path + ' ' + arguments,
+            target = target,
+            PROFILE_CATEGORY = 'build_scons'
+        )
+
+    # The nested build produces more than its targets, so it always has to run
+    cloned_environment.NoCache(build)
+
+    return build
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _add_cplusplus_package(environment, universal_package_name, universal_library_names = None):
+    """Adds a precompiled package consisting of some header files and a code library
+    to the current build.
+
+    @param  environment              Environment to which a package will be added
+    @param  universal_package_name   Name of the package that will be added to the build
+    @param  universal_library_names  Names of libraries (inside the package) that need to
+                                     be linked.
+    @remarks
+        If no universal_library_names are given, a library with the same name as
+        the package is assumed. The universal_library_name can be used if a package
+        offers multiple linkable library (i.e. boost modules, gtest + gtest_main)"""
+
+    references_directory = os.path.join('..', environment['REFERENCES_DIRECTORY'])
+    package_directory = os.path.join(references_directory, universal_package_name)
+
+    # Path for the package's headers
+    include_directory = cplusplus.find_or_guess_include_directory(package_directory)
+    if include_directory is None:
+        raise FileNotFoundError('Could not find include directory for package')
+
+    environment.add_include_directory(include_directory)
+
+    # Path for the package's libraries
+    library_directory = cplusplus.find_or_guess_library_directory(environment, package_directory)
+    if library_directory is None:
+        raise FileNotFoundError('Could not find library directory for package')
+
+    environment.add_library_directory(library_directory)
+
+    # Library that needs to be linked
+    if universal_library_names is None:
+        environment.add_library(universal_package_name)
+    elif isinstance(universal_library_names, list):
+        for universal_library_name in universal_library_names:
+            environment.add_library(universal_library_name)
+    else:
+        environment.add_library(universal_library_names)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _build_cplusplus_library(
+  environment, universal_library_name, static = False, sources = None, isa_variants = None,
+  exported_symbols = None
+):
+    """Creates a shared C/C++ library
+
+    @param  environment             Environment controlling the build settings
+    @param  universal_library_name  Name of the library in universal format
+                                    (i.e. 'My.Awesome.Stuff')
+    @param  static                  Whether to build a static library (default: no)
+    @param  sources                 Source files to use (None = auto)
+    @param  isa_variants            x86-64 instruction set levels to build the shared
+                                    library for (None = use ISA_VARIANTS)
+    @param  exported_symbols        Names of the only symbols the shared library will
+                                    export (None = use EXPORTED_SYMBOLS)
+    @remarks
+        Assumes the default conventions, i.e. all source code is contained in a directory
+        named 'Source' and all headers in a directory named 'Include'.
+
+        See get_platform_specific_library_name() for how the universal_library_name parameter
+        is used to produce the output filename on different platforms.
+
+        If instruction set levels are given for an amd64 build, a loader library that picks
+        the best variant at runtime is built under the library's name (see multiversion.py).
+
+        If exported symbols are given (i.e. gdnative_exports for a GDNative library),
+        a linker version script (.def file with MSVC) is generated that exports only
+        those symbols, even if others were declared with default visibility by code
+        linked into the library. All listed symbols must exist in the library."""
+
+    if isa_variants is None:
+        isa_variants = list(environment['ISA_VARIANTS'])
+    if (not static) and (len(isa_variants) > 0) and (environment['TARGET_ARCH'] == 'amd64'):
+        return _build_cplusplus_isa_variant_libraries(
+            environment, universal_library_name, sources, isa_variants, exported_symbols
+        )
+
+    environment = environment.Clone()
+    if exported_symbols is not None:
+        environment['EXPORTED_SYMBOLS'] = exported_symbols
+
+    # Include directories
+    # These will automatically be scanned by SCons for changes
+    environment.add_include_directory(environment['HEADER_DIRECTORY'])
+
+    # Recursively search for the source code files or transform the existing file list
+    sources = _add_variantdir_and_enumerate_cplusplus_sources(
+        environment, environment['SOURCE_DIRECTORY'], sources
+    )
+    library_path = _put_in_intermediate_path(
+        environment, cplusplus.get_platform_specific_library_name(universal_library_name, static)
+    )
+
+    if platform.system() == 'Windows':
+        if _is_debug_build(environment):
+            pdb_file_path = os.path.splitext(library_path)[0] + '.pdb'
             pdb_file_absolute_path = environment.File(pdb_file_path).srcnode().abspath
             environment.Append(CXXFLAGS='/Fd"' + pdb_file_absolute_path + '"')
             environment.Append(CFLAGS='/Fd"' + pdb_file_absolute_path + '"')
@@ -526,20 +1431,129 @@ def _build_cplusplus_library(
         environment.Append(CXXFLAGS='-fpic') # Use position-independent code
         environment.Append(CFLAGS='-fpic') # Use position-independent code
 
+    sources = _build_cplusplus_objects(
+        environment, universal_library_name, sources, shared = not static
+    )
+
     # Build either a static or a shared library
     build_library = None
     if static:
         build_library = environment.StaticLibrary(library_path, sources)
     else:
+        limit_exported_symbols = _limit_exported_symbols(environment, library_path)
         build_library = environment.SharedLibrary(library_path, sources)
+        environment.Depends(build_library, limit_exported_symbols)
+        _analyze_binary_if_enabled(environment, build_library)
 
     # If we're on Windows, a side effect of building a library in debug mode is
     # that a PDB file will be generated. Deal with that.
     if (platform.system() == 'Windows') and _is_debug_build(environment):
         build_debug_database = environment.SideEffect(pdb_file_absolute_path, build_library)
         return build_library + build_debug_database
-    else:
+    elif static:
         return build_library
+    else:
+        return build_library + _package_split_debug_information(environment, build_library)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _build_cplusplus_isa_variant_libraries(
+    environment, universal_library_name, sources, isa_variants, exported_symbols = None
+):
+    """Builds a shared library for several instruction set levels and a loader for them
+
+    @param  environment             Environment controlling the build settings
+    @param  universal_library_name  Name of the library in universal format
+    @param  sources                 Source files to use (None = auto)
+    @param  isa_variants            x86-64 instruction set levels to build the library for
+    @param  exported_symbols        Names of the only symbols the variants will export
+                                    (None = use EXPORTED_SYMBOLS)
+    @returns The loader library followed by the variant libraries and their debug information
+    @remarks
+        Each variant is compiled in its own intermediate directory and named after its
+        instruction set level (i.e. 'My.Awesome.Stuff-x86-64-v3'), so the variants are
+        independent build steps that run in parallel.
+
+        The loader takes the library's regular file name, so GDNativeLibrary resources
+        keep their entry, but need the variants listed as dependencies for exports
+        (see register_gdnative_dependencies()). It forwards the functions listed in
+        ISA_VARIANT_ENTRY_POINTS, by default the symbols the variants export or, if those
+        aren't limited, all GDNative and NativeScript entry points.
+
+        The x86-64 baseline variant is always built, so any x86-64 CPU can load one."""
+
+    if exported_symbols is None:
+        exported_symbols = environment.get('EXPORTED_SYMBOLS')
+
+    variants = []
+    build_variant_libraries = []
+    for isa_variant in multiversion.sort_by_level(isa_variants):
+        variant_environment = environment.Clone()
+        variant_environment['INTERMEDIATE_DIRECTORY'] = os.path.join(
+            environment['INTERMEDIATE_DIRECTORY'], 'isa-' + isa_variant
+        )
+        variant_environment.Append(
+            CCFLAGS = multiversion.get_compiler_flags(variant_environment, isa_variant)
+        )
+
+        build_variant_library = _build_cplusplus_library(
+            variant_environment, universal_library_name + '-' + isa_variant,
+            sources = sources, isa_variants = [], exported_symbols = exported_symbols
+        )
+        variants.append((os.path.basename(str(build_variant_library[0])), isa_variant))
+        build_variant_libraries += build_variant_library
+
+    # The loader is plain C compiled for the baseline, it only depends on the OS
+    loader_environment = environment.Clone()
+    loader_environment['LIBS'] = []
+    loader_environment['EXPORTED_SYMBOLS'] = None # Only the forwarders are exported anyway
+
+    loader_source_path = _put_in_intermediate_path(
+        environment, universal_library_name + '.Loader.c'
+    )
+    entry_points = environment.get('ISA_VARIANT_ENTRY_POINTS')
+    if entry_points is None:
+        entry_points = exported_symbols or multiversion.gdnative_entry_points
+
+    generate_loader_source = multiversion.generate_loader(
+        loader_environment, loader_source_path, variants, entry_points
+    )
+
+    library_path = _put_in_intermediate_path(
+        environment, cplusplus.get_platform_specific_library_name(universal_library_name)
+    )
+
+    if platform.system() == 'Windows':
+        build_loader = loader_environment.SharedLibrary(library_path, generate_loader_source)
+    else:
+        loader_environment.Append(CFLAGS='-fpic') # Use position-independent code
+        loader_environment.add_library('dl') # For dlopen() on glibc before 2.34
+        build_loader = loader_environment.SharedLibrary(library_path, generate_loader_source)
+        _analyze_binary_if_enabled(loader_environment, build_loader)
+        build_loader += _package_split_debug_information(loader_environment, build_loader)
+
+    return build_loader + build_variant_libraries
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _register_gdnative_dependencies(environment, resource_path, libraries):
+    """Lists the ISA variants of a library as dependencies in its GDNativeLibrary resource
+
+    @param  environment    Environment the library was built in
+    @param  resource_path  Path of the GDNativeLibrary resource (.gdnlib/.tres)
+    @param  libraries      Installed files of the library, as returned by Install()
+    @returns The build step that updates the resource
+    @remarks
+        Godot's export only includes the files a GDNativeLibrary resource names, so this
+        is needed for exported games to contain the variants the loader picks from."""
+
+    stamp_path = _put_in_intermediate_path(
+        environment, os.path.basename(resource_path) + '.dependencies'
+    )
+
+    return multiversion.register_gdnative_dependencies(
+        environment, resource_path, libraries, stamp_path
+    )
 
 # ----------------------------------------------------------------------------------------------- #
 
@@ -574,204 +1588,533 @@ def _build_cplusplus_executable(
         environment, cplusplus.get_platform_specific_executable_name(universal_executable_name)
     )
 
-    # On Windows, there is a distinguishment between console (shell) applications
-    # and GUI applications. Add the appropriate flag if needed.
-    if platform.system() == 'Windows':
-        if console:
-            environment.Append(LINKFLAGS='/SUBSYSTEM:CONSOLE')
+    # On Windows, there is a distinguishment between console (shell) applications
+    # and GUI applications. Add the appropriate flag if needed.
+    if platform.system() == 'Windows':
+        if console:
+            environment.Append(LINKFLAGS='/SUBSYSTEM:CONSOLE')
+
+        if _is_debug_build(environment):
+            pdb_file_path = os.path.splitext(executable_path)[0] + '.pdb'
+            pdb_file_absolute_path = environment.File(pdb_file_path).srcnode().abspath
+            environment.Append(CXXFLAGS='/Fd"' + pdb_file_absolute_path + '"')
+            environment.Append(CFLAGS='/Fd"' + pdb_file_absolute_path + '"')
+    else:
+        environment.Append(CXXFLAGS='-fpic') # Use position-independent code
+        environment.Append(CXXFLAGS='-fpie') # Use position-independent code
+        environment.Append(CFLAGS='-fpic') # Use position-independent code
+        environment.Append(CFLAGS='-fpie') # Use position-independent code
+
+    sources = _build_cplusplus_objects(
+        environment, universal_executable_name, sources, shared = False
+    )
+
+    # Build the executable
+    build_executable = environment.Program(executable_path, sources)
+    _analyze_binary_if_enabled(environment, build_executable)
+    if (platform.system() == 'Windows') and _is_debug_build(environment):
+        build_debug_database = environment.SideEffect(pdb_file_absolute_path, build_executable)
+        return build_executable + build_debug_database
+    else:
+        return build_executable + _package_split_debug_information(environment, build_executable)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _build_cplusplus_library_with_tests(
+    environment, universal_library_name, universal_test_executable_name,
+    sources = None, test_sources = None
+):
+    """Creates a C/C++ shared library and also builds a unit test executable or it
+
+    @param  environment                Environment controlling the build settings
+    @param  universal_executable_name  Name of the library in universal format
+                                       (i.e. 'My.Awesome.Stuff')
+    @param  sources                    Source files to use (None = auto)
+    @param  test_sources               Source files to use for the unit tests (None = auto)
+    @remarks
+        Assumes the default conventions, i.e. all source code is contained in a directory
+        named 'Source' and all headers in a directory named 'Include'.
+
+        In addition to the convenience factor, this method also avoids SCons warnings about
+        two environments producing the same intermediate files (or having to compile everything
+        twice) by first building a static library, then producing a shared library from it
+        and producing the unit test executabel from it together with the unit test sources.
+
+        See get_platform_specific_executable_name() for how the universal_library_name
+        parameter is used to produce the output filename on different platforms."""
+
+    # Recursively search for the source code files or transform the existing file list
+    sources = _add_variantdir_and_enumerate_cplusplus_sources(
+        environment, environment['SOURCE_DIRECTORY'], sources
+    )
+    test_sources = _add_variantdir_and_enumerate_cplusplus_sources(
+        environment, environment['TESTS_DIRECTORY'], test_sources
+    )
+
+    # Build a static library that we can reuse for the shared library and test executable
+    compile_static_library, intermediate_library_name = _build_intermediate_static_library(
+        environment, universal_library_name, sources
+    )
+
+    # Build a shared library using nothing but the static library for sources
+    compile_shared_library = _build_shared_library_from_static_library(
+        environment, universal_library_name, intermediate_library_name
+    )
+
+    compile_unit_tests = _build_executable_from_static_library(
+        environment, universal_test_executable_name, test_sources,
+        intermediate_library_name, 'gtest', [ 'gtest', 'gtest_main' ]
+    )
+
+    environment.Depends(compile_shared_library, compile_static_library)
+    environment.Depends(compile_unit_tests, compile_static_library)
+
+    return compile_shared_library + compile_unit_tests
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _build_cplusplus_library_with_benchmarks(
+    environment, universal_library_name, universal_benchmark_executable_name,
+    sources = None, benchmark_sources = None,
+    universal_test_executable_name = None, test_sources = None
+):
+    """Creates a C/C++ shared library and also builds a benchmark executable for it
+
+    @param  environment                          Environment controlling the build settings
+    @param  universal_library_name               Name of the library in universal format
+                                                 (i.e. 'My.Awesome.Stuff')
+    @param  universal_benchmark_executable_name  Name of the benchmark executable
+    @param  sources                              Source files to use (None = auto)
+    @param  benchmark_sources                    Source files to use for the benchmarks
+                                                 (None = auto)
+    @param  universal_test_executable_name       Name of a unit test executable that will
+                                                 be built, too (None = no unit tests)
+    @param  test_sources                         Source files to use for the unit tests
+                                                 (None = auto)
+    @remarks
+        Works like build_library_with_tests(): the library is compiled once into a static
+        library from which the shared library, the benchmark executable (linked with
+        Google Benchmark) and, if requested, the unit test executable are produced.
+
+        Benchmark sources are taken from the BENCHMARKS_DIRECTORY ('Benchmarks')."""
+
+    # Recursively search for the source code files or transform the existing file list
+    sources = _add_variantdir_and_enumerate_cplusplus_sources(
+        environment, environment['SOURCE_DIRECTORY'], sources
+    )
+    benchmark_sources = _add_variantdir_and_enumerate_cplusplus_sources(
+        environment, environment['BENCHMARKS_DIRECTORY'], benchmark_sources
+    )
+
+    # Build a static library that we can reuse for all other binaries
+    compile_static_library, intermediate_library_name = _build_intermediate_static_library(
+        environment, universal_library_name, sources
+    )
+
+    compile_shared_library = _build_shared_library_from_static_library(
+        environment, universal_library_name, intermediate_library_name
+    )
+
+    compile_benchmarks = _build_executable_from_static_library(
+        environment, universal_benchmark_executable_name, benchmark_sources,
+        intermediate_library_name, 'benchmark', [ 'benchmark', 'benchmark_main' ]
+    )
+
+    environment.Depends(compile_shared_library, compile_static_library)
+    environment.Depends(compile_benchmarks, compile_static_library)
+
+    if universal_test_executable_name is None:
+        return compile_shared_library + compile_benchmarks
+
+    test_sources = _add_variantdir_and_enumerate_cplusplus_sources(
+        environment, environment['TESTS_DIRECTORY'], test_sources
+    )
+    compile_unit_tests = _build_executable_from_static_library(
+        environment, universal_test_executable_name, test_sources,
+        intermediate_library_name, 'gtest', [ 'gtest', 'gtest_main' ]
+    )
+    environment.Depends(compile_unit_tests, compile_static_library)
+
+    return compile_shared_library + compile_benchmarks + compile_unit_tests
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _build_intermediate_static_library(environment, universal_library_name, sources):
+    """Compiles the sources of a library into a static library other binaries are linked from
+
+    @param  environment             Environment controlling the build settings
+    @param  universal_library_name  Name of the library in universal format
+    @param  sources                 Source files (in their variant dir locations) to compile
+    @returns The static library build step and the name under which it can be linked"""
+
+    intermediate_library_name = cplusplus.get_platform_specific_library_name(
+        universal_library_name + ".Static", static = True
+    )
+    intermediate_library_path = _put_in_intermediate_path(
+        environment, intermediate_library_name
+    )
+
+    staticlib_environment = environment.Clone();
+    staticlib_environment.add_include_directory(environment['HEADER_DIRECTORY'])
+    #staticlib_environment['PDB'] = os.path.splitext(intermediate_library_path)[0] + '.pdb"'
+
+    if platform.system() == 'Windows':
+        if _is_debug_build(environment):
+            pdb_file_path = os.path.splitext(intermediate_library_path)[0] + '.pdb'
+            pdb_file_absolute_path = environment.File(pdb_file_path).srcnode().abspath
+            staticlib_environment.Append(CXXFLAGS='/Fd"' + pdb_file_absolute_path + '"')
+            staticlib_environment.Append(CFLAGS='/Fd"' + pdb_file_absolute_path + '"')
+    else:
+        staticlib_environment.Append(CXXFLAGS='-fpic') # Use position-independent code
+        staticlib_environment.Append(CFLAGS='-fpic') # Use position-independent code
+
+    sources = _build_cplusplus_objects(
+        staticlib_environment, universal_library_name + ".Static", sources, shared = False
+    )
+    compile_static_library = staticlib_environment.StaticLibrary(
+        intermediate_library_path, sources
+    )
+    if (platform.system() == 'Windows') and _is_debug_build(environment):
+        staticlib_environment.SideEffect(pdb_file_absolute_path, compile_static_library)
+
+    return compile_static_library, intermediate_library_name
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _build_shared_library_from_static_library(
+    environment, universal_library_name, intermediate_library_name
+):
+    """Links a shared library from the intermediate static library
+
+    @param  environment                Environment controlling the build settings
+    @param  universal_library_name     Name of the library in universal format
+    @param  intermediate_library_name  Name of the static library the code is taken from
+    @returns The shared library along with its debug database or split debug information"""
+
+    sources = [] # We don't use any sources but the static library
+
+    intermediate_directory = os.path.join(
+        environment['INTERMEDIATE_DIRECTORY'],
+        environment.get_build_directory_name()
+    )
+
+    library_name = cplusplus.get_platform_specific_library_name(universal_library_name)
+    library_path = _put_in_intermediate_path(environment, library_name)
+
+    sharedlib_environment = environment.Clone();
+    sharedlib_environment.add_include_directory(environment['HEADER_DIRECTORY'])
+    #sharedlib_environment['PDB'] = os.path.splitext(library_path)[0] + '.pdb"'
 
+    sharedlib_environment.add_library_directory(intermediate_directory)
+    sharedlib_environment.add_library(intermediate_library_name)
+
+    if platform.system() == 'Windows':
         if _is_debug_build(environment):
-            pdb_file_path = os.path.splitext(executable_path)[0] + '.pdb'
+            pdb_file_path = os.path.splitext(library_path)[0] + '.pdb'
             pdb_file_absolute_path = environment.File(pdb_file_path).srcnode().abspath
-            environment.Append(CXXFLAGS='/Fd"' + pdb_file_absolute_path + '"')
-            environment.Append(CFLAGS='/Fd"' + pdb_file_absolute_path + '"')
-    else:
-        environment.Append(CXXFLAGS='-fpic') # Use position-independent code
-        environment.Append(CXXFLAGS='-fpie') # Use position-independent code
-        environment.Append(CFLAGS='-fpic') # Use position-independent code
-        environment.Append(CFLAGS='-fpie') # Use position-independent code
+            sharedlib_environment.Append(CXXFLAGS='/Fd"' + pdb_file_absolute_path + '"')
+            sharedlib_environment.Append(CFLAGS='/Fd"' + pdb_file_absolute_path + '"')
 
-    # Build the executable
-    build_executable = environment.Program(executable_path, sources)
-    if (platform.system() == 'Windows') and _is_debug_build(environment):
-        build_debug_database = environment.SideEffect(pdb_file_absolute_path, build_executable)
-        return build_executable + build_debug_database
-    else:
-        return build_executable
+        dummy_path = _put_in_intermediate_path(environment, 'msvc-dllmain-dummy.cpp')
+        sources.append(dummy_path)
+        create_dummy_file = sharedlib_environment.Command(
+            source = [], action = 'echo // > $TARGET', target = dummy_path
+        )
 
-# ----------------------------------------------------------------------------------------------- #
+        limit_exported_symbols = _limit_exported_symbols(sharedlib_environment, library_path)
+        compile_shared_library = sharedlib_environment.SharedLibrary(library_path, sources)
+        sharedlib_environment.Depends(compile_shared_library, create_dummy_file)
+        sharedlib_environment.Depends(compile_shared_library, limit_exported_symbols)
 
-def _build_cplusplus_library_with_tests(
-    environment, universal_library_name, universal_test_executable_name,
-    sources = None, test_sources = None
-):
-    """Creates a C/C++ shared library and also builds a unit test executable or it
+        # On Windows, a .PDB file is produced when doing a debug build
+        if _is_debug_build(environment):
+            build_debug_database = environment.SideEffect(
+                pdb_file_absolute_path, compile_shared_library
+            )
+            return compile_shared_library + build_debug_database
 
-    @param  environment                Environment controlling the build settings
-    @param  universal_executable_name  Name of the library in universal format
-                                       (i.e. 'My.Awesome.Stuff')
-    @param  sources                    Source files to use (None = auto)
-    @param  test_sources               Source files to use for the unit tests (None = auto)
-    @remarks
-        Assumes the default conventions, i.e. all source code is contained in a directory
-        named 'Source' and all headers in a directory named 'Include'.
+        return compile_shared_library
 
-        In addition to the convenience factor, this method also avoids SCons warnings about
-        two environments producing the same intermediate files (or having to compile everything
-        twice) by first building a static library, then producing a shared library from it
-        and producing the unit test executabel from it together with the unit test sources.
+    else:
+        sharedlib_environment.Append(CXXFLAGS='-fpic') # Use position-independent code
+        sharedlib_environment.Append(CFLAGS='-fpic') # Use position-independent code
+        limit_exported_symbols = _limit_exported_symbols(sharedlib_environment, library_path)
+        compile_shared_library = sharedlib_environment.SharedLibrary(library_path, sources)
+        sharedlib_environment.Depends(compile_shared_library, limit_exported_symbols)
+        _analyze_binary_if_enabled(sharedlib_environment, compile_shared_library)
 
-        See get_platform_specific_executable_name() for how the universal_library_name
-        parameter is used to produce the output filename on different platforms."""
+        return (
+            compile_shared_library +
+            _package_split_debug_information(environment, compile_shared_library)
+        )
 
-    # Recursively search for the source code files or transform the existing file list
-    sources = _add_variantdir_and_enumerate_cplusplus_sources(
-        environment, environment['SOURCE_DIRECTORY'], sources
-    )
-    test_sources = _add_variantdir_and_enumerate_cplusplus_sources(
-        environment, environment['TESTS_DIRECTORY'], test_sources
-    )
+# ----------------------------------------------------------------------------------------------- #
+
+def _build_executable_from_static_library(
+    environment, universal_executable_name, sources, intermediate_library_name,
+    universal_package_name, universal_package_library_names
+):
+    """Builds an executable (i.e. unit tests) that links the intermediate static library
+
+    @param  environment                      Environment controlling the build settings
+    @param  universal_executable_name        Name of the executable in universal format
+    @param  sources                          Source files (in their variant dir locations)
+                                             of the executable
+    @param  intermediate_library_name        Name of the static library that will be linked
+    @param  universal_package_name           Package providing the executable's framework
+                                             (i.e. 'gtest')
+    @param  universal_package_library_names  Libraries of the package that will be linked
+    @returns The executable, on Windows debug builds followed by its debug database"""
 
     intermediate_directory = os.path.join(
         environment['INTERMEDIATE_DIRECTORY'],
         environment.get_build_directory_name()
     )
 
-    base_directory = environment.Dir('.').abspath
+    executable_name = cplusplus.get_platform_specific_executable_name(
+        universal_executable_name
+    )
+    executable_path = _put_in_intermediate_path(environment, executable_name)
+
+    executable_environment = environment.Clone()
+    executable_environment.add_include_directory(environment['HEADER_DIRECTORY'])
+    #executable_environment['PDB'] = os.path.splitext(executable_path)[0] + '.pdb"'
 
-    # Build a static library that we can reuse for the shared library and test executable
-    if True:
-        intermediate_library_name = cplusplus.get_platform_specific_library_name(
-            universal_library_name + ".Static", static = True
-        )
-        intermediate_library_path = _put_in_intermediate_path(
-            environment, intermediate_library_name
+    executable_environment.add_library_directory(intermediate_directory)
+    executable_environment.add_library(intermediate_library_name)
+
+    executable_environment.add_package(universal_package_name, universal_package_library_names)
+
+    if platform.system() == 'Windows':
+        executable_environment.Append(LINKFLAGS="/SUBSYSTEM:CONSOLE")
+
+        if _is_debug_build(environment):
+            pdb_file_path = os.path.splitext(executable_path)[0] + '.pdb'
+            pdb_file_absolute_path = environment.File(pdb_file_path).srcnode().abspath
+            executable_environment.Append(CXXFLAGS='/Fd"' + pdb_file_absolute_path + '"')
+            executable_environment.Append(CFLAGS='/Fd"' + pdb_file_absolute_path + '"')
+            # os.path.join(base_directory, os.path.splitext(executable_path)[0] + '.pdb'
+
+        sources = _build_cplusplus_objects(
+            executable_environment, universal_executable_name, sources, shared = False
         )
+        compile_executable = executable_environment.Program(executable_path, sources)
 
-        staticlib_environment = environment.Clone();
-        staticlib_environment.add_include_directory(environment['HEADER_DIRECTORY'])
-        #staticlib_environment['PDB'] = os.path.splitext(intermediate_library_path)[0] + '.pdb"'
+        # On Windows, a .PDB file is produced when doing a debug build
+        if _is_debug_build(environment):
+            build_debug_database = environment.SideEffect(
+                pdb_file_absolute_path, compile_executable
+            )
+            return compile_executable + build_debug_database
 
-        if platform.system() == 'Windows':
-            if _is_debug_build(environment):
-                pdb_file_path = os.path.splitext(intermediate_library_path)[0] + '.pdb'
-                pdb_file_absolute_path = environment.File(pdb_file_path).srcnode().abspath
-                staticlib_environment.Append(CXXFLAGS='/Fd"' + pdb_file_absolute_path + '"')
-                staticlib_environment.Append(CFLAGS='/Fd"' + pdb_file_absolute_path + '"')
-        else:
-            staticlib_environment.Append(CXXFLAGS='-fpic') # Use position-independent code
-            staticlib_environment.Append(CFLAGS='-fpic') # Use position-independent code
+        return compile_executable
+
+    else: # Default path: everything but Windows
+        executable_environment.add_library('pthread') # Needed by googletest and benchmark
+        executable_environment.Append(CXXFLAGS='-fpic') # Use position-independent code
+        executable_environment.Append(CXXFLAGS='-fpie') # Use position-independent code
+        executable_environment.Append(CFLAGS='-fpic') # Use position-independent code
+        executable_environment.Append(CFLAGS='-fpie') # Use position-independent code
 
-        compile_static_library = staticlib_environment.StaticLibrary(
-            intermediate_library_path, sources
+        sources = _build_cplusplus_objects(
+            executable_environment, universal_executable_name, sources, shared = False
         )
-        if (platform.system() == 'Windows') and _is_debug_build(environment):
-            staticlib_environment.SideEffect(pdb_file_absolute_path, compile_static_library)
+        return executable_environment.Program(executable_path, sources)
 
-    # Build a shared library using nothing but the static library for sources
-    if True:
-        sources = [] # We don't use any sources but the static library from above
+# ----------------------------------------------------------------------------------------------- #
+
+def _build_cplusplus_library_pgo(
+    environment, universal_library_name, training_command = None,
+    universal_test_executable_name = None, sources = None, test_sources = None,
+    training_sources = None
+):
+    """Creates a shared C/C++ library using profile-guided optimization
+
+    @param  environment                     Environment controlling the build settings
+    @param  universal_library_name          Name of the library in universal format
+                                            (i.e. 'My.Awesome.Stuff')
+    @param  training_command                Command that exercises the instrumented library,
+                                            can use $INSTRUMENTED_LIBRARY (None = unit tests)
+    @param  universal_test_executable_name  Name of the unit test executable that will be
+                                            run for training if no command is specified
+                                            (None = library name with '.Tests' appended)
+    @param  sources                         Source files to use (None = auto)
+    @param  test_sources                    Source files to use for the unit tests (None = auto)
+    @param  training_sources                Further inputs of the training command
+                                            (i.e. the Godot scene it runs)
+    @returns The optimized shared library
+    @remarks
+        Builds an instrumented version of the library into a separate intermediate
+        directory, runs the training command, merges the recorded profile and then
+        builds the library again, optimized using the recorded profile.
+
+        The training command can run the unit tests or, for example, a headless Godot
+        that plays a scene for a fixed number of frames (after copying the library in
+        $INSTRUMENTED_LIBRARY to where the .gdnlib file expects it).
+
+        The profile is recorded anew whenever the instrumented library changes and
+        all object files of the optimized library depend on it, so no source file is
+        ever compiled with a profile recorded from an older version of it.
 
-        library_name = cplusplus.get_platform_specific_library_name(universal_library_name)
-        library_path = _put_in_intermediate_path(environment, library_name)
+        Works with GCC 11 and later and with clang. With MSVC, this does a normal build."""
 
-        sharedlib_environment = environment.Clone();
-        sharedlib_environment.add_include_directory(environment['HEADER_DIRECTORY'])
-        #sharedlib_environment['PDB'] = os.path.splitext(library_path)[0] + '.pdb"'
+    if platform.system() == 'Windows':
+        return _build_cplusplus_library(environment, universal_library_name, sources = sources)
+
+    is_clang = 'clang' in os.path.basename(cplusplus.get_compiler_name(environment))
 
-        sharedlib_environment.add_library_directory(intermediate_directory)
-        sharedlib_environment.add_library(intermediate_library_name)
+    profile_directory = environment.Dir(
+        _put_in_intermediate_path(environment, 'pgo-profile')
+    ).abspath
+    raw_profile_directory = os.path.join(profile_directory, 'raw')
 
-        if platform.system() == 'Windows':
-            if _is_debug_build(environment):
-                pdb_file_path = os.path.splitext(library_path)[0] + '.pdb'
-                pdb_file_absolute_path = environment.File(pdb_file_path).srcnode().abspath
-                sharedlib_environment.Append(CXXFLAGS='/Fd"' + pdb_file_absolute_path + '"')
-                sharedlib_environment.Append(CFLAGS='/Fd"' + pdb_file_absolute_path + '"')
+    # Build the instrumented library in its own intermediate directory
+    if True:
+        instrumented_environment = environment.Clone()
+        instrumented_environment['INTERMEDIATE_DIRECTORY'] = os.path.join(
+            environment['INTERMEDIATE_DIRECTORY'], 'pgo-instrumented'
+        )
 
-            dummy_path = _put_in_intermediate_path(environment, 'msvc-dllmain-dummy.cpp')
-            sources.append(dummy_path)
-            create_dummy_file = sharedlib_environment.Command(
-                source = [], action = 'echo // > $TARGET', target = dummy_path
+        instrumented_environment.Append(CCFLAGS='-fprofile-generate=' + raw_profile_directory)
+        instrumented_environment.Append(LINKFLAGS='-fprofile-generate=' + raw_profile_directory)
+        if not is_clang:
+            instrumented_environment.Append(CCFLAGS='-fprofile-update=atomic') # For threads
+
+            # GCC names each profile after its object file's path. Make that path
+            # relative, so the optimized object files will find their profiles.
+            instrumented_environment.Append(
+                CCFLAGS='-fprofile-prefix-path=' + instrumented_environment.Dir(
+                    _put_in_intermediate_path(instrumented_environment, '.')
+                ).abspath
             )
 
-            compile_shared_library = sharedlib_environment.SharedLibrary(library_path, sources)
-            sharedlib_environment.Depends(compile_shared_library, create_dummy_file)
+        if training_command is None:
+            if universal_test_executable_name is None:
+                universal_test_executable_name = universal_library_name + '.Tests'
 
-            # On Windows, a .PDB file is produced when doing a debug build
-            if _is_debug_build(environment):
-                build_debug_database = environment.SideEffect(
-                    pdb_file_absolute_path, compile_shared_library
-                )
+            instrumented_binaries = instrumented_environment.build_library_with_tests(
+                universal_library_name, universal_test_executable_name,
+                sources, test_sources
+            )
 
+            # The unit test executable is the last of the binaries returned
+            training_command = '-"' + instrumented_binaries[-1].abspath + '"'
+            training_inputs = [ instrumented_binaries[0], instrumented_binaries[-1] ]
         else:
-            sharedlib_environment.Append(CXXFLAGS='-fpic') # Use position-independent code
-            sharedlib_environment.Append(CFLAGS='-fpic') # Use position-independent code
-            compile_shared_library = sharedlib_environment.SharedLibrary(library_path, sources)
+            instrumented_binaries = instrumented_environment.build_library(
+                universal_library_name, sources = sources
+            )
+            training_inputs = [ instrumented_binaries[0] ]
 
+    # Record the profile. Old profiles are deleted first since GCC would otherwise
+    # accumulate the recorded counts across training runs.
     if True:
-        executable_name = cplusplus.get_platform_specific_executable_name(
-            universal_test_executable_name
+        training_actions = [
+            Delete(raw_profile_directory),
+            Mkdir(raw_profile_directory),
+            training_command
+        ]
+        if is_clang:
+            profile_merger = environment.WhereIs('llvm-profdata')
+            if profile_merger is None:
+                profile_merger = 'llvm-profdata'
+
+            profile_path = os.path.join(profile_directory, 'merged.profdata')
+            training_actions.append(
+                '"' + profile_merger + '" merge -output=$TARGET ' +
+                os.path.join(raw_profile_directory, '*.profraw')
+            )
+        else:
+            profile_path = os.path.join(profile_directory, 'profile.digest')
+            training_actions.append(
+                Action(_write_profile_digest, 'Digesting profile in $RAW_PROFILE_DIRECTORY')
+            )
+
+        if training_sources is not None:
+            training_inputs = training_inputs + training_sources
+
+        record_profile = environment.Command(
+            source = training_inputs,
+            action = training_actions,
+            target = profile_path,
+            INSTRUMENTED_LIBRARY = instrumented_binaries[0].abspath,
+            RAW_PROFILE_DIRECTORY = raw_profile_directory,
+            PROFILE_CATEGORY = 'pgo_training'
         )
-        executable_path = _put_in_intermediate_path(environment, executable_name)
+        environment.Clean(record_profile, raw_profile_directory)
 
-        executable_environment = environment.Clone()
-        executable_environment.add_include_directory(environment['HEADER_DIRECTORY'])
-        #executable_environment['PDB'] = os.path.splitext(executable_path)[0] + '.pdb"'
+        # GCC reads the raw profiles the training run leaves behind, not the digest, so
+        # a digest taken from the build cache would leave them missing or stale
+        environment.NoCache(record_profile)
 
-        executable_environment.add_library_directory(intermediate_directory)
-        executable_environment.add_library(intermediate_library_name)
+    # Build the optimized library
+    if True:
+        optimized_environment = environment.Clone()
+        if is_clang:
+            optimized_environment.Append(CCFLAGS='-fprofile-use=' + profile_path)
+        else:
+            optimized_environment.Append(CCFLAGS='-fprofile-use=' + raw_profile_directory)
+            optimized_environment.Append(CCFLAGS='-fprofile-partial-training') # Unprofiled code
+            optimized_environment.Append(
+                CCFLAGS='-fprofile-prefix-path=' + optimized_environment.Dir(
+                    _put_in_intermediate_path(optimized_environment, '.')
+                ).abspath
+            )
 
-        executable_environment.add_package('gtest', [ 'gtest', 'gtest_main' ])
+        optimized_library = optimized_environment.build_library(
+            universal_library_name, sources = sources
+        )
 
-        if platform.system() == 'Windows':
-            executable_environment.Append(LINKFLAGS="/SUBSYSTEM:CONSOLE")
+        # The profile is not visible to SCons in the object files' command lines
+        for library_source in optimized_library[0].sources:
+            if library_source.has_builder():
+                optimized_environment.Depends(library_source, record_profile)
 
-            if _is_debug_build(environment):
-                pdb_file_path = os.path.splitext(executable_path)[0] + '.pdb'
-                pdb_file_absolute_path = environment.File(pdb_file_path).srcnode().abspath
-                executable_environment.Append(CXXFLAGS='/Fd"' + pdb_file_absolute_path + '"')
-                executable_environment.Append(CFLAGS='/Fd"' + pdb_file_absolute_path + '"')
-                # os.path.join(base_directory, os.path.splitext(executable_path)[0] + '.pdb'
+    return optimized_library
 
-            compile_unit_tests = executable_environment.Program(executable_path, test_sources)
+# ----------------------------------------------------------------------------------------------- #
 
-            # On Windows, a .PDB file is produced when doing a debug build
-            if _is_debug_build(environment):
-                build_test_debug_database = environment.SideEffect(
-                    pdb_file_absolute_path, compile_unit_tests
-                )
+def _write_profile_digest(target, source, env):
+    """Writes a hash of all profile data files recorded by GCC's instrumentation
 
-        else: # Default path: everything but Windows
-            executable_environment.add_library('pthread') # Needed by googletest
-            executable_environment.Append(CXXFLAGS='-fpic') # Use position-independent code
-            executable_environment.Append(CXXFLAGS='-fpie') # Use position-independent code
-            executable_environment.Append(CFLAGS='-fpic') # Use position-independent code
-            executable_environment.Append(CFLAGS='-fpie') # Use position-independent code
+    @param  target  Digest file that will be written
+    @param  source  Instrumented binaries the profile was recorded with
+    @param  env     Environment containing the raw profile directory
+    @remarks
+        GCC keeps one profile data file per object file. Their hash takes the place of
+        clang's merged profile, so the optimized object files are rebuilt when (and only
+        when) the recorded profile has changed."""
 
-            compile_unit_tests = executable_environment.Program(executable_path, test_sources)
+    raw_profile_directory = env['RAW_PROFILE_DIRECTORY']
 
-    environment.Depends(compile_shared_library, compile_static_library)
-    environment.Depends(compile_unit_tests, compile_static_library)
+    profile_hash = hashlib.sha256()
+    for root, directory_names, file_names in os.walk(raw_profile_directory):
+        directory_names.sort()
+        for file_name in sorted(file_names):
+            file_path = os.path.join(root, file_name)
+            profile_hash.update(os.path.relpath(file_path, raw_profile_directory).encode())
+            with open(file_path, 'rb') as profile_file:
+                profile_hash.update(profile_file.read())
 
-    if (platform.system() == 'Windows') and _is_debug_build(environment):
-        return (
-            compile_shared_library + build_debug_database +
-            compile_unit_tests + build_test_debug_database
-        )
-    else:
-        return compile_shared_library + compile_unit_tests
+    with open(str(target[0]), 'w') as digest_file:
+        digest_file.write(profile_hash.hexdigest() + '\n')
 
 # ----------------------------------------------------------------------------------------------- #
 
-def _run_cplusplus_unit_tests(environment, universal_test_executable_name):
+def _run_cplusplus_unit_tests(environment, universal_test_executable_name, shard_count = None):
     """Runs the unit tests executable comiled from a build_unit_test_executable() call
 
     @param  environment                     Environment used to locate the unit test executable
     @param  universal_test_executable_name  Name of the unit test executable from the build step
+    @param  shard_count                     Number of processes the tests will be split among
+                                            (None = number of parallel jobs SCons runs)
     @remarks
         This executes the unit test executable and produces an XML file detailing
-        the test results for CI servers and other processing."""
+        the test results for CI servers and other processing.
+
+        With more than one shard, each shard runs a part of the tests and the results
+        are merged into one XML file afterwards. See gtest.py for how the tests are
+        split among the shards."""
 
     environment = environment.Clone()
 
@@ -787,10 +2130,61 @@ def _run_cplusplus_unit_tests(environment, universal_test_executable_name):
         environment, environment['TESTS_RESULT_FILE']
     )
 
-    return environment.Command(
+    if shard_count is None:
+        shard_count = GetOption('num_jobs')
+
+    if shard_count > 1:
+        return gtest.run_sharded(
+            environment, test_executable_path, test_results_path, shard_count
+        )
+
+    run_tests = environment.Command(
         source = test_executable_path,
         action = '-$SOURCE --gtest_output=xml:$TARGET',
-        target = test_results_path
+        target = test_results_path,
+        PROFILE_CATEGORY = 'run_unit_tests'
+    )
+
+    # Tests should run on each machine rather than their results coming from the build cache
+    environment.NoCache(run_tests)
+
+    return run_tests
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _run_cplusplus_benchmarks(environment, universal_benchmark_executable_name):
+    """Runs the benchmark executable compiled from a build_library_with_benchmarks() call
+
+    @param  environment                          Environment used to locate the executable
+    @param  universal_benchmark_executable_name  Name of the benchmark executable from
+                                                 the build step
+    @remarks
+        Writes the results as JSON and compares them with the baseline file kept in
+        the intermediate directory (benchmark timings are specific to the machine).
+        The build fails if a benchmark regressed, see benchmark.py for the details.
+
+        For reliable timings, build the benchmark results as their own target
+        or without parallel jobs, so no compilers compete with the benchmarks."""
+
+    environment = environment.Clone()
+
+    # Figure out the path the benchmark executable would have been compiled to
+    benchmark_executable_name = cplusplus.get_platform_specific_executable_name(
+        universal_benchmark_executable_name
+    )
+    benchmark_executable_path = _put_in_intermediate_path(
+        environment, benchmark_executable_name
+    )
+
+    benchmark_results_path = _put_in_artifact_path(
+        environment, environment['BENCHMARKS_RESULT_FILE']
+    )
+    benchmark_baseline_path = _put_in_intermediate_path(
+        environment, environment['BENCHMARKS_BASELINE_FILE']
+    )
+
+    return benchmark.run(
+        environment, benchmark_executable_path, benchmark_results_path, benchmark_baseline_path
     )
 
 # ----------------------------------------------------------------------------------------------- #
@@ -841,7 +2235,10 @@ def _add_variantdir_and_enumerate_cplusplus_sources(environment, directory, sour
     @param  directory    Directory containing the sources that will be enumerated
     @param  sources      User-provided list of source files to transform instead
                          If this is 'None', the directory will be enumerated.
-    @returns The list of source files in their virtual variant dir locations"""
+    @returns The list of source files in their virtual variant dir locations
+    @remarks
+        SCons nodes in the user-provided list (for example object files produced by
+        another build step) are passed through unchanged."""
 
     # Append the build directory. This directory is unique per build setup,
     # so that debug/release and x86/amd64 builds can life side by side or happen
@@ -865,14 +2262,427 @@ def _add_variantdir_and_enumerate_cplusplus_sources(environment, directory, sour
         new_sources = []
 
         for file_path in sources:
-            new_sources.append(
-                os.path.join(intermediate_build_directory, file_path)
-            )
+            if isinstance(file_path, str):
+                new_sources.append(
+                    os.path.join(intermediate_build_directory, file_path)
+                )
+            else:
+                new_sources.append(file_path)
 
         return new_sources
 
 # ----------------------------------------------------------------------------------------------- #
 
+def _build_cplusplus_objects(environment, universal_name, sources, shared):
+    """Prepares the sources of a C/C++ library or executable for compilation
+
+    @param  environment     Environment controlling the build settings
+    @param  universal_name  Name of the library or executable the sources belong to
+    @param  sources         Source files (in their variant dir locations) to compile
+    @param  shared          Whether the sources will be linked into a shared library
+    @returns The sources and object files to hand to the library or executable builder
+    @remarks
+        Combines the sources into unity translation units if UNITY_BUILD is enabled
+        and compiles them with a precompiled header if PRECOMPILED_HEADER is set."""
+
+    precompiled_headers = _get_precompiled_headers(environment, sources)
+
+    sources = _combine_into_unity_sources(environment, sources)
+
+    if precompiled_headers is not None:
+        sources = _compile_with_precompiled_header(
+            environment, universal_name, sources, shared, precompiled_headers
+        )
+
+    if environment['SPLIT_DEBUG_INFORMATION']:
+        sources = _track_split_debug_information(environment, sources, shared)
+
+    return sources
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _track_split_debug_information(environment, sources, shared):
+    """Compiles the sources and lets SCons know about the .dwo file each object file
+    will be accompanied by
+
+    @param  environment  Environment controlling the build settings
+    @param  sources      Sources and object files of a library or executable
+    @param  shared       Whether the sources will be linked into a shared library
+    @returns The object files to hand to the library or executable builder
+    @remarks
+        The .dwo files are declared as side effects of the object files, so SCons
+        removes them when cleaning and won't delete them as unknown files."""
+
+    objects = []
+    for source in environment.Flatten(sources):
+        extension = os.path.splitext(str(source))[1]
+        if extension in [ '.c', '.cpp', '.cc', '.cxx' ]:
+            if shared:
+                objects.extend(environment.SharedObject(source))
+            else:
+                objects.extend(environment.StaticObject(source))
+        else:
+            objects.append(source)
+
+    object_suffixes = [ environment.subst('$OBJSUFFIX'), environment.subst('$SHOBJSUFFIX') ]
+    for compiled_object in objects:
+        object_path, extension = os.path.splitext(str(compiled_object))
+        if extension in object_suffixes:
+            environment.SideEffect(object_path + '.dwo', compiled_object)
+
+    return objects
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _limit_exported_symbols(environment, library_path):
+    """Makes the linker export only the symbols listed in EXPORTED_SYMBOLS
+
+    @param  environment   Environment that will link the shared library
+    @param  library_path  Path of the shared library that will be linked
+    @returns The build step writing the version script or .def file or an empty list
+             if EXPORTED_SYMBOLS is not set
+    @remarks
+        Symbols that are not exported don't need to be looked up or relocated by the
+        dynamic loader and can be removed by --gc-sections if nothing else uses them.
+
+        MSVC only exports what is declared with __declspec(dllexport) or listed in
+        the .def file, so there the .def file makes sure the listed symbols are exported."""
+
+    exported_symbols = environment.get('EXPORTED_SYMBOLS')
+    if not exported_symbols:
+        return []
+
+    if platform.system() == 'Windows':
+        export_map_path = os.path.splitext(library_path)[0] + '.def'
+    else:
+        export_map_path = os.path.splitext(library_path)[0] + '.version-script'
+
+    # The absolute path is excluded from the link's signature, so checkouts in other
+    # directories can share the library via BUILD_CACHE. The callers make the library
+    # depend on the file itself, so changes to its contents still cause a relink.
+    export_map_absolute_path = environment.File(export_map_path).abspath
+    if platform.system() == 'Windows':
+        environment.Append(LINKFLAGS=[ '$(', '/DEF:"' + export_map_absolute_path + '"', '$)' ])
+    else:
+        environment.Append(
+            LINKFLAGS=[ '$(', '-Wl,--version-script=' + export_map_absolute_path, '$)' ]
+        )
+
+    return environment.Command(
+        source = environment.Value(repr(list(exported_symbols))),
+        action = Action(_write_export_map, 'Writing exported symbols to $TARGET'),
+        target = export_map_path,
+        EXPORTED_SYMBOLS = list(exported_symbols)
+    )
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _write_export_map(target, source, env):
+    """Writes a linker version script or .def file listing the exported symbols
+
+    @param  target  Version script or .def file that will be written
+    @param  source  Value node holding the names of the exported symbols
+    @param  env     Environment containing the names of the exported symbols"""
+
+    export_map_path = str(target[0])
+
+    with open(export_map_path, 'w') as export_map_file:
+        if export_map_path.endswith('.def'):
+            export_map_file.write('EXPORTS\n')
+            for symbol in env['EXPORTED_SYMBOLS']:
+                export_map_file.write('  ' + symbol + '\n')
+        else:
+            export_map_file.write('{\n  global:\n')
+            for symbol in env['EXPORTED_SYMBOLS']:
+                export_map_file.write('    ' + symbol + ';\n')
+            export_map_file.write('  local:\n    *;\n};\n')
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _analyze_binary_if_enabled(environment, binary):
+    """Reports the size and load cost of a linked binary if BINARY_ANALYSIS is enabled
+
+    @param  environment  Environment controlling the build settings
+    @param  binary       Shared library or executable that will be analyzed
+    @remarks
+        The report is written next to the binary in the intermediate directory and is
+        not returned with the binary, so it won't be installed along with it. Only ELF
+        binaries can be analyzed, so this does nothing on Windows."""
+
+    if environment['BINARY_ANALYSIS'] and (platform.system() != 'Windows'):
+        environment.analyze_binary(binary)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _package_split_debug_information(environment, binary):
+    """Collects the .dwo files of a linked binary into a .dwp file next to it
+
+    @param  environment  Environment controlling the build settings
+    @param  binary       Shared library or executable whose debug information will be packaged
+    @returns The build step producing the .dwp file or an empty list if no .dwp file
+             will be produced
+    @remarks
+        The .dwp file is returned alongside the binary, so installing the binary
+        somewhere else will also install its debug information."""
+
+    if not environment['SPLIT_DEBUG_INFORMATION']:
+        return []
+
+    if environment.get('DWP') is None:
+        return [] # The debugger will still find the .dwo files in the intermediate directory
+
+    return environment.Command(
+        source = binary,
+        action = '"$DWP" -e $SOURCE -o $TARGET',
+        target = str(binary[0]) + '.dwp',
+        PROFILE_CATEGORY = 'dwp'
+    )
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_precompiled_headers(environment, sources):
+    """Determines the headers that should go into the precompiled header
+
+    @param  environment  Environment providing the PRECOMPILED_HEADER setting
+    @param  sources      Source files (in their variant dir locations) to compile
+    @returns The absolute paths of the headers to precompile or None if no precompiled
+             header should be used"""
+
+    precompiled_header = environment.get('PRECOMPILED_HEADER')
+    if precompiled_header is None:
+        return None
+
+    # Explicitly named prefix header
+    if precompiled_header != 'auto':
+        return [ environment.File(precompiled_header).srcnode().abspath ]
+
+    # Automatic mode, pick the headers included by most of the sources
+    source_paths = []
+    for file_path in sources:
+        if isinstance(file_path, str) and _is_cplusplus_source(file_path):
+            source_paths.append(environment.File(file_path).srcnode().abspath)
+
+    include_directories = []
+    for include_directory in environment.get('CPPPATH', []):
+        if isinstance(include_directory, str):
+            include_directory = environment.subst(include_directory)
+        include_directories.append(environment.Dir(include_directory).srcnode().abspath)
+
+    precompiled_headers = cplusplus.find_frequently_included_headers(
+        source_paths, include_directories, _automatic_precompiled_header_share
+    )
+    if len(precompiled_headers) == 0:
+        return None
+
+    return precompiled_headers
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _compile_with_precompiled_header(
+    environment, universal_name, sources, shared, precompiled_headers
+):
+    """Compiles the C++ sources using a precompiled header
+
+    @param  environment          Environment controlling the build settings
+    @param  universal_name       Name of the library or executable the sources belong to
+    @param  sources              Source files (in their variant dir locations) to compile
+    @param  shared               Whether the sources will be linked into a shared library
+    @param  precompiled_headers  Absolute paths of the headers that will be precompiled
+    @returns The object files and any sources that were not compiled
+    @remarks
+        A prefix header including the precompiled headers is generated in
+        the intermediate directory and force-included into each C++ source. With GCC,
+        it is compiled to a .gch file next to the prefix header, with MSVC, the /Yc
+        and /Yu model is used via SCons' PCH builder. Either way, the precompiled
+        header is scanned for includes and rebuilt if any of the headers it covers
+        has changed."""
+
+    precompiled_header_directory = _put_in_intermediate_path(
+        environment, os.path.join('pch', universal_name)
+    )
+    prefix_header_path = os.path.join(precompiled_header_directory, 'Precompiled.h')
+    precompiled_header_directory_path = environment.Dir(precompiled_header_directory).abspath
+
+    # Relative paths keep the prefix header (which every object is compiled with and
+    # thus the keys of the compile cache and the build cache) the same in every checkout
+    include_lines = []
+    for precompiled_header in precompiled_headers:
+        if precompiled_header.startswith('<'):
+            include_lines.append('#include ' + precompiled_header)
+        else:
+            relative_header_path = os.path.relpath(
+                precompiled_header, precompiled_header_directory_path
+            )
+            include_lines.append('#include "' + relative_header_path.replace('\\', '/') + '"')
+
+    prefix_header = environment.Textfile(
+        target = prefix_header_path, source = include_lines + [ '' ], LINESEPARATOR = '\n'
+    )
+
+    object_environment = environment.Clone()
+    extra_sources = []
+
+    if platform.system() == 'Windows':
+        precompiled_source = environment.Textfile(
+            target = os.path.join(precompiled_header_directory, 'Precompiled.cpp'),
+            source = [ '#include "Precompiled.h"', '' ],
+            LINESEPARATOR = '\n'
+        )
+
+        pch_environment = environment.Clone()
+        pch_environment.Prepend(CPPPATH = [ precompiled_header_directory ])
+        pch_environment['PCHSTOP'] = 'Precompiled.h'
+        precompiled_header, precompiled_object = pch_environment.PCH(precompiled_source)
+        extra_sources.append(precompiled_object)
+
+        object_environment.Prepend(CPPPATH = [ precompiled_header_directory ])
+        object_environment.Append(CCFLAGS = [ '/FIPrecompiled.h' ])
+        object_environment['PCHSTOP'] = 'Precompiled.h'
+        object_environment['PCH'] = precompiled_header
+        object_environment['PRECOMPILED_HEADER_BINARY'] = precompiled_header[0]
+
+    else:
+        if shared:
+            action = '$SHCXX -o $TARGET -x c++-header -c $SHCXXFLAGS $SHCCFLAGS $_CCCOMCOM $SOURCE'
+        else:
+            action = '$CXX -o $TARGET -x c++-header -c $CXXFLAGS $CCFLAGS $_CCCOMCOM $SOURCE'
+
+        # GCC picks up Precompiled.h.gch when Precompiled.h is included
+        precompiled_header = environment.Command(
+            source = prefix_header,
+            action = action,
+            target = prefix_header_path + '.gch',
+            source_scanner = CScanner
+        )
+
+        object_environment.Append(CCFLAGS = [ '-Winvalid-pch', '-include', prefix_header[0] ])
+        object_environment['PRECOMPILED_HEADER_BINARY'] = precompiled_header[0]
+
+    objects = []
+    for file_path in sources:
+        if _is_cplusplus_source(file_path):
+            if shared:
+                compile_object = object_environment.SharedObject(file_path)
+            else:
+                compile_object = object_environment.StaticObject(file_path)
+
+            object_environment.Depends(compile_object, precompiled_header)
+            objects.extend(compile_object)
+        else:
+            objects.append(file_path)
+
+    return objects + extra_sources
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _is_cplusplus_source(file_path):
+    """Checks whether a source file or node is a C++ source file
+
+    @param  file_path  Path or node of the source file that will be checked
+    @returns True if the file is a C++ source file, false otherwise"""
+
+    return os.path.splitext(str(file_path))[1] in [ '.cpp', '.cc', '.cxx' ]
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _combine_into_unity_sources(environment, sources):
+    """Combines C++ sources into unity translation units if unity builds are enabled
+
+    @param  environment  Environment in which the unity sources will be generated
+    @param  sources      Source files (in their variant dir locations) to combine
+    @returns The unity sources followed by any sources that were not combined
+    @remarks
+        Sources are grouped by directory, in order of their file names. A new group
+        is started when adding a source would exceed the UNITY_BUILD_MAXIMUM_SIZE or
+        when the hash of a source's file name marks it as an anchor. Because groups
+        mostly begin at anchors, editing, adding or removing a source only changes
+        the group it belongs to (and maybe the next one) instead of shifting all
+        groups after it. Each unity source is named after the first source in it.
+
+        C sources, SCons nodes and sources that don't exist yet (generated files)
+        are passed through unchanged and compiled individually."""
+
+    if not environment['UNITY_BUILD']:
+        return sources
+
+    maximum_group_size = environment['UNITY_BUILD_MAXIMUM_SIZE']
+
+    intermediate_build_directory = os.path.join(
+        environment['INTERMEDIATE_DIRECTORY'],
+        environment.get_build_directory_name()
+    )
+
+    # Sort the sources we can combine into their directories
+    individual_sources = []
+    sources_by_directory = {}
+    for file_path in sources:
+        if not isinstance(file_path, str):
+            individual_sources.append(file_path)
+            continue
+
+        source_path = environment.File(file_path).srcnode().abspath
+        if (not _is_cplusplus_source(file_path)) or (not os.path.isfile(source_path)):
+            individual_sources.append(file_path)
+            continue
+
+        directory = os.path.dirname(file_path)
+        if directory not in sources_by_directory:
+            sources_by_directory[directory] = []
+
+        sources_by_directory[directory].append(
+            (os.path.basename(file_path), source_path, os.path.getsize(source_path))
+        )
+
+    # Split the sources in each directory into groups
+    unity_sources = []
+    for directory in sorted(sources_by_directory):
+        groups = []
+        group_size = 0
+        for file_name, source_path, file_size in sorted(sources_by_directory[directory]):
+            is_anchor = (int(hashlib.md5(file_name.encode('utf-8')).hexdigest()[:8], 16) % 8) == 0
+            exceeds_size = (group_size + file_size) > maximum_group_size
+            if (len(groups) == 0) or ((len(groups[-1]) > 0) and (is_anchor or exceeds_size)):
+                groups.append([])
+                group_size = 0
+
+            groups[-1].append((file_name, source_path))
+            group_size += file_size
+
+        # Keep the unity sources in a tree mirroring the source directories
+        if directory.startswith(intermediate_build_directory + os.sep):
+            relative_directory = os.path.relpath(directory, intermediate_build_directory)
+        else:
+            relative_directory = directory
+        unity_directory = os.path.join(intermediate_build_directory, 'unity', relative_directory)
+        unity_directory_path = environment.Dir(unity_directory).abspath
+
+        for group in groups:
+            if len(group) == 1:
+                individual_sources.append(os.path.join(directory, group[0][0]))
+                continue
+
+            # Relative paths keep the unity sources (and thus the keys of the compile cache
+            # and the build cache) the same in every checkout
+            include_lines = []
+            for file_name, source_path in group:
+                relative_source_path = os.path.relpath(source_path, unity_directory_path)
+                include_lines.append('#include "' + relative_source_path.replace('\\', '/') + '"')
+
+            unity_source_path = os.path.join(
+                unity_directory, 'unity-' + os.path.splitext(group[0][0])[0] + '.cpp'
+            )
+            unity_sources.extend(
+                environment.Textfile(
+                    target = unity_source_path,
+                    source = include_lines + [ '' ],
+                    LINESEPARATOR = '\n'
+                )
+            )
+
+    return unity_sources + individual_sources
+
+# ----------------------------------------------------------------------------------------------- #
+
 def _put_in_intermediate_path(environment, filename):
     """Determines the intermediate path for a file with the specified name
 
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+
+import os
+import json
+import time
+import atexit
+import threading
+
+import SCons.Errors
+import SCons.Script.Main
+
+"""
+Build profiler for SCons builds
+
+Records when each build step started and ended and on which of SCons' worker
+threads it ran. The recording is saved in the Chrome trace event format, so it can
+be opened in chrome://tracing, Perfetto (https://ui.perfetto.dev) or Speedscope to see
+which steps took the longest and how well the build made use of parallel jobs.
+"""
+
+# ----------------------------------------------------------------------------------------------- #
+
+# Path of the trace file that will be written when the build ends
+_trace_path = None
+
+# Trace events recorded so far, written when the build ends
+_trace_events = []
+
+# Worker slot numbers assigned to SCons' worker threads, keyed by thread identifier
+_worker_slots = {}
+
+# Protects the trace events and the worker slots from concurrent access
+_trace_lock = threading.Lock()
+
+# Point in time all recorded timestamps are relative to
+_start_time = None
+
+# Original method that executes a build step in SCons
+_original_execute = None
+
+# Functions that will be called with the targets, start time, end time and exit status
+# of each build step after it has been executed
+_build_step_observers = []
+
+# ----------------------------------------------------------------------------------------------- #
+
+def enable(trace_path):
+    """Begins recording all build steps and writes a trace file when the build ends
+
+    @param  trace_path  Path of the Chrome trace event JSON file that will be written
+    @remarks
+        Only the first call has an effect, so all environments share one trace."""
+
+    global _trace_path, _start_time
+    if _trace_path is not None:
+        return
+
+    _trace_path = trace_path
+    _start_time = time.perf_counter()
+
+    add_build_step_observer(_record)
+    atexit.register(_write_trace)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def add_build_step_observer(observer):
+    """Registers a function that will be called after each build step SCons executes
+
+    @param  observer  Function that will be called with the targets, the start time,
+                      the end time (both from time.perf_counter()) and the exit status
+                      of each executed build step
+    @remarks
+        Observers are called from SCons' worker threads in parallel builds."""
+
+    # SCons has no hooks for observing build steps, so wrap the method that runs them
+    global _original_execute
+    if _original_execute is None:
+        _original_execute = SCons.Script.Main.BuildTask.execute
+        SCons.Script.Main.BuildTask.execute = _execute_and_observe
+
+    _build_step_observers.append(observer)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def get_category(node):
+    """Determines the kind of build step that produces a node
+
+    @param  node  Node whose build step will be categorized
+    @returns The PROFILE_CATEGORY set for the build step or the name of its builder"""
+
+    builder = node.get_builder()
+    if builder is None:
+        return 'None'
+
+    build_environment = node.get_build_env()
+
+    category = build_environment.get('PROFILE_CATEGORY')
+    if category is not None:
+        return category
+
+    # SCons falls back to the builder's class name if it isn't registered by name
+    builder_name = builder.get_name(build_environment)
+    if builder_name == str(builder.__class__):
+        return 'Command' # Anonymous builder created by Command()
+    else:
+        return builder_name
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _execute_and_observe(task):
+    """Executes a build step in SCons and notifies the build step observers
+
+    @param  task  SCons task that will be executed"""
+
+    start_time = time.perf_counter()
+    exit_status = 0
+    try:
+        _original_execute(task)
+    except SCons.Errors.BuildError as error:
+        exit_status = error.exitstatus
+        raise
+    except BaseException:
+        exit_status = 1
+        raise
+    finally:
+        end_time = time.perf_counter()
+        for observer in _build_step_observers:
+            observer(task.targets, start_time, end_time, exit_status)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _record(targets, start_time, end_time, exit_status):
+    """Adds a build step to the recorded trace events
+
+    @param  targets      Nodes that were produced by the build step
+    @param  start_time   Point in time at which the build step started
+    @param  end_time     Point in time at which the build step ended
+    @param  exit_status  Exit status of the build step (0 if it succeeded)"""
+
+    try:
+        category = get_category(targets[0])
+    except Exception:
+        category = 'Unknown'
+
+    trace_event = {
+        'name': str(targets[0]),
+        'cat': category,
+        'ph': 'X',
+        'ts': round((start_time - _start_time) * 1000000.0),
+        'dur': round((end_time - start_time) * 1000000.0),
+        'pid': os.getpid(),
+        'args': {
+            'targets': [ str(target) for target in targets ],
+            'status': exit_status
+        }
+    }
+
+    thread_id = threading.get_ident()
+    with _trace_lock:
+        worker_slot = _worker_slots.get(thread_id)
+        if worker_slot is None:
+            worker_slot = len(_worker_slots) + 1
+            _worker_slots[thread_id] = worker_slot
+
+        trace_event['tid'] = worker_slot
+        _trace_events.append(trace_event)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _write_trace():
+    """Writes the recorded trace events to the trace file"""
+
+    with _trace_lock:
+        trace_events = list(_trace_events)
+        worker_slots = sorted(_worker_slots.values())
+
+    # Name the rows in the trace viewer after the worker slots
+    metadata_events = [
+        {
+            'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'tid': 0,
+            'args': { 'name': 'SCons build' }
+        }
+    ]
+    for worker_slot in worker_slots:
+        metadata_events.append(
+            {
+                'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': worker_slot,
+                'args': { 'name': 'Worker ' + str(worker_slot) }
+            }
+        )
+
+    trace_directory = os.path.dirname(_trace_path)
+    if trace_directory and not os.path.isdir(trace_directory):
+        os.makedirs(trace_directory)
+
+    with open(_trace_path, 'w') as trace_file:
+        json.dump(
+            { 'traceEvents': metadata_events + trace_events, 'displayTimeUnit': 'ms' },
+            trace_file,
+            indent = 1
+        )
+
+    print('Build profile written to \033[94m' + _trace_path + '\033[0m')
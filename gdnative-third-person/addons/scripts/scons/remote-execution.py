@@ -0,0 +1,650 @@
+#!/usr/bin/env python
+
+# Purpose:
+#   Runs a build action (a compile, a Blender export, a Godot call) on a worker
+#   started with remote-worker.py instead of on the local machine.
+#
+#   Input and output files are transferred by content: the worker is told the
+#   SHA-256 digests of all inputs, asks for the ones it doesn't hold yet and
+#   rebuilds the directory layout in a sandbox. Outputs come back the same way.
+#
+# Usage:
+#   Invoke this script with the system's Python interpreter, followed by the
+#   worker's address, the input and output files and the command line to run:
+#
+#   python remote-execution.py localhost:8377 --inputs a.blend --outputs a.dae -- blender ...
+#   python remote-execution.py localhost:8377 --compile -- g++ -c -o a.o a.cpp
+#
+#   - The first argument is the host and port of the worker
+#
+#   - The paths after --inputs and --outputs are files the command reads or writes
+#
+#   - With --compile, the command is a GCC or clang compile and the included
+#     headers, the object file, dependency file and .dwo file are found out
+#     automatically
+#
+#   - Everything after the '--' is the command line that will be run
+#
+#   Files are transferred if they are within the directory containing the working
+#   directory and all inputs and outputs. Anything outside of it (the compiler,
+#   system headers, Blender, Godot) must exist on the worker in the same location.
+#   Paths to this directory on the command line are changed to the sandbox.
+#
+#   The worker only accepts jobs carrying the secret it was started with, which
+#   is taken from the REMOTE_EXECUTION_TOKEN environment variable.
+#
+#   The digests of large inputs are cached by size, modification time and inode
+#   (like content-signatures.py does for SCons), so unchanged assets aren't hashed
+#   again for each action.
+#
+#   If the worker can't be reached or the action can't be described (MSVC,
+#   compiles using profiles for profile-guided optimization), it runs locally.
+#
+import sys
+import os
+import re
+import hmac
+import json
+import socket
+import struct
+import hashlib
+import tempfile
+import importlib
+import subprocess
+
+# Nuclex SCons libraries
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+shared = importlib.import_module('shared')
+
+# ----------------------------------------------------------------------------------------------- #
+
+# Version of the protocol spoken between this script and remote-worker.py
+protocol_version = 2
+
+# Port the worker listens on if none is specified
+default_port = 8377
+
+# Environment variable holding the secret shared by the worker and its clients
+token_variable = 'REMOTE_EXECUTION_TOKEN'
+
+# Largest JSON header a message may have, anything larger is rejected unread
+maximum_header_size = 16 * 1024 * 1024
+
+# Largest total size of the binary blobs a message may carry by default
+maximum_blob_size = 4 * 1024 * 1024 * 1024
+
+# Input files are hashed in blocks of this size
+_block_size = 1024 * 1024
+
+# Inputs from this size on have their digests cached, smaller ones are simply hashed
+_cached_digest_minimum_size = 1024 * 1024
+
+# Seconds to wait for the worker to accept a connection before running locally
+_connect_timeout = 5.0
+
+# Compiler arguments that take the next argument as their value
+_arguments_with_value = [
+    '-o', '-MF', '-MT', '-MQ', '-I', '-isystem', '-iquote', '-idirafter', '-include',
+    '-D', '-U', '-x'
+]
+
+# Compiler arguments naming an include directory, with or without a separate value
+_include_directory_arguments = [ '-I', '-isystem', '-iquote', '-idirafter' ]
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _main():
+    """Runs the command on the worker or locally if that isn't possible"""
+
+    worker_address = sys.argv[1]
+
+    input_paths = []
+    output_paths = []
+    mapped_output_paths = []
+    is_compile = False
+    path_list = None
+    for argument in sys.argv[2:sys.argv.index('--')]:
+        if argument == '--inputs':
+            path_list = input_paths
+        elif argument == '--outputs':
+            path_list = output_paths
+        elif argument == '--compile':
+            is_compile = True
+        elif path_list is not None:
+            path_list.append(argument)
+
+    command_arguments = sys.argv[sys.argv.index('--') + 1:]
+
+    if is_compile:
+        compile_files = _discover_compile_files(command_arguments)
+        if compile_files is None:
+            return subprocess.call(command_arguments)
+
+        input_paths += compile_files[0]
+        output_paths += compile_files[1]
+        mapped_output_paths += compile_files[2]
+
+    token = os.environ.get(token_variable)
+    if not token:
+        return subprocess.call(command_arguments)
+
+    job = _describe_job(
+        command_arguments, input_paths, output_paths, mapped_output_paths, is_compile
+    )
+    if job is None:
+        return subprocess.call(command_arguments)
+
+    job[0]['token'] = token
+
+    try:
+        return _execute_on_worker(worker_address, job)
+    except (OSError, ValueError, KeyError) as error:
+        sys.stderr.write(
+            'Remote execution on ' + worker_address + ' failed (' + str(error) + '), ' +
+            'running locally\n'
+        )
+        return subprocess.call(command_arguments)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def send_message(connection, header, blobs = []):
+    """Sends a message consisting of a JSON header and any number of binary blobs
+
+    @param  connection  Socket through which the message will be sent
+    @param  header      Dictionary that will be sent as JSON
+    @param  blobs       Binary data that will follow the header"""
+
+    header = dict(header)
+    header['blob_sizes'] = [ len(blob) for blob in blobs ]
+    header_bytes = json.dumps(header).encode('utf-8')
+
+    connection.sendall(struct.pack('!Q', len(header_bytes)) + header_bytes)
+    for blob in blobs:
+        connection.sendall(blob)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def receive_message(connection, maximum_size = maximum_blob_size):
+    """Receives a message sent via send_message()
+
+    @param  connection    Socket from which the message will be received
+    @param  maximum_size  Largest total size of the blobs that will be accepted
+    @returns A tuple of the header dictionary and the list of binary blobs
+    @remarks
+        The sizes are checked before anything is allocated for them, so a damaged or
+        hostile message can't make the receiver run out of memory."""
+
+    header_length = struct.unpack('!Q', _receive_exactly(connection, 8))[0]
+    if header_length > maximum_header_size:
+        raise ValueError('Message header of ' + str(header_length) + ' bytes is too large')
+
+    header = json.loads(_receive_exactly(connection, header_length).decode('utf-8'))
+    if not isinstance(header, dict):
+        raise ValueError('Message header is not a JSON object')
+
+    blob_sizes = header.get('blob_sizes')
+    if (not isinstance(blob_sizes, list)) or \
+       any((not isinstance(size, int)) or (size < 0) for size in blob_sizes):
+        raise ValueError('Message header lists invalid blob sizes')
+    if sum(blob_sizes) > maximum_size:
+        raise ValueError('Message blobs of ' + str(sum(blob_sizes)) + ' bytes are too large')
+
+    blobs = []
+    for blob_size in blob_sizes:
+        blobs.append(_receive_exactly(connection, blob_size))
+
+    return header, blobs
+
+# ----------------------------------------------------------------------------------------------- #
+
+def get_digest(data):
+    """Calculates the digest under which data is stored by content
+
+    @param  data  Binary data whose digest will be calculated
+    @returns The hexadecimal SHA-256 digest of the data"""
+
+    return hashlib.sha256(data).hexdigest()
+
+# ----------------------------------------------------------------------------------------------- #
+
+def get_file_digest(path):
+    """Calculates the digest under which a file is stored by content
+
+    @param  path  Path of the file whose digest will be calculated
+    @returns The hexadecimal SHA-256 digest of the file's contents
+    @remarks
+        The file is read in blocks, so even huge files only need a little memory."""
+
+    hash_object = hashlib.sha256()
+    with open(path, 'rb') as input_file:
+        while True:
+            block = input_file.read(_block_size)
+            if len(block) == 0:
+                break
+            hash_object.update(block)
+
+    return hash_object.hexdigest()
+
+# ----------------------------------------------------------------------------------------------- #
+
+def is_valid_token(token, expected_token):
+    """Checks whether a job carries the secret shared by the worker and its clients
+
+    @param  token           Secret sent along with the job
+    @param  expected_token  Secret the worker was started with
+    @returns True if the secrets match, False otherwise"""
+
+    if not isinstance(token, str):
+        return False
+
+    # Compared in constant time so the secret can't be guessed from the response time
+    return hmac.compare_digest(token.encode('utf-8'), expected_token.encode('utf-8'))
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _send_files(connection, header, file_paths):
+    """Sends a message whose blobs are the contents of files
+
+    @param  connection  Socket through which the message will be sent
+    @param  header      Dictionary that will be sent as JSON
+    @param  file_paths  Paths of the files that will follow the header as blobs
+    @remarks
+        The files are streamed from disk instead of being loaded into memory."""
+
+    file_sizes = [ os.path.getsize(file_path) for file_path in file_paths ]
+
+    header = dict(header)
+    header['blob_sizes'] = file_sizes
+    header_bytes = json.dumps(header).encode('utf-8')
+
+    connection.sendall(struct.pack('!Q', len(header_bytes)) + header_bytes)
+    for file_path, file_size in zip(file_paths, file_sizes):
+        with open(file_path, 'rb') as input_file:
+            sent_size = connection.sendfile(input_file, 0, file_size)
+
+        # The message would fall out of step if the file was truncated in the meantime
+        if sent_size != file_size:
+            raise OSError('Input ' + file_path + ' changed while it was being sent')
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _receive_exactly(connection, byte_count):
+    """Receives the specified number of bytes from a socket
+
+    @param  connection  Socket from which the bytes will be received
+    @param  byte_count  Number of bytes to receive
+    @returns The received bytes"""
+
+    chunks = []
+    while byte_count > 0:
+        chunk = connection.recv(min(byte_count, 1048576))
+        if len(chunk) == 0:
+            raise ConnectionError('Connection closed by the other side')
+
+        chunks.append(chunk)
+        byte_count -= len(chunk)
+
+    return b''.join(chunks)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _discover_compile_files(compiler_arguments):
+    """Finds the files a GCC or clang compile reads and writes
+
+    @param  compiler_arguments  Command line the compiler would be run with
+    @returns A tuple of the input paths, output paths and the outputs that may contain
+             paths (the dependency file) or None if the compile should run locally"""
+
+    compiler_name = os.path.splitext(os.path.basename(compiler_arguments[0]))[0].lower()
+    if compiler_name in [ 'cl', 'clang-cl' ]:
+        return None # MSVC writes shared .pdb files and has no -M
+
+    preprocessor_arguments = [ compiler_arguments[0] ]
+    object_path = None
+    dependency_path = None
+    writes_dependencies = False
+    include_directories = [ os.getcwd() ]
+    input_paths = []
+
+    index = 1
+    while index < len(compiler_arguments):
+        argument = compiler_arguments[index]
+        value = None
+        if (argument in _arguments_with_value) and (index + 1 < len(compiler_arguments)):
+            index += 1
+            value = compiler_arguments[index]
+
+        if argument.startswith('-fprofile-'):
+            return None # Profiles for profile-guided optimization aren't known inputs
+        elif argument == '-o':
+            object_path = value
+        elif argument == '-MF':
+            dependency_path = value
+        elif argument in [ '-MD', '-MMD' ]:
+            writes_dependencies = True
+        elif argument in [ '-c', '-MT', '-MQ' ]:
+            pass
+        else:
+            preprocessor_arguments.append(argument)
+            if value is not None:
+                preprocessor_arguments.append(value)
+
+            if argument in _include_directory_arguments:
+                include_directories.append(os.path.abspath(value))
+            elif argument.startswith(tuple(_include_directory_arguments)):
+                for include_argument in _include_directory_arguments:
+                    if argument.startswith(include_argument):
+                        include_directory = argument[len(include_argument):]
+                        include_directories.append(os.path.abspath(include_directory))
+                        break
+            elif (argument == '-include') and os.path.isfile(value + '.gch'):
+                input_paths.append(value + '.gch') # Precompiled header
+
+        index += 1
+
+    if object_path is None:
+        return None
+
+    # List all included files, then keep those that belong to the project, either because
+    # they were found via a relative path or in a directory named on the command line
+    preprocessor = subprocess.Popen(
+        preprocessor_arguments + [ '-M', '-MT', 'dependencies' ],
+        stdout = subprocess.PIPE, stderr = subprocess.DEVNULL
+    )
+    dependencies = preprocessor.communicate()[0]
+    if preprocessor.returncode != 0:
+        return None
+
+    for path in _parse_make_dependencies(dependencies.decode('utf-8')):
+        if not os.path.isabs(path):
+            input_paths.append(path)
+        elif any(_is_below(path, directory) for directory in include_directories):
+            input_paths.append(path)
+
+    output_paths = [ object_path ]
+    mapped_output_paths = []
+    if writes_dependencies:
+        if dependency_path is None:
+            dependency_path = os.path.splitext(object_path)[0] + '.d'
+        output_paths.append(dependency_path)
+        mapped_output_paths.append(dependency_path)
+    if '-gsplit-dwarf' in compiler_arguments:
+        output_paths.append(os.path.splitext(object_path)[0] + '.dwo')
+    if '-ftime-trace' in compiler_arguments:
+        output_paths.append(os.path.splitext(object_path)[0] + '.json')
+
+    return (input_paths, output_paths, mapped_output_paths)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _parse_make_dependencies(dependencies):
+    """Extracts the paths of the prerequisites from a Makefile dependency rule
+
+    @param  dependencies  Dependency rule as written by the compiler's -M option
+    @returns The paths of all files the rule's target depends on"""
+
+    # Skip the target, then join the lines continued with a backslash
+    prerequisites = dependencies.split(': ', 1)[-1]
+    prerequisites = prerequisites.replace('\\\r\n', ' ').replace('\\\n', ' ')
+
+    # Spaces in paths are escaped with a backslash
+    paths = []
+    for path in re.split(r'(?<!\\)\s+', prerequisites.strip()):
+        if len(path) > 0:
+            paths.append(path.replace('\\ ', ' '))
+
+    return paths
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _is_below(path, directory):
+    """Checks whether a path is inside the specified directory
+
+    @param  path       Absolute path that will be checked
+    @param  directory  Absolute path of the directory
+    @returns True if the path is inside the directory"""
+
+    try:
+        return os.path.commonpath([ path, directory ]) == directory
+    except ValueError:
+        return False # Different drives on Windows
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _describe_job(
+    command_arguments, input_paths, output_paths, mapped_output_paths, is_compile
+):
+    """Collects the information the worker needs to run a command
+
+    @param  command_arguments    Command line that will be run
+    @param  input_paths          Paths of the files the command reads
+    @param  output_paths         Paths of the files the command writes
+    @param  mapped_output_paths  Outputs in which the worker should change paths
+                                 into its sandbox back to paths on this machine
+    @param  is_compile           Whether the command is a GCC or clang compile
+    @returns A dictionary describing the job and the paths of the input files by their
+             digests, or None if the job can't be run remotely"""
+
+    working_directory = os.getcwd()
+
+    absolute_input_paths = []
+    for input_path in input_paths:
+        absolute_input_path = os.path.abspath(input_path)
+        if not os.path.isfile(absolute_input_path):
+            return None
+        if absolute_input_path not in absolute_input_paths:
+            absolute_input_paths.append(absolute_input_path)
+
+    absolute_output_paths = [ os.path.abspath(output_path) for output_path in output_paths ]
+    if len(absolute_output_paths) == 0:
+        return None
+
+    # The sandbox mirrors the deepest directory containing everything the command touches
+    try:
+        root_directory = os.path.commonpath(
+            [ working_directory ] + absolute_input_paths + absolute_output_paths
+        )
+    except ValueError:
+        return None # Different drives on Windows
+    if os.path.dirname(root_directory) == root_directory:
+        return None # Mirroring the whole file system makes no sense
+
+    inputs = {}
+    input_paths_by_digest = {}
+    for absolute_input_path in absolute_input_paths:
+        digest = _get_cached_file_digest(absolute_input_path)
+        input_paths_by_digest[digest] = absolute_input_path
+        inputs[_get_relative_path(absolute_input_path, root_directory)] = digest
+
+    job = {
+        'type': 'execute',
+        'protocol': protocol_version,
+        'arguments': command_arguments,
+        'root_directory': root_directory,
+        'working_directory': _get_relative_path(working_directory, root_directory),
+        'inputs': inputs,
+        'outputs': [
+            _get_relative_path(output_path, root_directory)
+            for output_path in absolute_output_paths
+        ],
+        'mapped_outputs': [
+            _get_relative_path(os.path.abspath(output_path), root_directory)
+            for output_path in mapped_output_paths
+        ],
+        'compile': is_compile
+    }
+
+    return (job, input_paths_by_digest)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_cached_file_digest(path):
+    """Looks up or calculates the digest of an input file
+
+    @param  path  Absolute path of the file whose digest will be returned
+    @returns The hexadecimal SHA-256 digest of the file's contents
+    @remarks
+        Each action runs in its own process, so the digests are cached in one small
+        file per input, which concurrent actions can replace without coordination."""
+
+    file_status = os.stat(path)
+    if file_status.st_size < _cached_digest_minimum_size:
+        return get_file_digest(path)
+
+    return shared.get_or_calculate_file_digest(
+        path, file_status,
+        _load_cached_digest, _store_digest, lambda path, size: get_file_digest(path)
+    )
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_digest_cache_entry_path(path):
+    """Determines the path of the file in which an input's digest is cached
+
+    @param  path  Absolute path of the input whose digest is cached
+    @returns The path of the cache entry"""
+
+    return os.path.join(
+        shared.get_default_cache_directory('remote-execution'),
+        hashlib.sha256(path.encode('utf-8')).hexdigest()
+    )
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _load_cached_digest(path, file_key):
+    """Looks up the digest cached for an input file
+
+    @param  path      Absolute path of the file whose digest will be looked up
+    @param  file_key  Size, modification time and inode the file has now
+    @returns The cached digest or None if the file changed since it was hashed"""
+
+    try:
+        with open(_get_digest_cache_entry_path(path), 'r') as cache_entry_file:
+            cached_key, separator, cached_digest = cache_entry_file.read().rpartition(' ')
+    except OSError:
+        return None # Not hashed before
+
+    if cached_key != '%d %d %d' % file_key:
+        return None
+
+    return cached_digest
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _store_digest(path, file_key, digest):
+    """Caches the digest of an input file
+
+    @param  path      Absolute path of the file whose digest will be cached
+    @param  file_key  Size, modification time and inode the file had when it was hashed
+    @param  digest    Hexadecimal SHA-256 digest of the file's contents"""
+
+    cache_entry_path = _get_digest_cache_entry_path(path)
+    try:
+        cache_directory = os.path.dirname(cache_entry_path)
+        os.makedirs(cache_directory, exist_ok = True)
+        temporary_file, temporary_path = tempfile.mkstemp(dir = cache_directory)
+        with os.fdopen(temporary_file, 'w') as cache_entry_file:
+            cache_entry_file.write('%d %d %d' % file_key + ' ' + digest)
+        os.replace(temporary_path, cache_entry_path)
+    except OSError:
+        pass # The digest is only cached to save time
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_relative_path(path, root_directory):
+    """Forms the path of a file relative to the mirrored directory, using forward slashes
+
+    @param  path            Absolute path of the file
+    @param  root_directory  Directory that is mirrored in the worker's sandbox
+    @returns The relative path with forward slashes"""
+
+    return os.path.relpath(path, root_directory).replace(os.sep, '/')
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_output_path(job, relative_path):
+    """Determines where an output sent back by the worker will be written
+
+    @param  job            Description of the job as returned by _describe_job()
+    @param  relative_path  Path of the output relative to the mirrored directory
+    @returns The absolute path the output will be written to
+    @remarks
+        The worker only gets to write the outputs the job expects, so a damaged or
+        hostile response can't overwrite other files on this machine."""
+
+    root_directory = job['root_directory']
+
+    output_path = os.path.normpath(os.path.join(root_directory, str(relative_path)))
+    if not _is_below(output_path, root_directory):
+        raise ValueError('Output ' + str(relative_path) + ' leads out of the mirrored directory')
+    if _get_relative_path(output_path, root_directory) not in job['outputs']:
+        raise ValueError('Output ' + str(relative_path) + ' was not expected from the job')
+
+    return output_path
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _execute_on_worker(worker_address, job):
+    """Sends a job to the worker, waits for it to finish and writes the outputs
+
+    @param  worker_address  Host and port of the worker
+    @param  job             Description and input contents as returned by _describe_job()
+    @returns The exit code of the command"""
+
+    job, input_paths_by_digest = job
+
+    host, separator, port = worker_address.rpartition(':')
+    if len(separator) == 0:
+        host, port = worker_address, default_port
+
+    connection = socket.create_connection((host, int(port)), timeout = _connect_timeout)
+    try:
+        connection.settimeout(None) # Commands can run for a long time
+
+        # Announce the job, then upload whatever the worker doesn't have yet
+        send_message(connection, job)
+        response, blobs = receive_message(connection)
+        if response['type'] == 'error':
+            raise ValueError(response['message'])
+
+        missing_digests = response['missing']
+        _send_files(
+            connection,
+            { 'type': 'upload', 'digests': missing_digests },
+            [ input_paths_by_digest[digest] for digest in missing_digests ]
+        )
+
+        result, blobs = receive_message(connection)
+        if result['type'] == 'error':
+            raise ValueError(result['message'])
+    finally:
+        connection.close()
+
+    sys.stdout.buffer.write(blobs[0])
+    sys.stdout.flush()
+    sys.stderr.buffer.write(blobs[1])
+    sys.stderr.flush()
+
+    # All outputs are checked before the first one is written, so a bad response
+    # leaves the files on this machine untouched
+    output_paths = []
+    for index, output in enumerate(result['outputs']):
+        output_path = _get_output_path(job, output['path'])
+        if get_digest(blobs[2 + index]) != output['digest']:
+            raise ValueError('Output ' + output['path'] + ' was damaged in transfer')
+
+        output_paths.append(output_path)
+
+    # Outputs are written via a temporary file, so a half-written file is never seen
+    for index, output_path in enumerate(output_paths):
+        temporary_output_path = output_path + '.remote'
+        with open(temporary_output_path, 'wb') as output_file:
+            output_file.write(blobs[2 + index])
+        os.replace(temporary_output_path, output_path)
+
+    return result['exit_code']
+
+# ----------------------------------------------------------------------------------------------- #
+
+if __name__ == '__main__':
+    sys.exit(_main())
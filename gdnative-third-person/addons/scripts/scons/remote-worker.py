@@ -0,0 +1,356 @@
+#!/usr/bin/env python
+
+# Purpose:
+#   Worker that runs build actions sent by remote-execution.py
+#
+#   Input files are kept in a store addressed by their SHA-256 digests, so files
+#   that many actions share (headers, export scripts) are only transferred once.
+#   Each action runs in its own sandbox directory into which the inputs are copied,
+#   so an action can't change the stored files other actions will receive.
+#
+# Usage:
+#   Invoke this script with the system's Python interpreter on the machine that
+#   should run the actions:
+#
+#   python remote-worker.py --jobs=8 --token=SECRET
+#
+#   - --token=SECRET sets the secret clients must send along with their jobs
+#     (default: the REMOTE_EXECUTION_TOKEN environment variable, required)
+#
+#   - --listen=ADDRESS sets the address to listen on (default: localhost)
+#
+#   - --port=PORT sets the port to listen on (default: 8377)
+#
+#   - --jobs=COUNT sets how many actions run at the same time (default: CPU count)
+#
+#   - --storage=DIRECTORY sets where the input files and sandboxes are kept
+#
+#   - --maximum-size=BYTES sets how large the store of input files may grow
+#
+#   Then set REMOTE_EXECUTION_TOKEN=SECRET in the environment and build with
+#   REMOTE_EXECUTION=host:port on the SCons command line.
+#
+#   The worker runs any command it receives from a client knowing the secret.
+#   The secret is sent unencrypted, so only listen on other addresses than
+#   localhost within a network where all machines are trusted.
+#
+import sys
+import os
+import re
+import importlib
+import shutil
+import socketserver
+import subprocess
+import tempfile
+import threading
+
+# Nuclex SCons libraries
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+shared = importlib.import_module('shared')
+remote_execution = importlib.import_module('remote-execution')
+
+# ----------------------------------------------------------------------------------------------- #
+
+# Number of finished actions after which the store is trimmed to its maximum size
+_eviction_interval = 64
+
+# ----------------------------------------------------------------------------------------------- #
+
+class _Worker(socketserver.ThreadingTCPServer):
+    """Accepts connections from remote-execution.py and runs their actions"""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, token, storage_directory, job_count, maximum_size):
+        """Initializes a new worker
+
+        @param  address            Host and port the worker will listen on
+        @param  token              Secret clients must send along with their jobs
+        @param  storage_directory  Directory for the input file store and the sandboxes
+        @param  job_count          Number of actions that may run at the same time
+        @param  maximum_size       Number of bytes the input file store may occupy"""
+
+        socketserver.ThreadingTCPServer.__init__(self, address, _JobHandler)
+
+        self.token = token
+
+        self.blob_directory = os.path.join(storage_directory, 'blobs')
+        self.sandbox_directory = os.path.join(storage_directory, 'sandboxes')
+        self.job_slots = threading.BoundedSemaphore(job_count)
+        self.maximum_size = maximum_size
+
+        self.statistics_lock = threading.Lock()
+        self.finished_job_count = 0
+
+        for directory in [ self.blob_directory, self.sandbox_directory ]:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+    def get_blob_path(self, digest):
+        """Determines where the input file with the specified digest is stored
+
+        @param  digest  SHA-256 digest of the input file
+        @returns The path of the input file in the store"""
+
+        return os.path.join(self.blob_directory, digest[:2], digest)
+
+    def store_blob(self, digest, data):
+        """Stores an input file received from a client
+
+        @param  digest  SHA-256 digest the client claims the data has
+        @param  data    Contents of the input file"""
+
+        if remote_execution.get_digest(data) != digest:
+            raise ValueError('Input ' + digest + ' was damaged in transfer')
+
+        blob_path = self.get_blob_path(digest)
+        bucket_directory = os.path.dirname(blob_path)
+        if not os.path.isdir(bucket_directory):
+            os.makedirs(bucket_directory, exist_ok = True)
+
+        # Written via a temporary file so concurrent jobs never copy a partial file
+        temporary_file, temporary_path = tempfile.mkstemp(
+            prefix = '.incoming-', dir = bucket_directory
+        )
+        with os.fdopen(temporary_file, 'wb') as blob_file:
+            blob_file.write(data)
+        os.chmod(temporary_path, 0o555) # Inputs may be scripts that are run directly
+        os.replace(temporary_path, blob_path)
+
+    def finish_job(self):
+        """Counts a finished job and trims the store every now and then"""
+
+        with self.statistics_lock:
+            self.finished_job_count += 1
+            if self.finished_job_count % _eviction_interval == 0:
+                shared.evict_least_recently_used(
+                    self.blob_directory, self.maximum_size, depth = 2
+                )
+
+# ----------------------------------------------------------------------------------------------- #
+
+class _JobHandler(socketserver.BaseRequestHandler):
+    """Handles the connection of one remote-execution.py, which submits a single job"""
+
+    def handle(self):
+        """Receives a job, its missing inputs, runs it and sends back the results"""
+
+        try:
+            # The job itself carries no blobs, so nothing is accepted before it is checked
+            job, blobs = remote_execution.receive_message(self.request, maximum_size = 0)
+            if job.get('protocol') != remote_execution.protocol_version:
+                remote_execution.send_message(
+                    self.request, { 'type': 'error', 'message': 'Unsupported protocol version' }
+                )
+                return
+            if not remote_execution.is_valid_token(job.get('token'), self.server.token):
+                remote_execution.send_message(
+                    self.request, { 'type': 'error', 'message': 'Invalid token' }
+                )
+                return
+
+            # Ask only for the inputs that aren't in the store yet
+            missing_digests = []
+            for digest in job['inputs'].values():
+                if digest in missing_digests:
+                    continue
+
+                blob_path = self.server.get_blob_path(digest)
+                if os.path.isfile(blob_path):
+                    os.utime(blob_path, None) # Mark as recently used for the eviction
+                else:
+                    missing_digests.append(digest)
+
+            remote_execution.send_message(
+                self.request, { 'type': 'missing', 'missing': missing_digests }
+            )
+
+            upload, blobs = remote_execution.receive_message(self.request)
+            for digest, data in zip(upload['digests'], blobs):
+                self.server.store_blob(digest, data)
+
+            # Transfers happen outside of the job slots, only running the command counts
+            with self.server.job_slots:
+                result, blobs = self._run_job(job)
+
+            remote_execution.send_message(self.request, result, blobs)
+            self.server.finish_job()
+
+        except (OSError, ValueError, KeyError) as error:
+            try:
+                remote_execution.send_message(
+                    self.request, { 'type': 'error', 'message': str(error) }
+                )
+            except OSError:
+                pass # Client is gone
+
+    def _run_job(self, job):
+        """Runs a job's command in a sandbox holding its inputs
+
+        @param  job  Job description received from the client
+        @returns The result message and its blobs (output, errors, output files)"""
+
+        sandbox_directory = tempfile.mkdtemp(dir = self.server.sandbox_directory)
+        try:
+            for relative_path, digest in job['inputs'].items():
+                input_path = _get_sandbox_path(sandbox_directory, relative_path)
+                _make_parent_directory(input_path)
+                _copy_input(self.server.get_blob_path(digest), input_path)
+
+            # Compilers don't create the directories for their outputs
+            for relative_path in job['outputs']:
+                _make_parent_directory(_get_sandbox_path(sandbox_directory, relative_path))
+
+            working_directory = _get_sandbox_path(sandbox_directory, job['working_directory'])
+            if not os.path.isdir(working_directory):
+                os.makedirs(working_directory)
+
+            # Paths into the client's directory tree now lead into the sandbox
+            root_pattern = re.compile(re.escape(job['root_directory']) + r'(?=[\\/"]|$)')
+            arguments = [
+                root_pattern.sub(lambda match: sandbox_directory, argument)
+                for argument in job['arguments']
+            ]
+
+            # Debug information and __FILE__ should name the files on the client
+            if job['compile']:
+                arguments.insert(
+                    1, '-ffile-prefix-map=' + sandbox_directory + '=' + job['root_directory']
+                )
+
+            try:
+                process = subprocess.Popen(
+                    arguments, cwd = working_directory,
+                    stdout = subprocess.PIPE, stderr = subprocess.PIPE
+                )
+                output, errors = process.communicate()
+                exit_code = process.returncode
+            except OSError as error:
+                output, errors = b'', (str(error) + '\n').encode('utf-8')
+                exit_code = 127
+
+            outputs = []
+            blobs = [ output, errors ]
+            for relative_path in job['outputs']:
+                output_path = _get_sandbox_path(sandbox_directory, relative_path)
+                if os.path.isfile(output_path):
+                    with open(output_path, 'rb') as output_file:
+                        data = output_file.read()
+                    if relative_path in job['mapped_outputs']:
+                        data = data.replace(
+                            sandbox_directory.encode('utf-8'),
+                            job['root_directory'].encode('utf-8')
+                        )
+
+                    outputs.append(
+                        { 'path': relative_path, 'digest': remote_execution.get_digest(data) }
+                    )
+                    blobs.append(data)
+
+            result = { 'type': 'result', 'exit_code': exit_code, 'outputs': outputs }
+            return (result, blobs)
+
+        finally:
+            shutil.rmtree(sandbox_directory, ignore_errors = True)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_sandbox_path(sandbox_directory, relative_path):
+    """Determines the path of a file within a sandbox
+
+    @param  sandbox_directory  Directory of the sandbox the job runs in
+    @param  relative_path      Path relative to the mirrored directory, with forward slashes
+    @returns The path of the file in the sandbox"""
+
+    sandbox_path = os.path.normpath(os.path.join(sandbox_directory, relative_path))
+    if os.path.commonpath([ sandbox_path, sandbox_directory ]) != sandbox_directory:
+        raise ValueError('Path ' + relative_path + ' leads out of the sandbox')
+
+    return sandbox_path
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _make_parent_directory(path):
+    """Creates the directory a file will be placed in if it doesn't exist yet
+
+    @param  path  Path of the file whose directory will be created"""
+
+    parent_directory = os.path.dirname(path)
+    if not os.path.isdir(parent_directory):
+        os.makedirs(parent_directory, exist_ok = True)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _copy_input(source_path, target_path):
+    """Places an input file from the store in a sandbox
+
+    @param  source_path  Path of the input file in the store
+    @param  target_path  Path the input file should have in the sandbox
+    @remarks
+        The file is copied rather than linked. A hard link would share the stored file
+        with the action, which could then change it (when running as root or after
+        a chmod) and hand damaged inputs to every later action using it."""
+
+    shutil.copyfile(source_path, target_path)
+    shutil.copymode(source_path, target_path)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _main():
+    """Parses the command line and serves jobs until interrupted"""
+
+    token = os.environ.get(remote_execution.token_variable)
+    listen_address = 'localhost'
+    port = remote_execution.default_port
+    job_count = os.cpu_count() or 1
+    storage_directory = shared.get_default_cache_directory('remote-worker')
+    maximum_size = 10 * 1024 * 1024 * 1024
+
+    for argument in sys.argv[1:]:
+        name, separator, value = argument.partition('=')
+        if name == '--token':
+            token = value
+        elif name == '--listen':
+            listen_address = value
+        elif name == '--port':
+            port = int(value)
+        elif name == '--jobs':
+            job_count = int(value)
+        elif name == '--storage':
+            storage_directory = os.path.abspath(os.path.expanduser(value))
+        elif name == '--maximum-size':
+            maximum_size = int(value)
+        else:
+            sys.stderr.write('Unknown argument: ' + argument + '\n')
+            return 1
+
+    if not token:
+        sys.stderr.write(
+            'A secret is required, pass --token=SECRET or set ' +
+            remote_execution.token_variable + '\n'
+        )
+        return 1
+
+    worker = _Worker(
+        (listen_address, port), token, storage_directory, job_count, maximum_size
+    )
+    print(
+        'Remote worker listening on \033[94m' + listen_address + ':' + str(port) + '\033[0m' +
+        ' running up to \033[94m' + str(job_count) + '\033[0m jobs'
+    )
+    sys.stdout.flush()
+
+    try:
+        worker.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.server_close()
+
+    return 0
+
+# ----------------------------------------------------------------------------------------------- #
+
+if __name__ == '__main__':
+    sys.exit(_main())
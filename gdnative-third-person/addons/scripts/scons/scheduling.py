@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+
+import atexit
+import threading
+import importlib
+
+import SCons.Taskmaster
+
+# Nuclex SCons libraries
+profiling = importlib.import_module('profiling')
+shared = importlib.import_module('shared')
+
+"""
+Critical path scheduling for SCons builds
+
+SCons walks the dependency graph depth-first in the order dependencies were declared,
+so a long-running build step (a Blender export, a nested SCons build) may only be
+started when everything else is done, leaving all other jobs idle while it runs.
+
+This records how long each build step took and makes SCons descend into the children
+with the longest estimated remaining path (the most expensive chain of build steps
+below them) first, so long chains get started early.
+"""
+
+# ----------------------------------------------------------------------------------------------- #
+
+# Seconds assumed for a build step when nothing is known about similar build steps
+_default_duration = 1.0
+
+# Durations of earlier build steps in seconds, keyed by (category, target path)
+_history = None
+
+# Path of the file in which the history is persisted between builds
+_history_path = None
+
+# Version of the history file's format, older histories will be discarded
+_history_version = 1
+
+# Whether the history has changed since it was loaded
+_history_changed = False
+
+# Average durations of each category of build steps in the history
+_average_durations = None
+
+# Average duration of all build steps in the history
+_overall_average_duration = _default_duration
+
+# Estimated remaining path lengths of nodes already looked at in this build
+_remaining_path_lengths = {}
+
+# Nodes whose remaining path length is being estimated, to detect dependency cycles
+_nodes_in_progress = set()
+
+# Protects the history from concurrent updates by SCons' worker threads
+_history_lock = threading.Lock()
+
+# ----------------------------------------------------------------------------------------------- #
+
+def enable(history_path):
+    """Records the durations of all build steps and orders the build by critical path
+
+    @param  history_path  Path of the file in which build step durations will be stored
+    @remarks
+        Only the first call has an effect, so all environments share one history."""
+
+    global _history_path, _history
+    if _history_path is not None:
+        return
+
+    _history_path = history_path
+    _history = _load_history()
+    _update_average_durations()
+
+    profiling.add_build_step_observer(_record_duration)
+    atexit.register(_save_history)
+
+    # SCons creates its Taskmaster after all build scripts have run. The order function
+    # it takes is applied to the children of each node before they are walked.
+    original_initializer = SCons.Taskmaster.Taskmaster.__init__
+
+    def initialize_with_critical_path_order(
+        taskmaster, targets = [], tasker = None, order = None, trace = None
+    ):
+        original_initializer(
+            taskmaster, targets, tasker, _create_critical_path_order(order), trace
+        )
+
+    SCons.Taskmaster.Taskmaster.__init__ = initialize_with_critical_path_order
+
+# ----------------------------------------------------------------------------------------------- #
+
+def estimate_duration(node):
+    """Estimates how long the build step producing a node will take
+
+    @param  node  Node whose build step duration will be estimated
+    @returns The estimated duration of the build step in seconds"""
+
+    if not node.has_builder():
+        return 0.0
+
+    category = profiling.get_category(node)
+
+    duration = _history.get((category, str(node)))
+    if duration is not None:
+        return duration
+
+    # Never built before, assume it takes as long as similar build steps
+    return _average_durations.get(category, _overall_average_duration)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _create_critical_path_order(order):
+    """Creates an order function for the Taskmaster that puts the children with
+    the longest remaining path last
+
+    @param  order  Order function SCons wanted to use (i.e. for --random)
+    @returns The new order function
+    @remarks
+        The Taskmaster pushes the children onto a stack, so the last child in
+        the list is the first one to be walked."""
+
+    def order_by_critical_path(nodes):
+        if order is not None:
+            nodes = order(nodes)
+
+        try:
+            return sorted(nodes, key = _get_remaining_path_length)
+        except Exception:
+            return nodes # Never let the scheduling heuristic break a build
+
+    return order_by_critical_path
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_remaining_path_length(node):
+    """Estimates the duration of the longest chain of build steps ending in a node
+
+    @param  node  Node whose longest chain of build steps will be estimated
+    @returns The estimated duration of the longest chain of build steps in seconds
+    @remarks
+        Only the dependencies that are already known are looked at, nodes are not
+        scanned for implicit dependencies ahead of the Taskmaster."""
+
+    remaining_path_length = _remaining_path_lengths.get(node)
+    if remaining_path_length is not None:
+        return remaining_path_length
+
+    if node in _nodes_in_progress:
+        return 0.0 # Dependency cycle, SCons will report it
+
+    # Only finished estimates are stored, so an error (i.e. a RecursionError in a very
+    # deep graph) can't leave guesses for the nodes still in progress behind
+    _nodes_in_progress.add(node)
+    try:
+        longest_child_path_length = 0.0
+        for child in node.children(scan = 0):
+            longest_child_path_length = max(
+                longest_child_path_length, _get_remaining_path_length(child)
+            )
+    finally:
+        _nodes_in_progress.discard(node)
+
+    remaining_path_length = estimate_duration(node) + longest_child_path_length
+    _remaining_path_lengths[node] = remaining_path_length
+
+    return remaining_path_length
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _record_duration(targets, start_time, end_time, exit_status):
+    """Stores the duration of an executed build step in the history
+
+    @param  targets      Nodes that were produced by the build step
+    @param  start_time   Point in time at which the build step started
+    @param  end_time     Point in time at which the build step ended
+    @param  exit_status  Exit status of the build step (0 if it succeeded)"""
+
+    if exit_status != 0:
+        return # Failed build steps often end early and would distort the estimates
+
+    try:
+        category = profiling.get_category(targets[0])
+    except Exception:
+        return
+
+    duration = end_time - start_time
+
+    global _history_changed
+    with _history_lock:
+        for target in targets:
+            key = (category, str(target))
+
+            # Smooth out outliers (i.e. the machine being busy with something else)
+            previous_duration = _history.get(key)
+            if previous_duration is None:
+                _history[key] = duration
+            else:
+                _history[key] = (previous_duration + duration) / 2.0
+
+        _history_changed = True
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _update_average_durations():
+    """Calculates the average duration of each category of build steps in the history"""
+
+    global _average_durations, _overall_average_duration
+
+    totals = {}
+    for (category, target_path), duration in _history.items():
+        total_duration, count = totals.get(category, (0.0, 0))
+        totals[category] = (total_duration + duration, count + 1)
+
+    _average_durations = {}
+    for category, (total_duration, count) in totals.items():
+        _average_durations[category] = total_duration / count
+
+    if len(_history) > 0:
+        _overall_average_duration = sum(_history.values()) / len(_history)
+    else:
+        _overall_average_duration = _default_duration
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _load_history():
+    """Loads the build step durations recorded by earlier builds
+
+    @returns The build step durations or an empty dictionary if there are none"""
+
+    history = shared.load_pickled(_history_path, _history_version)
+    if history is None:
+        return {}
+
+    return history
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _save_history():
+    """Persists the build step durations if they were changed during the build"""
+
+    if not _history_changed:
+        return
+
+    with _history_lock:
+        shared.save_pickled(_history_path, _history_version, _history)
@@ -2,6 +2,12 @@
 
 import os
 import shutil
+import stat
+import fnmatch
+import platform
+import time
+import atexit
+import pickle
 
 """
 Shared code for SCons projects
@@ -11,6 +17,129 @@ This file provides common helper methods for the other SCons modules.
 
 # ----------------------------------------------------------------------------------------------- #
 
+# Listings of all directories seen so far, keyed by absolute directory path. Each entry
+# holds the directory's modification time, its subdirectories, its files and its files
+# grouped by extension.
+_tree_index = None
+
+# Path of the file in which the tree index is persisted between builds
+_tree_index_path = None
+
+# Version of the tree index file's format, older tree indices will be discarded
+_tree_index_version = 1
+
+# Whether the tree index has changed since it was loaded
+_tree_index_changed = False
+
+# Directories whose listing was already checked against the file system in this build
+_validated_directories = set()
+
+# Index entry used for directories that don't exist
+_empty_index_entry = (None, (), (), {})
+
+# Seconds for which a directory's modification time is too recent to be trusted
+# (a file created in the same tick as the listing would go unnoticed otherwise)
+_racy_modification_time_window = 2.0
+
+# Seconds a file needs to be unmodified before a digest calculated from it is cached
+_minimum_digest_age = 2.0
+
+# Names of entries that caches write before renaming them into place (nuclex caches
+# use '.incoming-*' directories and '*.tmp' files, SCons' CacheDir uses 'tmp*' directories)
+_temporary_entry_patterns = [ '.incoming-*', '*.tmp', 'tmp*' ]
+
+# Seconds after which a temporary cache entry is assumed to be left over by a crashed build
+_abandoned_entry_age = 24 * 60 * 60
+
+# ----------------------------------------------------------------------------------------------- #
+
+def use_tree_index(index_path):
+    """Persists the directory listings of the tree index in the specified file
+
+    @param  index_path  Path of the file the tree index will be stored in
+    @remarks
+        Without this, the tree index still avoids listing the same directory twice
+        during a build, but has to list all directories again in the next build.
+        Only the first call has an effect, so all environments share one index."""
+
+    global _tree_index_path
+    if _tree_index_path is None:
+        _tree_index_path = index_path
+        atexit.register(_save_tree_index)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def walk(root_directory):
+    """Walks the directory tree below a directory like os.walk() does, but takes
+    the directory listings from the tree index
+
+    @param  root_directory  Directory whose subtree will be walked
+    @returns A generator yielding a (directory, subdirectory names, file names) tuple
+             for each directory, starting with the root directory
+    @remarks
+        Directories are only listed again if their modification time changed since
+        the tree index was last updated. Like with os.walk(), subdirectories removed
+        from the yielded list of subdirectory names will not be walked into."""
+
+    pending_directories = [ root_directory ]
+    while len(pending_directories) > 0:
+        directory = pending_directories.pop()
+
+        index_entry = _get_index_entry(directory)
+        subdirectory_names = list(index_entry[1])
+        yield directory, subdirectory_names, list(index_entry[2])
+
+        for subdirectory_name in reversed(subdirectory_names):
+            pending_directories.append(os.path.join(directory, subdirectory_name))
+
+# ----------------------------------------------------------------------------------------------- #
+
+def enumerate_files(root_directory, extensions = None, variant_directory = None):
+    """Forms a list of all files with the specified extensions in a directory tree
+
+    @param  root_directory     Directory below which files will be collected
+    @param  extensions         File extensions (including the dot) of the files to collect,
+                               None to collect all files
+    @param  variant_directory  Variant directory to which source paths will be rewritten
+    @returns The paths of all matching files"""
+
+    if extensions is not None:
+        extensions = sorted(set(extensions))
+
+    files = []
+
+    pending_directories = [ root_directory ]
+    while len(pending_directories) > 0:
+        directory = pending_directories.pop()
+        modification_time, subdirectory_names, file_names, files_by_extension = (
+            _get_index_entry(directory)
+        )
+
+        # Select the matching files by their extension rather than looking at each file
+        if extensions is not None:
+            matching_file_names = []
+            for extension in extensions:
+                matching_file_names.extend(files_by_extension.get(extension, ()))
+            if len(matching_file_names) > 1:
+                matching_file_names.sort()
+        else:
+            matching_file_names = file_names
+
+        if len(matching_file_names) > 0:
+            if variant_directory is None:
+                prefix = os.path.join(directory, '')
+            else:
+                prefix = os.path.join(variant_directory, directory, '')
+
+            files.extend([ prefix + file_name for file_name in matching_file_names ])
+
+        for subdirectory_name in reversed(subdirectory_names):
+            pending_directories.append(os.path.join(directory, subdirectory_name))
+
+    return files
+
+# ----------------------------------------------------------------------------------------------- #
+
 def enumerate_subdirectories(root_directory, ignored_directories=[]):
     """Enumerates the direct subdirectories inside a directory
 
@@ -19,10 +148,9 @@ def enumerate_subdirectories(root_directory, ignored_directories=[]):
 
     directories = []
 
-    for entry in os.listdir(root_directory):
-        if os.path.isdir(entry):
-            if not any(entry in s for s in ignored_directories):
-                directories.append(entry)
+    for subdirectory_name in _get_index_entry(root_directory)[1]:
+        if subdirectory_name not in ignored_directories:
+            directories.append(subdirectory_name)
 
     return directories
 
@@ -34,17 +162,10 @@ def enumerate_any_files(source_directory, variant_directory = ""):
     @param  source_directory     Directory containing all of the source files
     @param  variant_directory    Variant directory to which source paths will be rewritten"""
 
-    files = []
-
-    # Form a list of all files in the input directories recursively.
-    for root, directory_names, file_names in os.walk(subdirectory):
-        for file_name in file_names:
-            if variant_directory:
-                files.append(os.path.join(variant_directory, os.path.join(root, file_name)))
-            else:
-                files.append(os.path.join(root, file_name))
-
-    return files
+    if variant_directory:
+        return enumerate_files(source_directory, None, variant_directory)
+    else:
+        return enumerate_files(source_directory)
 
 # ----------------------------------------------------------------------------------------------- #
 
@@ -59,9 +180,323 @@ def setup_variant_dirs(
     @param  ignored_directories     Directories that will be ignored if encountered"""
 
     # Set up VariantDirs for all direct subdirectories
-    subdirectories = _enumerate_subdirectories(project_directory, ignored_directories)
+    subdirectories = enumerate_subdirectories(project_directory, ignored_directories)
     for subdirectory in subdirectories:
         build_directory = os.path.join(intermediate_directory, subdirectory)
         scons_environment.VariantDir(build_directory, subdirectory, duplicate = 0)
 
 # ----------------------------------------------------------------------------------------------- #
+
+def get_default_cache_directory(cache_name):
+    """Returns the default directory for a machine-wide cache of the current user
+
+    @param  cache_name  Name of the cache (i.e. 'godot-cpp')
+    @returns The directory in which the cache should store its entries"""
+
+    if platform.system() == 'Windows':
+        base_directory = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+    else:
+        base_directory = os.environ.get(
+            'XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')
+        )
+
+    return os.path.join(base_directory, 'nuclex', cache_name)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def evict_least_recently_used(cache_directory, maximum_size, depth = 1):
+    """Deletes the least recently used entries of a cache directory until its total
+    size is within the specified limit
+
+    @param  cache_directory  Directory holding the cache entries
+    @param  maximum_size     Maximum number of bytes the cache entries may occupy
+    @param  depth            Directory level at which the entries are found
+                             (1 = the cache directory's direct children are entries,
+                             2 = the children of its subdirectories, i.e. for caches
+                             that spread their entries over subdirectories)
+    @remarks
+        Entries can be files or directories. The modification time of an entry is
+        used as its last use time, so caches should touch an entry when using it.
+
+        Other builds may add, use and evict entries at the same time. Entries that
+        disappear while the cache is being scanned are skipped and entries still being
+        written by another build (see _temporary_entry_patterns) are left alone unless
+        they have been abandoned."""
+
+    entries = []
+    total_size = 0
+    now = time.time()
+
+    for entry_path in _enumerate_entries_at_depth(cache_directory, depth):
+        try:
+            last_use_time = os.stat(entry_path).st_mtime
+            entry_size = _get_size_of_file_or_directory(entry_path)
+        except OSError:
+            continue # Evicted or renamed into place by a concurrent build
+
+        if _is_temporary_entry(entry_path):
+            if last_use_time >= now - _abandoned_entry_age:
+                continue # Still being written by a concurrent build
+            last_use_time = 0 # Left over by a crashed build, delete it first
+
+        entries.append((last_use_time, entry_size, entry_path))
+        total_size += entry_size
+
+    # Delete the oldest entries first
+    entries.sort()
+    for last_use_time, entry_size, entry_path in entries:
+        if total_size <= maximum_size:
+            break
+
+        try:
+            if os.path.isdir(entry_path):
+                shutil.rmtree(entry_path)
+            else:
+                os.remove(entry_path)
+            total_size -= entry_size
+        except OSError:
+            pass # Probably being deleted by a concurrent build
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _is_temporary_entry(entry_path):
+    """Checks whether a cache entry is being written before it is renamed into place
+
+    @param  entry_path  Path of the cache entry that will be checked
+    @returns True if the entry is a temporary file or directory, False otherwise"""
+
+    entry_name = os.path.basename(entry_path)
+    for pattern in _temporary_entry_patterns:
+        if fnmatch.fnmatchcase(entry_name, pattern):
+            return True
+
+    return False
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _enumerate_entries_at_depth(directory, depth):
+    """Lists the files and directories at the specified depth below a directory
+
+    @param  directory  Directory whose entries will be listed
+    @param  depth      Directory level of the entries (1 = direct children)
+    @returns A list of the paths of all entries at the specified depth"""
+
+    entries = []
+
+    try:
+        entry_names = os.listdir(directory)
+    except OSError:
+        return entries # Doesn't exist (yet) or was just evicted by a concurrent build
+
+    for entry in entry_names:
+        path = os.path.join(directory, entry)
+        if depth > 1:
+            if os.path.isdir(path):
+                entries.extend(_enumerate_entries_at_depth(path, depth - 1))
+        else:
+            entries.append(path)
+
+    return entries
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_size_of_file_or_directory(path):
+    """Determines the number of bytes occupied by a file or a directory's contents
+
+    @param  path  Path of the file or directory whose size will be determined
+    @returns The size of the file or the total size of all files in the directory"""
+
+    path_status = os.lstat(path)
+    if not stat.S_ISDIR(path_status.st_mode):
+        return path_status.st_size
+
+    total_size = 0
+    for root, directory_names, file_names in os.walk(path):
+        for file_name in file_names:
+            try:
+                total_size += os.lstat(os.path.join(root, file_name)).st_size
+            except OSError:
+                pass
+
+    return total_size
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _get_index_entry(directory):
+    """Looks up the subdirectories and files in a directory via the tree index
+
+    @param  directory  Directory whose subdirectories and files will be looked up
+    @returns A tuple of the directory's modification time, the sorted subdirectory
+             names, the sorted file names and the file names grouped by extension
+    @remarks
+        The directory is only listed if it's not in the tree index yet or if its
+        modification time changed (which happens when entries are added, removed or
+        renamed, but not when a file's contents are modified)."""
+
+    global _tree_index, _tree_index_changed
+    if _tree_index is None:
+        _tree_index = _load_tree_index()
+
+    absolute_directory = os.path.abspath(directory)
+
+    index_entry = _tree_index.get(absolute_directory)
+    if absolute_directory in _validated_directories:
+        if index_entry is None:
+            return _empty_index_entry
+        return index_entry
+
+    _validated_directories.add(absolute_directory)
+
+    try:
+        modification_time = os.stat(absolute_directory).st_mtime_ns
+    except OSError:
+        if index_entry is not None:
+            del _tree_index[absolute_directory]
+            _tree_index_changed = True
+        return _empty_index_entry
+
+    if (index_entry is not None) and (index_entry[0] == modification_time):
+        return index_entry
+
+    subdirectory_names = []
+    file_names = []
+    try:
+        with os.scandir(absolute_directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks = False):
+                    subdirectory_names.append(entry.name)
+                elif entry.is_file():
+                    file_names.append(entry.name)
+    except OSError:
+        return _empty_index_entry
+
+    subdirectory_names.sort()
+    file_names.sort()
+
+    files_by_extension = {}
+    for file_name in file_names:
+        extension = os.path.splitext(file_name)[1]
+        files_by_extension.setdefault(extension, []).append(file_name)
+
+    # If the directory was modified just now, more changes may follow within the same
+    # tick of its modification time, so make sure it's listed again by the next build
+    if time.time() - (modification_time / 1000000000.0) < _racy_modification_time_window:
+        modification_time = None
+
+    index_entry = (
+        modification_time,
+        tuple(subdirectory_names),
+        tuple(file_names),
+        { extension: tuple(names) for extension, names in files_by_extension.items() }
+    )
+    _tree_index[absolute_directory] = index_entry
+    _tree_index_changed = True
+
+    return index_entry
+
+# ----------------------------------------------------------------------------------------------- #
+
+def load_pickled(path, version):
+    """Loads data persisted between builds by save_pickled()
+
+    @param  path     Path of the file the data was saved to
+    @param  version  Version of the data's format the caller understands
+    @returns The data or None if there is none, it is damaged or has another version"""
+
+    try:
+        with open(path, 'rb') as pickled_file:
+            pickled_version, data = pickle.load(pickled_file)
+    except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError):
+        return None
+
+    if pickled_version != version:
+        return None
+
+    return data
+
+# ----------------------------------------------------------------------------------------------- #
+
+def save_pickled(path, version, data):
+    """Persists data between builds so load_pickled() can read it in later builds
+
+    @param  path     Path of the file the data will be saved to
+    @param  version  Version of the data's format
+    @param  data     Data that will be saved"""
+
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory, exist_ok = True)
+
+    # Write to a temporary file first so concurrent builds never see a partial file
+    temporary_path = path + '.' + str(os.getpid())
+    with open(temporary_path, 'wb') as pickled_file:
+        pickle.dump((version, data), pickled_file, pickle.HIGHEST_PROTOCOL)
+
+    os.replace(temporary_path, path)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def get_file_key(file_status):
+    """Forms the key under which the digest of a file's current contents is cached
+
+    @param  file_status  Status of the file as returned by os.stat()
+    @returns A (size, modification time, inode) tuple that changes when the file changes"""
+
+    return (file_status.st_size, file_status.st_mtime_ns, file_status.st_ino)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def get_or_calculate_file_digest(
+    path, file_status, load_cached_digest, store_digest, calculate_digest
+):
+    """Takes a file's digest from a cache or calculates it if the file changed
+
+    @param  path                Absolute path of the file whose digest will be returned
+    @param  file_status         Status of the file as returned by os.stat()
+    @param  load_cached_digest  Called with the path and file key, returns the digest
+                                cached for the file or None if there is none
+    @param  store_digest        Called with the path, file key and digest to cache a digest
+    @param  calculate_digest    Called with the path and file size to calculate the digest
+    @returns The digest of the file's contents"""
+
+    file_key = get_file_key(file_status)
+
+    cached_digest = load_cached_digest(path, file_key)
+    if cached_digest is not None:
+        return cached_digest
+
+    hash_start_time = time.time()
+    digest = calculate_digest(path, file_status.st_size)
+
+    # A file modified right before or while it was hashed might be modified again
+    # without its modification time changing, so its digest isn't kept
+    if file_status.st_mtime < hash_start_time - _minimum_digest_age:
+        store_digest(path, file_key, digest)
+
+    return digest
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _load_tree_index():
+    """Loads the tree index persisted by an earlier build
+
+    @returns The tree index or an empty dictionary if there is none"""
+
+    if _tree_index_path is None:
+        return {}
+
+    tree_index = load_pickled(_tree_index_path, _tree_index_version)
+    if tree_index is None:
+        return {}
+
+    return tree_index
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _save_tree_index():
+    """Persists the tree index if it was changed during the build"""
+
+    if not _tree_index_changed:
+        return
+
+    save_pickled(_tree_index_path, _tree_index_version, _tree_index)
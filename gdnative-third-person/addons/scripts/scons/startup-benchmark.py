@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+
+# Purpose:
+#   Measures how long SCons takes to read the build scripts of a game
+#
+#   A throwaway project is generated with the requested numbers of asset
+#   directories, each with its own SConstruct setting up a Blender environment
+#   like the ones in the Game directory. The root SConstruct collects them with
+#   nuclex.build_all(). SCons is then run as a dry run and the time it spent
+#   executing the build scripts is reported.
+#
+#   The asset build scripts declare a plain copy instead of an export, so the
+#   benchmark runs on machines without Blender.
+#
+# Usage:
+#   Invoke this script with the system's Python interpreter:
+#
+#   python startup-benchmark.py
+#
+#   - --directories=COUNTS sets the comma-separated numbers of asset directories
+#     to measure (default: 1,100,1000)
+#
+#   - --repetitions=COUNT sets how often each measurement is repeated, the fastest
+#     run is reported (default: 3)
+#
+#   SCons is looked up in the search path. If it's not there, it is run
+#   as a module of the Python interpreter running this script.
+#
+import sys
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+
+# ----------------------------------------------------------------------------------------------- #
+
+# Root build script of the generated project
+_root_build_script = r'''#!/usr/bin/env python
+
+import sys
+import importlib
+
+sys.path.append(%(scons_directory)r)
+nuclex = importlib.import_module('nuclex')
+
+environment = nuclex.create_generic_environment()
+nuclex.build_all(environment, 'Game')
+'''
+
+# Build script placed in each generated asset directory
+_asset_build_script = r'''#!/usr/bin/env python
+
+import sys
+import importlib
+
+sys.path.append(%(scons_directory)r)
+nuclex = importlib.import_module('nuclex')
+
+environment = nuclex.create_blender_environment()
+
+environment.Command(
+    source = './Models/Asset.blend',
+    action = Copy('$TARGET', '$SOURCE'),
+    target = './Models/Asset.dae'
+)
+'''
+
+# Matches the time SCons reports for executing the build scripts (--debug=time)
+_sconscript_time_regex = re.compile(r'Total SConscript file execution time: ([0-9.]+) seconds')
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _generate_project(project_directory, asset_directory_count):
+    """Writes a project with the specified number of asset directories
+
+    @param  project_directory      Directory in which the project will be generated
+    @param  asset_directory_count  Number of asset directories the project will have"""
+
+    scons_directory = os.path.dirname(os.path.abspath(__file__))
+
+    with open(os.path.join(project_directory, 'SConstruct'), 'w') as build_script_file:
+        build_script_file.write(_root_build_script % { 'scons_directory': scons_directory })
+
+    for index in range(asset_directory_count):
+        models_directory = os.path.join(
+            project_directory, 'Game', 'Asset%04d' % index, 'Models'
+        )
+        os.makedirs(models_directory)
+
+        build_script_path = os.path.join(os.path.dirname(models_directory), 'SConstruct')
+        with open(build_script_path, 'w') as build_script_file:
+            build_script_file.write(_asset_build_script % { 'scons_directory': scons_directory })
+
+        # SCons only needs the file to exist since nothing is copied in a dry run
+        with open(os.path.join(models_directory, 'Asset.blend'), 'wb'):
+            pass
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _measure_startup(project_directory, scons_command):
+    """Runs a dry build of the project and measures how long reading it took
+
+    @param  project_directory  Directory containing the generated project
+    @param  scons_command      Command line that starts SCons
+    @returns A tuple of the seconds SCons spent executing build scripts and
+             the seconds until SCons exited"""
+
+    start_time = time.perf_counter()
+    scons_process = subprocess.Popen(
+        scons_command + [ '-Q', '-n', '--debug=time' ],
+        cwd = project_directory,
+        stdout = subprocess.PIPE,
+        stderr = subprocess.STDOUT,
+        universal_newlines = True
+    )
+    output, errors = scons_process.communicate()
+    total_time = time.perf_counter() - start_time
+
+    sconscript_time = _sconscript_time_regex.search(output)
+    if (scons_process.returncode != 0) or (sconscript_time is None):
+        raise RuntimeError('SCons failed to read the generated project:\n' + output)
+
+    return (float(sconscript_time.group(1)), total_time)
+
+# ----------------------------------------------------------------------------------------------- #
+
+def _main():
+    """Generates the projects, measures them and prints the results"""
+
+    asset_directory_counts = [ 1, 100, 1000 ]
+    repetitions = 3
+
+    for argument in sys.argv[1:]:
+        name, separator, value = argument.partition('=')
+        if name == '--directories':
+            asset_directory_counts = [ int(count) for count in value.split(',') ]
+        elif name == '--repetitions':
+            repetitions = int(value)
+        else:
+            sys.stderr.write('Unknown argument: ' + argument + '\n')
+            return 1
+
+    scons_path = shutil.which('scons')
+    if scons_path is None:
+        scons_command = [ sys.executable, '-m', 'SCons' ]
+    else:
+        scons_command = [ scons_path ]
+
+    print('Asset directories  Reading build scripts  Per directory  SCons run (total)')
+    for asset_directory_count in asset_directory_counts:
+        project_directory = tempfile.mkdtemp(prefix = 'nuclex-startup-benchmark-')
+        try:
+            _generate_project(project_directory, asset_directory_count)
+
+            measurements = [
+                _measure_startup(project_directory, scons_command)
+                for repetition in range(repetitions)
+            ]
+            sconscript_time, total_time = min(measurements)
+        finally:
+            shutil.rmtree(project_directory, ignore_errors = True)
+
+        print(
+            '%17d  %19.3fs  %11.2fms  %16.3fs' % (
+                asset_directory_count,
+                sconscript_time,
+                sconscript_time * 1000.0 / asset_directory_count,
+                total_time
+            )
+        )
+        sys.stdout.flush()
+
+    return 0
+
+# ----------------------------------------------------------------------------------------------- #
+
+if __name__ == '__main__':
+    sys.exit(_main())